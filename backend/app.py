@@ -1,18 +1,35 @@
-from flask import Flask, jsonify, send_from_directory, request
-from utils.agent import run_agent, mcp_server_manager
-from utils.uagents.interaction_analyzer import ActionAnalyzer
-from utils.uagents.link_grabber import LinkGrabber
-from utils.uagents.site_tester import SiteTester
+from flask import Flask, Response, g, jsonify, send_from_directory, request
+from utils.crawler import Crawler
+from utils.dispatch import (
+    call_agent,
+    prewarm_local_agents,
+    readiness,
+    register_local_agent,
+    stop_local_agents,
+)
+from utils.fanout import (
+    analyze_pages,
+    iter_fan_out,
+    DEFAULT_CONCURRENCY,
+    DEFAULT_PAGE_TIMEOUT,
+)
+from utils.main_loop import set_main_loop
 from utils.video_streaming import (
-    start_xvfb,
-    start_ffmpeg_recording,
-    stop_xvfb,
-    stop_ffmpeg_recording,
-    clean_ffmpeg_stream,
+    RecordingManager,
+    CAPTURE_PROFILES,
+    DEFAULT_CAPTURE_PROFILE,
+    LATENCY_MODES,
 )
-import requests, os
+from utils.streaming import StreamingRoutes
+from utils.events import events, format_sse, RUN_FINISHED
+from utils.jobs import JobQueue, CANCELLED
+from utils.telemetry import Span, http_request_seconds, metrics, recorder
+from utils.dedup import dedupe_analyses
+from utils.storage import APP_ROOT, app_path
+import os, json
 from dotenv import load_dotenv, find_dotenv
 import asyncio
+from contextlib import aclosing
 from hypercorn.config import Config
 from hypercorn.asyncio import serve
 import signal
@@ -27,31 +44,108 @@ load_dotenv(find_dotenv())
 # Create a Flask application instance
 app = Flask(__name__)
 
+CORS_ALLOW_HEADERS = ["Content-Type", "Authorization"]
+
 CORS(
     app,
     resources={
         r"/*": {
             "origins": ["*"],  # Add your frontend origins
             "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-            "allow_headers": ["Content-Type", "Authorization"],
+            "allow_headers": CORS_ALLOW_HEADERS,
         }
     },
 )
 
-# Global recording state
-recording_state = {
-    "is_recording": False,
-    "xvfb_process": None,
-    "ffmpeg_process": None,
-    "session_id": None,
-    "output_dir": None,
-    "current_output_file": None,
-    "start_time": None,
+# Long-lived streamed responses, served on the event loop instead of Flask's
+# worker threads so they end as soon as their client goes away
+streaming = StreamingRoutes(app, allow_headers=CORS_ALLOW_HEADERS)
+
+# Registry of recording sessions, one Xvfb display + ffmpeg per session
+recordings = RecordingManager()
+
+# Background crawl and test jobs, persisted so they survive restarts
+jobs = JobQueue()
+
+# Recordings are saved here, one directory per session, and served by video_server.py
+VIDEOS_DIR = app_path("videos")
+
+# Upper bound on the number of linked pages analyzed per crawl
+MAX_ANALYZED_PAGES = int(os.getenv("MAX_ANALYZED_PAGES", "50"))
+
+# Default number of tests a batch runs in parallel
+DEFAULT_TEST_WORKERS = int(os.getenv("TEST_WORKERS", "3"))
+DEFAULT_TEST_TIMEOUT = float(os.getenv("TEST_TIMEOUT", "600"))
+
+TEST_FIELDS = ("page_url", "interaction_description", "expected_result")
+
+# Per-run agent settings clients may set, passed through to the agents
+AGENT_OPTION_FIELDS = ("mode", "max_steps", "max_seconds", "max_tokens", "replay")
+AGENT_MODES = ("snapshot", "vision")
+# Crawl requests name the analyzer's settings in camelCase, and can't set `replay`
+CRAWL_AGENT_OPTION_KEYS = {
+    "mode": "mode",
+    "max_steps": "maxSteps",
+    "max_seconds": "maxSeconds",
+    "max_tokens": "maxTokens",
 }
 
-# Create videos directory if it doesn't exist
-VIDEOS_DIR = Path("./videos")
-VIDEOS_DIR.mkdir(exist_ok=True)
+# Numeric fields of request bodies, with the type each is read as
+AGENT_NUMBER_FIELDS = {"max_steps": int, "max_seconds": float, "max_tokens": int}
+TEST_NUMBER_FIELDS = {"testTimeout": float, **AGENT_NUMBER_FIELDS}
+BATCH_NUMBER_FIELDS = {"workers": int, **TEST_NUMBER_FIELDS}
+CRAWL_NUMBER_FIELDS = {
+    "maxPages": int,
+    "maxDepth": int,
+    "concurrency": int,
+    "pageTimeout": float,
+    "maxSteps": int,
+    "maxSeconds": float,
+    "maxTokens": int,
+}
+
+# Crawl defaults, overridable per request
+DEFAULT_CRAWL_DEPTH = int(os.getenv("CRAWL_MAX_DEPTH", "1"))
+CRAWL_PER_HOST_CONCURRENCY = int(os.getenv("CRAWL_PER_HOST_CONCURRENCY", "2"))
+CRAWL_REQUESTS_PER_SECOND = float(os.getenv("CRAWL_REQUESTS_PER_SECOND", "4"))
+# Drop tests of the shared layout repeated across pages, see utils/dedup.py
+DEDUPE_TESTS = os.getenv("DEDUPE_TESTS", "1") == "1"
+
+# Idle event streams get a comment this often so proxies don't close them
+SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+# Event streams are closed after this long, clients reconnect with Last-Event-ID
+SSE_MAX_SECONDS = float(os.getenv("SSE_MAX_SECONDS", "3600"))
+
+
+@app.before_request
+def start_request_span():
+    """Trace every request, its agent calls and LLM calls become child spans."""
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    g.request_span = Span("http.request", method=request.method, route=route)
+    g.request_span.__enter__()
+
+
+@app.after_request
+def record_response_status(response):
+    g.response_status = response.status_code
+    return response
+
+
+@app.teardown_request
+def end_request_span(error=None):
+    span = g.pop("request_span", None)
+    if span is None:
+        return
+
+    status = g.pop("response_status", 500)
+    span.set(status=status)
+    span.__exit__(type(error) if error else None, error, None)
+    http_request_seconds.observe(
+        span.duration,
+        method=span.attributes["method"],
+        route=span.attributes["route"],
+        status=status,
+    )
 
 
 # Route for the home page
@@ -60,64 +154,168 @@ def home():
     return "Hello World! Welcome to my Flask server."
 
 
+def crawl_request_error(data):
+    """Return why a crawl request body is invalid, or None if it is valid."""
+    if not data:
+        return "Missing JSON body in request"
+
+    # Validate targetUrl parameter
+    target_url = data.get("targetUrl")
+    if not target_url:
+        return "Missing required parameter 'targetUrl' in request body"
+
+    # Basic URL format validation
+    if not target_url.startswith(("http://", "https://")):
+        return "Invalid URL format. URL must start with http:// or https://"
+
+    return options_error(data, CRAWL_NUMBER_FIELDS)
+
+
+def options_error(data, number_fields):
+    """Return why the numeric fields or agent mode of a request body are invalid, or None."""
+    for key, cast in number_fields.items():
+        value = data.get(key)
+        if value is None:
+            continue
+        try:
+            valid = not isinstance(value, bool) and cast(value) >= 0
+        except (TypeError, ValueError, OverflowError):
+            valid = False
+        if not valid:
+            return f"Invalid '{key}': expected a non-negative number"
+
+    mode = data.get("mode")
+    if mode is not None and mode not in AGENT_MODES:
+        return f"Invalid 'mode': expected one of {list(AGENT_MODES)}"
+
+    return None
+
+
+def crawl_options(data):
+    """Crawl and analysis settings of a request, falling back to the server defaults."""
+    return {
+        "target_url": data["targetUrl"],
+        "max_pages": int(data.get("maxPages", MAX_ANALYZED_PAGES)),
+        "max_depth": int(data.get("maxDepth", DEFAULT_CRAWL_DEPTH)),
+        "concurrency": int(data.get("concurrency", DEFAULT_CONCURRENCY)),
+        "page_timeout": float(data.get("pageTimeout", DEFAULT_PAGE_TIMEOUT)),
+        "dedupe": bool(data.get("dedupe", DEDUPE_TESTS)),
+        # Execution mode and limits for each page's analysis run
+        "agent_options": {
+            field: data[key]
+            for field, key in CRAWL_AGENT_OPTION_KEYS.items()
+            if data.get(key) is not None
+        },
+    }
+
+
+def agent_options(data):
+    return {
+        field: data[field]
+        for field in AGENT_OPTION_FIELDS
+        if data.get(field) is not None
+    }
+
+
+def build_crawler(options, run_id=None, state=None):
+    return Crawler(
+        options["target_url"],
+        max_depth=options["max_depth"],
+        max_pages=options["max_pages"],
+        per_host_concurrency=CRAWL_PER_HOST_CONCURRENCY,
+        requests_per_second=CRAWL_REQUESTS_PER_SECOND,
+        on_page=lambda url, depth: events.publish(
+            run_id, "page.discovered", page_url=url, depth=depth
+        ),
+        state=state,
+    )
+
+
+async def grab_links_with_llm(options, run_id=None):
+    """Pages rendered client-side have no links in their HTML, ask the LLM instead."""
+    link_grab = await call_agent(
+        "link_grabber",
+        {"start_page": options["target_url"], "use_llm": True},
+        timeout=options["page_timeout"],
+    )
+
+    related_urls = link_grab.get("linked_pages", [])[: options["max_pages"]]
+    for url in related_urls:
+        events.publish(run_id, "page.discovered", page_url=url, depth=1)
+    return related_urls
+
+
 @app.post("/crawl-and-get-tests")
 async def crawl():
+    run_id = None
+
     try:
         # Get JSON data from request
         data = request.get_json()
 
-        # Check if request has JSON data
-        if not data:
-            return jsonify({"error": "Missing JSON body in request"}), 400
+        error = crawl_request_error(data)
+        if error:
+            return jsonify({"error": error}), 400
 
-        # Validate targetUrl parameter
-        target_url = data.get("targetUrl")
-        if not target_url:
-            return (
-                jsonify(
-                    {"error": "Missing required parameter 'targetUrl' in request body"}
-                ),
-                400,
-            )
+        # Optional tuning of the crawl and analysis stages
+        options = crawl_options(data)
 
-        # Basic URL format validation
-        if not target_url.startswith(("http://", "https://")):
-            return (
-                jsonify(
-                    {
-                        "error": "Invalid URL format. URL must start with http:// or https://"
-                    }
-                ),
-                400,
-            )
+        # Progress is published to /events/<runId> while the request runs
+        run_id = data.get("runId")
+        events.start(run_id)
+        events.publish(run_id, "crawl.started", target_url=options["target_url"])
 
-        # get the related URLs
-        related_urls = requests.post(
-            url=os.getenv("LINK_GRABBER"), json={"start_page": target_url}
-        )
+        # map the site
+        related_urls = await build_crawler(options, run_id).crawl()
 
-        # just test with the first 5
-        related_urls = related_urls.json().get("linked_pages", [])[:2]
+        if len(related_urls) <= 1:
+            related_urls = await grab_links_with_llm(options, run_id)
 
         print(related_urls)
 
-        page_analyes = []
-        for url in related_urls:
-            page_interactions = requests.post(
-                url=os.getenv("INTERACTION_ANALYZER"), json={"target_page": url}
-            )
-            print(page_interactions.json())
-            page_analyes.append(page_interactions.json())
+        # analyze every page concurrently, keeping whatever finishes in time
+        page_analyses = await analyze_pages(
+            related_urls,
+            concurrency=options["concurrency"],
+            timeout=options["page_timeout"],
+            run_id=run_id,
+            agent_options=options["agent_options"],
+        )
+
+        if options["dedupe"]:
+            page_analyses = dedupe_analyses(page_analyses)
 
-        return jsonify(page_analyes)
+        events.finish(run_id, success=True, pages=len(page_analyses))
+        return jsonify(page_analyses)
 
     except Exception as e:
+        events.finish(run_id, success=False, error=str(e))
         return jsonify({"error": f"An error occurred: {str(e)}"}), 500
 
 
+def resolve_recording(session_id):
+    """
+    Find the recording a request refers to.
+
+    Requests that don't name a session fall back to the only active recording, so
+    single-session clients keep working without passing session IDs around.
+    """
+    if session_id:
+        recording = recordings.get(session_id)
+    elif len(recordings.sessions) == 1:
+        recording = next(iter(recordings.sessions.values()))
+    else:
+        recording = None
+
+    if recording is not None:
+        recordings.touch(recording)
+    return recording
+
+
 @app.post("/test-interaction")
 async def test_interaction():
-    global recording_state
+    recording = None
+    run_id = None
 
     try:
         # Get JSON data from request
@@ -131,79 +329,84 @@ async def test_interaction():
         command = data.get("command", "").lower()
 
         if command == "start":
-            # Start a new recording session if not already recording
-            if recording_state["is_recording"]:
-                return jsonify(
-                    {
-                        "success": False,
-                        "message": "Recording already in progress",
-                        "session_id": recording_state["session_id"],
-                    }
+            profile = data.get("profile", DEFAULT_CAPTURE_PROFILE)
+            if profile not in CAPTURE_PROFILES:
+                return (
+                    jsonify(
+                        {
+                            "error": f"Unknown capture profile '{profile}', expected one of {list(CAPTURE_PROFILES)}"
+                        }
+                    ),
+                    400,
+                )
+
+            latency_mode = data.get("latency_mode", "standard")
+            if latency_mode not in LATENCY_MODES:
+                return (
+                    jsonify(
+                        {
+                            "error": f"Unknown latency mode '{latency_mode}', expected one of {list(LATENCY_MODES)}"
+                        }
+                    ),
+                    400,
                 )
 
             # Generate session ID and create output directory
             session_id = str(uuid.uuid4())
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             output_dir = VIDEOS_DIR / f"session_{timestamp}_{session_id[:8]}"
-            output_dir.mkdir(exist_ok=True)
-
-            # Start xvfb
-            xvfb_process = start_xvfb()
+            output_dir.mkdir(parents=True, exist_ok=True)
 
-            # Start ffmpeg recording
+            # Start xvfb and ffmpeg on a display of its own. One encode feeds both
+            # the live stream and a full archive of the session
             output_file = output_dir / "recording.mp4"
-            ffmpeg_process = start_ffmpeg_recording(str(output_file))
-
-            # Update recording state
-            recording_state = {
-                "is_recording": True,
-                "xvfb_process": xvfb_process,
-                "ffmpeg_process": ffmpeg_process,
-                "session_id": session_id,
-                "output_dir": output_dir,
-                "current_output_file": output_file,
-                "start_time": time.time(),
-            }
+            session, message = await recordings.start_session(
+                session_id,
+                output_file,
+                profile=profile,
+                latency_mode=latency_mode,
+                archive_path=output_dir / "archive.mp4",
+            )
+
+            if session is None:
+                return jsonify({"success": False, "message": message})
+
+            session.output_dir = output_dir
 
             return jsonify(
                 {
                     "success": True,
                     "message": "Recording started",
                     "session_id": session_id,
+                    "display": session.display,
+                    "profile": profile,
+                    "latency_mode": latency_mode,
+                    # Path of the live playlist, relative to the video server root
+                    "stream_path": Path(session.playlist_path).relative_to(APP_ROOT).as_posix(),
+                    "archive_path": Path(session.archive_path).relative_to(APP_ROOT).as_posix(),
                 }
             )
 
         elif command == "stop":
-            # Stop the current recording session
-            if not recording_state["is_recording"]:
+            # Stop the requested (or only) recording session
+            recording = resolve_recording(data.get("session_id"))
+            if recording is None:
                 return jsonify(
                     {"success": False, "message": "No recording in progress"}
                 )
 
-            # Stop recording processes
-            stop_ffmpeg_recording()
-            stop_xvfb()
-            clean_ffmpeg_stream()
+            await recordings.stop_session(recording.session_id)
 
             # Calculate recording duration
-            duration = time.time() - recording_state["start_time"]
+            duration = time.time() - recording.start_time
 
-            # Get session info before resetting
             session_info = {
-                "session_id": recording_state["session_id"],
-                "output_file": str(recording_state["current_output_file"]),
+                "session_id": recording.session_id,
+                "output_file": recording.stream_dir,
+                "archive_file": recording.archive_path,
                 "duration": duration,
-            }
-
-            # Reset recording state
-            recording_state = {
-                "is_recording": False,
-                "xvfb_process": None,
-                "ffmpeg_process": None,
-                "session_id": None,
-                "output_dir": None,
-                "current_output_file": None,
-                "start_time": None,
+                "profile": recording.profile,
+                "encoder_cpu": recording.final_encoder_cpu,
             }
 
             return jsonify(
@@ -215,19 +418,30 @@ async def test_interaction():
             )
 
         elif command == "status":
-            # Return current recording status
-            if recording_state["is_recording"]:
-                duration = time.time() - recording_state["start_time"]
+            # Return the status of one recording, or of all of them
+            if data.get("session_id"):
+                recording = recordings.get(data.get("session_id"))
+                if recording is None:
+                    return jsonify({"is_recording": False})
                 return jsonify(
                     {
-                        "is_recording": True,
-                        "session_id": recording_state["session_id"],
-                        "duration": duration,
-                        "output_file": str(recording_state["current_output_file"]),
+                        "is_recording": recording.is_recording,
+                        "session_id": recording.session_id,
+                        "duration": time.time() - recording.start_time,
+                        "output_file": recording.stream_dir,
+                        "profile": recording.profile,
+                        "encoder_cpu": recording.encoder_cpu(),
                     }
                 )
-            else:
-                return jsonify({"is_recording": False})
+
+            return jsonify(
+                {
+                    "is_recording": bool(recordings.sessions),
+                    "sessions": [
+                        session.info() for session in recordings.sessions.values()
+                    ],
+                }
+            )
 
         # If no command is specified, handle as a regular test interaction
         if (
@@ -244,57 +458,473 @@ async def test_interaction():
                 400,
             )
 
+        error = options_error(data, TEST_NUMBER_FIELDS)
+        if error:
+            return jsonify({"error": error}), 400
+
+        # Run the test on the recording's display so it gets captured
+        recording = resolve_recording(data.get("session_id"))
+
+        # Progress is published to /events/<run_id> while the test runs
+        run_id = data.get("run_id")
+        events.start(run_id)
+        events.publish(run_id, "test.started", page_url=data.get("page_url"))
+
         # Execute the test interaction - if we're recording, it will be captured
-        result = requests.post(
-            os.getenv("SITE_TESTER"),
-            json={
+        response_data = await call_agent(
+            "site_tester",
+            {
                 "page_url": data.get("page_url"),
                 "interaction_description": data.get("interaction_description"),
                 "expected_result": data.get("expected_result"),
+                "display": recording.display if recording else None,
+                "run_id": run_id,
+                **agent_options(data),
             },
+            timeout=float(data.get("testTimeout", DEFAULT_TEST_TIMEOUT)),
         )
 
         # Return test results along with recording info if applicable
-        response_data = result.json()
-        if recording_state["is_recording"]:
+        events.publish(run_id, "test.finished", result=response_data)
+        events.finish(run_id, success=True)
+        if recording is not None:
             response_data["recording"] = {
-                "is_recording": True,
-                "session_id": recording_state["session_id"],
+                "is_recording": recording.is_recording,
+                "session_id": recording.session_id,
             }
 
         return jsonify(response_data)
 
     except Exception as e:
-        # Ensure processes are cleaned up on error
-        if recording_state["is_recording"]:
+        events.finish(run_id, success=False, error=str(e))
+
+        # Ensure the recording tied to this request is cleaned up on error
+        if recording is not None:
             try:
-                if recording_state["ffmpeg_process"]:
-                    stop_ffmpeg_recording(recording_state["ffmpeg_process"])
-                if recording_state["xvfb_process"]:
-                    stop_xvfb(recording_state["xvfb_process"])
-                clean_ffmpeg_stream()
+                await recordings.stop_session(recording.session_id)
             except Exception as cleanup_error:
                 print(f"Error during cleanup: {cleanup_error}")
 
-            # Reset recording state on error
-            recording_state = {
-                "is_recording": False,
-                "xvfb_process": None,
-                "ffmpeg_process": None,
-                "session_id": None,
-                "output_dir": None,
-                "current_output_file": None,
-                "start_time": None,
-            }
-
         return (
             jsonify({"success": False, "error": f"Test execution failed: {str(e)}"}),
             500,
         )
 
 
+def tests_request_error(data):
+    """Return why a batch request body is invalid, or None if it is valid."""
+    if not data or not isinstance(data.get("tests"), list) or not data["tests"]:
+        return "Missing required field: tests: list"
+
+    for index, test in enumerate(data["tests"]):
+        if not isinstance(test, dict) or not all(test.get(f) for f in TEST_FIELDS):
+            return f"Test {index} is missing required fields: page_url: str, interaction_description: str, expected_result: str"
+        error = options_error(test, AGENT_NUMBER_FIELDS)
+        if error:
+            return f"Test {index}: {error}"
+
+    return options_error(data, BATCH_NUMBER_FIELDS)
+
+
+async def iter_test_results(
+    tests, indexes, display, run_id, workers, timeout, defaults=None
+):
+    """
+    Run `tests[i]` for every i in `indexes` across parallel tester workers.
+
+    Yields one result line per test as it finishes, holding either the tester's
+    `result` or an `error`. `defaults` holds the agent mode and limits for every
+    test, which a test's own fields override.
+    """
+    payloads = [
+        {
+            **{field: tests[index][field] for field in TEST_FIELDS},
+            "display": display,
+            "run_id": run_id,
+            "test_id": tests[index].get("id"),
+            **(defaults or {}),
+            **agent_options(tests[index]),
+        }
+        for index in indexes
+    ]
+
+    results = iter_fan_out(
+        "site_tester",
+        payloads,
+        concurrency=workers,
+        timeout=timeout,
+        on_start=lambda position: events.publish(
+            run_id,
+            "test.started",
+            index=indexes[position],
+            test_id=tests[indexes[position]].get("id"),
+            page_url=tests[indexes[position]]["page_url"],
+        ),
+    )
+
+    # Closed along with this generator, which cancels the tests still running
+    async with aclosing(results):
+        async for position, status, value in results:
+            index = indexes[position]
+            line = {"index": index, "id": tests[index].get("id")}
+            if status == "ok":
+                line["result"] = value
+            else:
+                line["error"] = value
+
+            events.publish(
+                run_id,
+                "test.finished",
+                index=index,
+                test_id=line["id"],
+                result=line.get("result"),
+                error=line.get("error"),
+            )
+            yield line
+
+
+def count_result(summary, line):
+    if "result" in line:
+        summary["passed" if line["result"].get("test_passed") else "failed"] += 1
+    else:
+        summary["errors"] += 1
+
+
+@streaming.route(
+    "/test-interactions/batch", methods=["POST"], mimetype="application/x-ndjson"
+)
+async def test_interactions_batch(request):
+    """
+    Run a list of test interactions across parallel tester workers.
+
+    Results are streamed back as newline-delimited JSON, one line per test in the
+    order they finish, followed by a summary line. Tests still running when the
+    client disconnects are cancelled.
+    """
+    data = request.get_json(silent=True)
+    error = tests_request_error(data)
+    if error:
+        return {"error": error}, 400
+
+    tests = data["tests"]
+    workers = int(data.get("workers", DEFAULT_TEST_WORKERS))
+    test_timeout = float(data.get("testTimeout", DEFAULT_TEST_TIMEOUT))
+    recording = resolve_recording(data.get("session_id"))
+    display = recording.display if recording else None
+    run_id = data.get("run_id")
+    events.start(run_id)
+
+    async def generate():
+        summary = {"done": True, "passed": 0, "failed": 0, "errors": 0}
+        results = iter_test_results(
+            tests,
+            range(len(tests)),
+            display,
+            run_id,
+            workers,
+            test_timeout,
+            defaults=agent_options(data),
+        )
+
+        try:
+            async for line in results:
+                count_result(summary, line)
+                yield json.dumps(line) + "\n"
+
+            yield json.dumps(summary) + "\n"
+        finally:
+            # Cancels the tests still running
+            await results.aclose()
+            events.finish(run_id, **summary)
+
+    return generate()
+
+
+async def run_crawl_job(job):
+    """
+    Crawl and analyze a site in the background.
+
+    The checkpoint holds the crawler's state until the crawl is done, then the page
+    list and every successful analysis, so a resumed job only redoes what's missing.
+    """
+    options = crawl_options(job.payload)
+    checkpoint = job.checkpoint or {}
+
+    if "pages" not in checkpoint:
+        events.publish(job.id, "crawl.started", target_url=options["target_url"])
+        crawler = build_crawler(options, job.id, state=checkpoint.get("crawler"))
+        async with job.checkpointing(
+            lambda: ({"crawler": crawler.state()}, {"pages_found": len(crawler.pages)})
+        ):
+            related_urls = await crawler.crawl()
+
+        if len(related_urls) <= 1:
+            related_urls = await grab_links_with_llm(options, job.id)
+
+        checkpoint = {"pages": related_urls, "analyses": {}}
+        job.save_checkpoint(
+            checkpoint, {"pages_found": len(related_urls), "pages_analyzed": 0}
+        )
+
+    analyses = checkpoint["analyses"]
+
+    def save_analysis(page_url, analysis):
+        # Failed pages aren't saved, so they are retried if the job is resumed
+        if "error" not in analysis:
+            analyses[page_url] = analysis
+            job.save_checkpoint(
+                checkpoint,
+                {
+                    "pages_found": len(checkpoint["pages"]),
+                    "pages_analyzed": len(analyses),
+                },
+            )
+
+    remaining = [url for url in checkpoint["pages"] if url not in analyses]
+    failed = await analyze_pages(
+        remaining,
+        concurrency=options["concurrency"],
+        timeout=options["page_timeout"],
+        run_id=job.id,
+        on_result=save_analysis,
+        agent_options=options["agent_options"],
+    )
+    failed = dict(zip(remaining, failed))
+
+    page_analyses = [analyses.get(url) or failed[url] for url in checkpoint["pages"]]
+    return dedupe_analyses(page_analyses) if options["dedupe"] else page_analyses
+
+
+def job_display(payload):
+    """Display of the recording a test job was submitted against, if it is still running."""
+    recording = recordings.get(payload.get("session_id") or "")
+    if recording is None:
+        return None
+    recordings.touch(recording)
+    return recording.display
+
+
+async def run_test_job(job):
+    events.publish(job.id, "test.started", page_url=job.payload["page_url"])
+
+    result = await call_agent(
+        "site_tester",
+        {
+            **{field: job.payload[field] for field in TEST_FIELDS},
+            "display": job_display(job.payload),
+            "run_id": job.id,
+            **agent_options(job.payload),
+        },
+        timeout=float(job.payload.get("testTimeout", DEFAULT_TEST_TIMEOUT)),
+    )
+
+    events.publish(job.id, "test.finished", result=result)
+    return result
+
+
+async def run_test_batch_job(job):
+    """Run a batch of tests in the background. Tests that passed or failed aren't rerun on resume."""
+    tests = job.payload["tests"]
+    finished = (job.checkpoint or {}).get("results", {})
+    remaining = [index for index in range(len(tests)) if str(index) not in finished]
+    errors = {}
+
+    async for line in iter_test_results(
+        tests,
+        remaining,
+        job_display(job.payload),
+        job.id,
+        int(job.payload.get("workers", DEFAULT_TEST_WORKERS)),
+        float(job.payload.get("testTimeout", DEFAULT_TEST_TIMEOUT)),
+        defaults=agent_options(job.payload),
+    ):
+        if "error" in line:
+            errors[line["index"]] = line
+            continue
+        finished[str(line["index"])] = line
+        job.save_checkpoint(
+            {"results": finished}, {"tests": len(tests), "finished": len(finished)}
+        )
+
+    results = [finished.get(str(index)) or errors[index] for index in range(len(tests))]
+    summary = {"passed": 0, "failed": 0, "errors": 0}
+    for line in results:
+        count_result(summary, line)
+
+    return {"results": results, "summary": summary}
+
+
+jobs.register("crawl", run_crawl_job)
+jobs.register("test", run_test_job)
+jobs.register("test_batch", run_test_batch_job)
+
+
+def job_summary(job):
+    return {
+        key: job[key]
+        for key in (
+            "id",
+            "kind",
+            "status",
+            "attempts",
+            "progress",
+            "error",
+            "created_at",
+            "started_at",
+            "finished_at",
+        )
+    }
+
+
+@app.post("/jobs")
+def submit_job():
+    """
+    Queue a crawl, test or test batch to run in the background.
+
+    The body names the job `kind` ("crawl", "test" or "test_batch") and carries the
+    same fields as /crawl-and-get-tests, /test-interaction or /test-interactions/batch.
+    Poll /jobs/<job_id> for the result, or follow /events/<job_id> for progress.
+    """
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({"error": "Missing JSON body in request"}), 400
+
+    kind = data.get("kind")
+    if kind == "crawl":
+        error = crawl_request_error(data)
+    elif kind == "test":
+        error = (
+            options_error(data, TEST_NUMBER_FIELDS)
+            if all(data.get(f) for f in TEST_FIELDS)
+            else "Missing required fields: page_url: str, interaction_description: str, expected_result: str"
+        )
+    elif kind == "test_batch":
+        error = tests_request_error(data)
+    else:
+        error = f"Unknown job kind '{kind}', expected one of {list(jobs.handlers)}"
+
+    if error:
+        return jsonify({"error": error}), 400
+
+    payload = {key: value for key, value in data.items() if key != "kind"}
+    if kind in ("test", "test_batch"):
+        # Pin the job to the recording that is active now
+        recording = resolve_recording(data.get("session_id"))
+        payload["session_id"] = recording.session_id if recording else None
+
+    job_id = jobs.submit(kind, payload)
+
+    return (
+        jsonify({"job_id": job_id, "status": "queued", "events": f"/events/{job_id}"}),
+        202,
+    )
+
+
+@app.get("/jobs")
+def list_jobs():
+    limit = request.args.get("limit", default=50, type=int)
+    return jsonify(
+        [job_summary(job) for job in jobs.store.list(request.args.get("status"), limit)]
+    )
+
+
+@app.get("/jobs/<job_id>")
+def get_job(job_id):
+    job = jobs.store.get(job_id)
+    if job is None:
+        return jsonify({"error": f"No job with ID {job_id}"}), 404
+
+    return jsonify({**job_summary(job), "payload": job["payload"], "result": job["result"]})
+
+
+@app.post("/jobs/<job_id>/cancel")
+def cancel_job(job_id):
+    status = jobs.cancel(job_id)
+    if status is None:
+        return jsonify({"error": f"No job with ID {job_id}"}), 404
+    if status != CANCELLED:
+        return jsonify({"error": f"Job already {status}", "status": status}), 409
+
+    return jsonify({"job_id": job_id, "status": status})
+
+
+@streaming.route(
+    "/events/<run_id>",
+    methods=["GET"],
+    mimetype="text/event-stream",
+    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+)
+async def stream_events(request, run_id):
+    """
+    Stream a run's progress events as Server-Sent Events.
+
+    Clients pick a run ID, open this stream, and pass the same ID as `runId` to
+    /crawl-and-get-tests or `run_id` to the test endpoints. Events published before
+    the stream was opened are replayed, and reconnecting clients resume after their
+    Last-Event-ID. The stream ends with a `run.finished` event, or after
+    SSE_MAX_SECONDS.
+    """
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("after")
+    after = int(last_event_id) if last_event_id and last_event_id.isdigit() else None
+    subscriber = events.subscribe(run_id, after=after)
+
+    async def generate():
+        closes_at = time.monotonic() + SSE_MAX_SECONDS
+        try:
+            while time.monotonic() < closes_at:
+                try:
+                    event = await subscriber.get(
+                        timeout=min(SSE_HEARTBEAT_SECONDS, closes_at - time.monotonic())
+                    )
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+
+                yield format_sse(event)
+                if event["type"] == RUN_FINISHED:
+                    return
+        finally:
+            events.unsubscribe(run_id, subscriber)
+
+    return generate()
+
+
+@app.get("/metrics")
+def get_metrics():
+    """Latency histograms, in-flight gauges and token counters for Prometheus."""
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.get("/ready")
+def get_readiness():
+    """
+    Whether the agents started at boot are warm (200) or still starting (503).
+
+    Lists each hosted agent's status (cold, starting, warm or failed) and how
+    long it took to start.
+    """
+    ready, agents = readiness()
+    return jsonify({"ready": ready, "agents": agents}), 200 if ready else 503
+
+
+@app.get("/traces")
+def get_traces():
+    """
+    Recent finished spans of a trace (`?trace_id=`) or run (`?run_id=`), oldest first.
+
+    Without either, the latest spans of any trace are returned.
+    """
+    trace_id = request.args.get("trace_id")
+    run_id = request.args.get("run_id")
+    limit = request.args.get("limit", default=None if trace_id or run_id else 200, type=int)
+    return jsonify({"spans": recorder.find(trace_id, run_id, limit)})
+
+
 @app.route("/test-site")
 async def run_testing_agent():
+    # Imported here, mcp_use and langchain are slow to import
+    from utils.agent import run_agent
+
     result = await run_agent()
 
     if not result.get("success"):
@@ -306,6 +936,8 @@ async def run_testing_agent():
 
 @app.get("/image")
 async def get_associated_screenshot():
+    from utils.agent import mcp_server_manager
+
     result = await mcp_server_manager()
 
     return "NICE"
@@ -319,30 +951,33 @@ def page_not_found(e):
 
 # Graceful shutdown handler
 async def shutdown_handler():
-    global recording_state
-
-    # Clean up recording if in progress
-    if recording_state["is_recording"]:
-        try:
-            if recording_state["ffmpeg_process"]:
-                await stop_ffmpeg_recording(recording_state["ffmpeg_process"])
-            if recording_state["xvfb_process"]:
-                await stop_xvfb(recording_state["xvfb_process"])
-            await clean_ffmpeg_stream()
-        except Exception as e:
-            print(f"Error during shutdown cleanup: {e}")
+    # Clean up any recordings still in progress
+    try:
+        await recordings.stop_all()
+    except Exception as e:
+        print(f"Error during shutdown cleanup: {e}")
 
 
 async def start_services():
-    # Start the HTML Analyzer in the background
-    link_grabber = LinkGrabber()
-    link_grabber_task = asyncio.create_task(link_grabber.agent.run_async())
-
-    action_analyzer = ActionAnalyzer()
-    action_analyzer_task = asyncio.create_task(action_analyzer.agent.run_async())
-
-    site_tester = SiteTester()
-    site_tester_task = asyncio.create_task(site_tester.run_async())
+    # Recording subprocesses and agent sessions live on this loop
+    set_main_loop(asyncio.get_running_loop())
+
+    # Pick up queued jobs, and resume any interrupted by the last shutdown
+    await jobs.start()
+
+    # Stop recordings their clients never stopped
+    reaper_task = asyncio.create_task(recordings.reap_expired())
+
+    # The agents run in this process, and are only built when first called or
+    # prewarmed, so the server is up before their heavy imports and browsers are
+    register_local_agent(
+        "link_grabber", 8002, "utils.uagents.link_grabber", "LinkGrabber"
+    )
+    register_local_agent(
+        "interaction_analyzer", 8003, "utils.uagents.interaction_analyzer", "ActionAnalyzer"
+    )
+    register_local_agent("site_tester", 8004, "utils.uagents.site_tester", "SiteTester")
+    prewarm_task = asyncio.create_task(prewarm_local_agents())
 
     # Start the Flask app with Hypercorn
     config = Config()
@@ -351,23 +986,18 @@ async def start_services():
     config.debug = True
 
     try:
-        await serve(app, config)
+        await serve(streaming, config)
     finally:
+        # Running jobs are requeued and resume on the next start
+        await jobs.stop()
+
         # Clean up recording if server shuts down
+        reaper_task.cancel()
         await shutdown_handler()
 
-        # Ensure analyzer task is cleaned up
-        link_grabber_task.cancel()
-        action_analyzer_task.cancel()
-        site_tester_task.cancel()
-
-        try:
-            await link_grabber_task
-            await action_analyzer_task
-            await site_tester_task
-
-        except asyncio.CancelledError:
-            pass
+        # Ensure the agents are cleaned up
+        prewarm_task.cancel()
+        await stop_local_agents()
 
 
 if __name__ == "__main__":
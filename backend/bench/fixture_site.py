@@ -0,0 +1,84 @@
+"""
+A local copy of the-internet.herokuapp.com pages the agents are tried on.
+
+Pages carry `data-bench-*` attributes describing what their scripts would do, so
+the stand-in MCP server (bench/stub_mcp.py) can play the page without a browser.
+"""
+
+from aiohttp import web
+
+PAGES = {
+    "/": """<html><head><title>The Internet</title></head><body>
+<h1>Welcome to the-internet</h1>
+<h2>Available Examples</h2>
+<ul>
+  <li><a href="/add_remove_elements/">Add/Remove Elements</a></li>
+  <li><a href="/checkboxes">Checkboxes</a></li>
+  <li><a href="/login">Form Authentication</a></li>
+  <li><a href="/status_codes">Status Codes</a></li>
+</ul>
+</body></html>""",
+    "/add_remove_elements/": """<html><head><title>The Internet</title></head><body>
+<h3>Add/Remove Elements</h3>
+<button data-bench-adds="Delete">Add Element</button>
+<div id="elements"></div>
+<a href="/">Home</a>
+</body></html>""",
+    "/checkboxes": """<html><head><title>The Internet</title></head><body>
+<h3>Checkboxes</h3>
+<form id="checkboxes">
+  <input type="checkbox" name="checkbox 1"> checkbox 1
+  <input type="checkbox" name="checkbox 2" checked> checkbox 2
+</form>
+<a href="/">Home</a>
+</body></html>""",
+    "/login": """<html><head><title>The Internet</title></head><body>
+<h2>Login Page</h2>
+<p>Enter tomsmith for the username and SuperSecretPassword! for the password.</p>
+<form action="/secure">
+  <input type="text" name="username" placeholder="Username">
+  <input type="password" name="password" placeholder="Password">
+  <button type="submit">Login</button>
+</form>
+<a href="/">Home</a>
+</body></html>""",
+    "/secure": """<html><head><title>The Internet</title></head><body>
+<p id="flash">You logged into a secure area!</p>
+<h2>Secure Area</h2>
+<a href="/login">Logout</a>
+</body></html>""",
+    "/status_codes": """<html><head><title>The Internet</title></head><body>
+<h3>Status Codes</h3>
+<ul>
+  <li><a href="/status_codes/200">200</a></li>
+  <li><a href="/status_codes/404">404</a></li>
+</ul>
+<a href="/">Home</a>
+</body></html>""",
+    "/status_codes/200": """<html><head><title>The Internet</title></head><body>
+<h3>Status Codes</h3><p>This page returned a 200 status code.</p>
+<a href="/status_codes">here</a>
+</body></html>""",
+    "/status_codes/404": """<html><head><title>The Internet</title></head><body>
+<h3>Status Codes</h3><p>This page returned a 404 status code.</p>
+<a href="/status_codes">here</a>
+</body></html>""",
+}
+
+
+async def serve_page(request):
+    page = PAGES.get(request.path)
+    if page is None:
+        return web.Response(status=404, text="Not Found")
+    status = 404 if request.path.endswith("/404") else 200
+    return web.Response(status=status, text=page, content_type="text/html")
+
+
+def create_app():
+    app = web.Application()
+    app.router.add_get("/{path:.*}", serve_page)
+    return app
+
+
+if __name__ == "__main__":
+    web.run_app(create_app(), port=8765)
@@ -0,0 +1,403 @@
+"""
+Offline throughput benchmark of the crawl and test endpoints.
+
+Starts the fixture site and the scripted LLM (bench/stub_llm.py), then the real
+app and agents, with Playwright MCP swapped for bench/stub_mcp.py. Nothing
+leaves the machine. Each scenario is driven at the given concurrency and
+reported as latency percentiles, throughput, and the p50/p95 of every traced
+stage (see /traces). The CPU time and peak RSS of the app's process tree are
+reported per stage of the run: server start, agent warm-up, then each scenario.
+
+Run from backend/ (Linux only, CPU and RSS are read from /proc):
+
+    python -m bench.run --scenarios crawl,test --requests 20 --concurrency 4
+
+Set AGENT_TRANSPORT=http to measure agent calls over loopback HTTP instead of
+in-process dispatch.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+import aiohttp
+from aiohttp import web
+
+from . import fixture_site, stub_llm
+
+BACKEND_DIR = Path(__file__).parent.parent.absolute()
+AGENT_PORTS = {"link_grabber": 8002, "interaction_analyzer": 8003, "site_tester": 8004}
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p * len(ordered)) - 1)]
+
+
+def process_tree(root):
+    """PIDs of `root` and all its descendants."""
+    children = defaultdict(list)
+    for entry in Path("/proc").iterdir():
+        if not entry.name.isdigit():
+            continue
+        try:
+            stat = (entry / "stat").read_text()
+        except OSError:
+            continue
+        # The command name may hold spaces, the fields after it don't
+        ppid = int(stat.rsplit(")", 1)[1].split()[1])
+        children[ppid].append(int(entry.name))
+
+    pids, stack = [], [root]
+    while stack:
+        pid = stack.pop()
+        pids.append(pid)
+        stack.extend(children.get(pid, []))
+    return pids
+
+
+def tree_usage(root):
+    """(CPU seconds, RSS bytes) of a process tree, CPU including exited children."""
+    cpu, rss = 0.0, 0
+    for pid in process_tree(root):
+        try:
+            fields = Path(f"/proc/{pid}/stat").read_text().rsplit(")", 1)[1].split()
+            statm = Path(f"/proc/{pid}/statm").read_text().split()
+        except OSError:
+            continue
+        # utime, stime, and those of waited-for children, in clock ticks
+        cpu += sum(int(field) for field in fields[11:15]) / CLOCK_TICKS
+        rss += int(statm[1]) * PAGE_SIZE
+    return cpu, rss
+
+
+class UsageSampler:
+    """
+    Samples a process tree's CPU time and peak RSS across the stages of a run.
+
+    `mark(stage)` ends the stage running since the previous mark, or since
+    `restart`, and records its wall time, CPU time and peak RSS in `stages`.
+    """
+
+    def __init__(self, pid, interval=0.2):
+        self.pid = pid
+        self.interval = interval
+        self.stages = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def __enter__(self):
+        self.restart()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            rss = tree_usage(self.pid)[1]
+            with self._lock:
+                self._peak_rss = max(self._peak_rss, rss)
+
+    def restart(self):
+        """Start the next stage now, leaving the time since the last mark out."""
+        cpu, rss = tree_usage(self.pid)
+        with self._lock:
+            self._start_cpu, self._peak_rss = cpu, rss
+            self._started = time.monotonic()
+
+    def mark(self, stage):
+        cpu, rss = tree_usage(self.pid)
+        with self._lock:
+            wall = time.monotonic() - self._started
+            self.stages[stage] = {
+                "wall_seconds": wall,
+                "cpu_seconds": cpu - self._start_cpu,
+                "cpu_percent": 100 * (cpu - self._start_cpu) / wall if wall else 0,
+                "peak_rss_mb": max(self._peak_rss, rss) / 2**20,
+            }
+            self._start_cpu, self._peak_rss = cpu, rss
+            self._started = time.monotonic()
+        return self.stages[stage]
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def start_stub_servers(site_port, llm_port):
+    """Serve the fixture site and the scripted LLM from a background thread."""
+    ready = threading.Event()
+    errors = []
+
+    def serve():
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            for app, port in (
+                (fixture_site.create_app(), site_port),
+                (stub_llm.create_app(), llm_port),
+            ):
+                runner = web.AppRunner(app, access_log=None)
+                loop.run_until_complete(runner.setup())
+                loop.run_until_complete(web.TCPSite(runner, "127.0.0.1", port).start())
+        except OSError as e:
+            errors.append(e)
+            return
+        finally:
+            ready.set()
+        loop.run_forever()
+
+    threading.Thread(target=serve, daemon=True).start()
+    ready.wait()
+    if errors:
+        raise errors[0]
+
+
+def start_app(args, work_dir):
+    """Start app.py with its agents, LLM and MCP pointed at the stand-ins."""
+    env = {
+        **os.environ,
+        "OPENAI_API_KEY": "bench",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{args.llm_port}/v1",
+        "PLAYWRIGHT_MCP_COMMAND": f"{sys.executable} {BACKEND_DIR / 'bench' / 'stub_mcp.py'}",
+        "BENCH_TOOL_LATENCY": str(args.tool_latency),
+        "LINK_GRABBER": f"http://127.0.0.1:{AGENT_PORTS['link_grabber']}/agent/link_grabber",
+        "INTERACTION_ANALYZER": f"http://127.0.0.1:{AGENT_PORTS['interaction_analyzer']}/agent/interaction_analyzer",
+        "SITE_TESTER": f"http://127.0.0.1:{AGENT_PORTS['site_tester']}/agent/site_tester",
+        "ANALYSIS_CACHE_PATH": str(work_dir / "analysis_cache.sqlite3"),
+        "REPLAY_SCRIPTS_PATH": str(work_dir / "replay_scripts.sqlite3"),
+        "JOBS_DB_PATH": str(work_dir / "jobs.sqlite3"),
+        "TRACE_BUFFER_SIZE": "100000",
+    }
+    if not args.warm_cache:
+        # Every analysis misses the cache, so each one runs the agent
+        env["ANALYSIS_CACHE_TTL"] = "0"
+
+    log = open(work_dir / "app.log", "w")
+    return subprocess.Popen(
+        [sys.executable, str(BACKEND_DIR / "app.py")],
+        cwd=work_dir,
+        env=env,
+        stdout=log,
+        stderr=subprocess.STDOUT,
+        # Its own process group, so the MCP servers it starts are stopped with it
+        start_new_session=True,
+    )
+
+
+async def wait_until_ready(app_url, process, timeout, usage):
+    """
+    Wait for the app to answer, then for /ready to report its agents warm.
+
+    The two waits are marked as the "server start" and "agent warm-up" stages
+    of `usage`.
+    """
+    launched = time.monotonic()
+    listening = False
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() - launched < timeout:
+            if process.poll() is not None:
+                raise RuntimeError("The app exited during startup")
+            try:
+                async with session.get(f"{app_url}/ready") as response:
+                    if not listening:
+                        usage.mark("server start")
+                        listening = True
+                    if response.status == 200:
+                        usage.mark("agent warm-up")
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.1)
+    raise RuntimeError(f"The app wasn't ready after {timeout}s")
+
+
+def scenario_request(name, index, args):
+    """(path, payload, check) of the `index`-th request of a scenario."""
+    site = f"http://127.0.0.1:{args.site_port}"
+
+    if name == "crawl":
+        payload = {
+            "targetUrl": f"{site}/",
+            "maxPages": args.max_pages,
+            "maxDepth": 1,
+            "runId": f"bench-crawl-{index}",
+        }
+        return "/crawl-and-get-tests", payload, lambda body: isinstance(body, list) and len(body) > 0
+
+    if name == "test":
+        payload = {
+            "page_url": f"{site}/add_remove_elements/",
+            "interaction_description": "Click the Add Element button",
+            "expected_result": "A Delete button appears on the page",
+            "replay": args.replay,
+            "run_id": f"bench-test-{index}",
+        }
+        return "/test-interaction", payload, lambda body: body.get("test_passed") is True
+
+    raise ValueError(f"Unknown scenario '{name}'")
+
+
+async def run_scenario(name, args, usage):
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies, failures = [], 0
+    timeout = aiohttp.ClientTimeout(total=args.request_timeout)
+
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+
+        async def one(index):
+            nonlocal failures
+            path, payload, check = scenario_request(name, index, args)
+            async with semaphore:
+                started = time.monotonic()
+                try:
+                    async with session.post(f"{args.app_url}{path}", json=payload) as response:
+                        body = await response.json()
+                        ok = response.status == 200 and check(body)
+                except Exception as e:
+                    print(f"{name} request {index} failed: {e}")
+                    ok = False
+                latencies.append(time.monotonic() - started)
+                if not ok:
+                    failures += 1
+
+        started_at = time.time()
+        usage.restart()
+        await asyncio.gather(*(one(index) for index in range(args.requests)))
+        stage_usage = usage.mark(name)
+
+        async with session.get(f"{args.app_url}/traces", params={"limit": "100000"}) as response:
+            spans = [s for s in (await response.json())["spans"] if s["start"] >= started_at]
+
+    stages = defaultdict(list)
+    for span in spans:
+        if span["seconds"] is not None:
+            stages[span["name"]].append(span["seconds"])
+
+    return {
+        "scenario": name,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "failures": failures,
+        "p50_seconds": percentile(latencies, 0.5),
+        "p95_seconds": percentile(latencies, 0.95),
+        "max_seconds": max(latencies) if latencies else None,
+        "throughput_per_second": args.requests / stage_usage["wall_seconds"],
+        **stage_usage,
+        "stages": {
+            stage: {
+                "count": len(values),
+                "p50_seconds": percentile(values, 0.5),
+                "p95_seconds": percentile(values, 0.95),
+            }
+            for stage, values in sorted(stages.items())
+        },
+    }
+
+
+def print_report(report):
+    print(
+        f"\n{report['scenario']}: {report['requests']} requests at concurrency "
+        f"{report['concurrency']}, {report['failures']} failed"
+    )
+    print(
+        f"  latency p50 {report['p50_seconds']:.3f}s  p95 {report['p95_seconds']:.3f}s  "
+        f"max {report['max_seconds']:.3f}s  throughput {report['throughput_per_second']:.2f}/s"
+    )
+    print(
+        f"  app CPU {report['cpu_seconds']:.2f}s ({report['cpu_percent']:.0f}%)  "
+        f"peak RSS {report['peak_rss_mb']:.0f} MB"
+    )
+    print(f"  {'stage':<28}{'count':>7}{'p50':>10}{'p95':>10}")
+    for stage, stats in report["stages"].items():
+        print(
+            f"  {stage:<28}{stats['count']:>7}"
+            f"{stats['p50_seconds']:>9.3f}s{stats['p95_seconds']:>9.3f}s"
+        )
+
+
+def print_usage(stages):
+    print(f"\n{'app process tree':<28}{'wall':>10}{'CPU':>10}{'CPU%':>7}{'peak RSS':>11}")
+    for stage, usage in stages.items():
+        print(
+            f"  {stage:<26}{usage['wall_seconds']:>9.2f}s{usage['cpu_seconds']:>9.2f}s"
+            f"{usage['cpu_percent']:>6.0f}%{usage['peak_rss_mb']:>8.0f} MB"
+        )
+
+
+async def main(args):
+    start_stub_servers(args.site_port, args.llm_port)
+    # The scripted LLM's latency is read when its module loads, in this process
+    stub_llm.LLM_LATENCY = args.llm_latency
+
+    work_dir = Path(tempfile.mkdtemp(prefix="ironhyde-bench-"))
+    process = start_app(args, work_dir)
+    try:
+        with UsageSampler(process.pid) as usage:
+            await wait_until_ready(args.app_url, process, args.startup_timeout, usage)
+            listening = usage.stages["server start"]["wall_seconds"]
+            warm = listening + usage.stages["agent warm-up"]["wall_seconds"]
+            print(f"app answering after {listening:.2f}s, agents warm after {warm:.2f}s")
+            reports = [
+                {
+                    "scenario": "startup",
+                    "listening_seconds": listening,
+                    "warm_seconds": warm,
+                    "usage": {
+                        stage: usage.stages[stage]
+                        for stage in ("server start", "agent warm-up")
+                    },
+                }
+            ]
+            for name in args.scenarios.split(","):
+                report = await run_scenario(name.strip(), args, usage)
+                print_report(report)
+                reports.append(report)
+        print_usage(usage.stages)
+    except Exception:
+        print(f"App log: {work_dir / 'app.log'}")
+        raise
+    finally:
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(reports, indent=2))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--scenarios", default="crawl,test", help="comma separated: crawl, test")
+    parser.add_argument("--requests", type=int, default=10, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--max-pages", type=int, default=4, help="pages analyzed per crawl")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="seconds per LLM call")
+    parser.add_argument("--tool-latency", type=float, default=0.05, help="seconds per browser action")
+    parser.add_argument("--warm-cache", action="store_true", help="let repeat analyses hit the cache")
+    parser.add_argument("--replay", action="store_true", help="let repeat tests replay recorded scripts")
+    parser.add_argument("--app-url", default="http://127.0.0.1:3001")
+    parser.add_argument("--site-port", type=int, default=8765)
+    parser.add_argument("--llm-port", type=int, default=8766)
+    parser.add_argument("--request-timeout", type=float, default=600)
+    parser.add_argument("--startup-timeout", type=float, default=120)
+    parser.add_argument("--json", help="also write the reports to this file")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
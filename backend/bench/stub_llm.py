@@ -0,0 +1,172 @@
+"""
+A scripted stand-in for the OpenAI chat completions API.
+
+Each agent's run is replayed from a recorded tool-call sequence in
+bench/scripts.json: the n-th LLM call of a run answers with the n-th step.
+Steps are filled in from the conversation so far:
+
+- `{page_url}` is the first URL in the user's message
+- `{ref:<element>}` is the ref of the first snapshot line containing <element>
+  in the latest tool result
+- `{seen:<element>}` is whether the latest tool result contains <element>
+
+The agent is told apart by the verdict tool it was given. Point
+OPENAI_BASE_URL at this server's /v1 to use it.
+"""
+
+import asyncio
+import json
+import os
+import re
+import time
+import uuid
+from pathlib import Path
+from aiohttp import web
+
+SCRIPTS = json.loads((Path(__file__).parent / "scripts.json").read_text())
+
+# Simulated time to the first token of each completion
+LLM_LATENCY = float(os.getenv("BENCH_LLM_LATENCY", "0.2"))
+
+URL_PATTERN = re.compile(r"https?://[^\s\"'<>]+")
+REF_PATTERN = re.compile(r"\[ref=([^\]]+)\]")
+PLACEHOLDER = re.compile(r"\{(page_url|ref:[^}]*|seen:[^}]*)\}")
+
+
+def agent_of(tools):
+    """Which agent the request comes from, judged by its verdict tool."""
+    for tool in tools or []:
+        function = tool.get("function", {})
+        if function.get("name") == "submit_result":
+            properties = function.get("parameters", {}).get("properties", {})
+            return "tester" if "test_passed" in properties else "analyzer"
+    return "link_grabber" if tools else None
+
+
+def message_text(message):
+    content = message.get("content") or ""
+    if isinstance(content, list):
+        content = " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content
+
+
+def fill(value, page_url, observation):
+    """Fill the placeholders of a script step, see the module docstring."""
+    if isinstance(value, dict):
+        return {key: fill(item, page_url, observation) for key, item in value.items()}
+    if isinstance(value, list):
+        return [fill(item, page_url, observation) for item in value]
+    if not isinstance(value, str):
+        return value
+
+    seen = re.fullmatch(r"\{seen:(.*)\}", value)
+    if seen:
+        return seen.group(1) in observation
+
+    def replace(match):
+        name = match.group(1)
+        if name == "page_url":
+            return page_url
+        element = name.split(":", 1)[1]
+        for line in observation.splitlines():
+            if element in line and REF_PATTERN.search(line):
+                return REF_PATTERN.search(line).group(1)
+        return "e0"
+
+    return PLACEHOLDER.sub(replace, value)
+
+
+def next_step(body):
+    """The scripted reply to a chat completion request, as an assistant message."""
+    messages = body.get("messages", [])
+    agent = agent_of(body.get("tools"))
+
+    if agent is None:
+        # A plain completion, e.g. JSON repair: echo the last message back
+        return {"role": "assistant", "content": message_text(messages[-1])}
+
+    user_text = " ".join(message_text(m) for m in messages if m.get("role") == "user")
+    urls = URL_PATTERN.findall(user_text)
+    page_url = urls[0].rstrip(".,") if urls else "about:blank"
+    tool_results = [message_text(m) for m in messages if m.get("role") == "tool"]
+    observation = tool_results[-1] if tool_results else ""
+    position = sum(1 for m in messages if m.get("role") == "assistant")
+
+    script = SCRIPTS[agent]
+    step = fill(script[min(position, len(script) - 1)], page_url, observation)
+
+    if "answer" in step:
+        return {"role": "assistant", "content": step["answer"]}
+
+    return {
+        "role": "assistant",
+        "content": None,
+        "tool_calls": [
+            {
+                "index": 0,
+                "id": f"call_{uuid.uuid4().hex[:12]}",
+                "type": "function",
+                "function": {
+                    "name": step["tool"],
+                    "arguments": json.dumps(step["arguments"]),
+                },
+            }
+        ],
+    }
+
+
+def usage_of(body, message):
+    prompt_tokens = len(json.dumps(body.get("messages", []))) // 4
+    completion_tokens = len(json.dumps(message)) // 4
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+
+async def chat_completions(request):
+    body = await request.json()
+    await asyncio.sleep(LLM_LATENCY)
+
+    message = next_step(body)
+    finish_reason = "tool_calls" if message.get("tool_calls") else "stop"
+    base = {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "created": int(time.time()),
+        "model": body.get("model", "stub"),
+    }
+
+    if not body.get("stream"):
+        return web.json_response(
+            {
+                **base,
+                "object": "chat.completion",
+                "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+                "usage": usage_of(body, message),
+            }
+        )
+
+    response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+    await response.prepare(request)
+
+    async def send(choices, **extra):
+        chunk = {**base, "object": "chat.completion.chunk", "choices": choices, **extra}
+        await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+
+    await send([{"index": 0, "delta": message, "finish_reason": None}])
+    await send([{"index": 0, "delta": {}, "finish_reason": finish_reason}])
+    if (body.get("stream_options") or {}).get("include_usage"):
+        await send([], usage=usage_of(body, message))
+    await response.write(b"data: [DONE]\n\n")
+    return response
+
+
+def create_app():
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    return app
+
+
+if __name__ == "__main__":
+    web.run_app(create_app(), port=8766)
@@ -0,0 +1,198 @@
+"""
+A stand-in for the Playwright MCP server, for benchmarks that must not need a browser.
+
+It speaks MCP over stdio with the same tool names and snapshot format as
+Playwright MCP, and plays fixture pages from their HTML: links navigate,
+`data-bench-adds` buttons add an element, checkboxes toggle and forms submit.
+Point PLAYWRIGHT_MCP_COMMAND at `python bench/stub_mcp.py`; browser flags
+passed after it are ignored.
+"""
+
+import os
+import time
+from html.parser import HTMLParser
+from urllib.error import HTTPError
+from urllib.parse import urlencode, urljoin
+from urllib.request import urlopen
+from mcp.server.fastmcp import FastMCP
+
+# Simulated time each browser action takes
+TOOL_LATENCY = float(os.getenv("BENCH_TOOL_LATENCY", "0.05"))
+
+server = FastMCP("playwright")
+
+
+class PageParser(HTMLParser):
+    """Collect the page's title and the elements a snapshot lists."""
+
+    def __init__(self):
+        super().__init__()
+        self.title = ""
+        self.elements = []
+        self.form_action = None
+        self._open = None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == "form":
+            self.form_action = attrs.get("action")
+        elif tag in ("title", "h1", "h2", "h3", "p", "a", "button", "li"):
+            self._open = {"tag": tag, "attrs": attrs, "text": ""}
+        elif tag == "input":
+            kind = attrs.get("type", "text")
+            self.elements.append(
+                {
+                    "role": "checkbox" if kind == "checkbox" else "textbox",
+                    "name": attrs.get("placeholder") or attrs.get("name", ""),
+                    "field": attrs.get("name"),
+                    "checked": "checked" in attrs,
+                    "value": "",
+                }
+            )
+
+    def handle_data(self, data):
+        if self._open is not None:
+            self._open["text"] += data
+
+    def handle_endtag(self, tag):
+        if self._open is None or self._open["tag"] != tag:
+            return
+        element, self._open = self._open, None
+        text = " ".join(element["text"].split())
+        attrs = element["attrs"]
+
+        if tag == "title":
+            self.title = text
+        elif tag in ("h1", "h2", "h3"):
+            self.elements.append({"role": "heading", "name": text})
+        elif tag in ("p", "li") and text:
+            self.elements.append({"role": "text", "name": text})
+        elif tag == "a":
+            self.elements.append({"role": "link", "name": text, "href": attrs.get("href")})
+        elif tag == "button":
+            self.elements.append(
+                {
+                    "role": "button",
+                    "name": text,
+                    "adds": attrs.get("data-bench-adds"),
+                    "submit": attrs.get("type") == "submit",
+                }
+            )
+
+
+class Browser:
+    def __init__(self):
+        self.url = "about:blank"
+        self.title = ""
+        self.elements = []
+        self.form_action = None
+
+    def load(self, url):
+        self.url = url
+        if url == "about:blank":
+            self.title, self.elements, self.form_action = "", [], None
+            return
+
+        try:
+            with urlopen(url, timeout=10) as response:
+                html = response.read().decode("utf-8", "replace")
+        except HTTPError as e:
+            html = e.read().decode("utf-8", "replace")
+
+        parser = PageParser()
+        parser.feed(html)
+        self.title = parser.title
+        self.elements = parser.elements
+        self.form_action = parser.form_action
+
+    def element(self, ref):
+        index = int(ref.lstrip("e")) - 1
+        if not 0 <= index < len(self.elements):
+            raise ValueError(f"No element with ref {ref}, take a new snapshot")
+        return self.elements[index]
+
+    def snapshot(self):
+        lines = []
+        for index, element in enumerate(self.elements, start=1):
+            line = f'- {element["role"]} "{element["name"]}"'
+            if element["role"] == "text":
+                lines.append(f"- text: {element['name']}")
+                continue
+            if element.get("checked"):
+                line += " [checked]"
+            lines.append(f"{line} [ref=e{index}]")
+
+        return (
+            f"- Page URL: {self.url}\n"
+            f"- Page Title: {self.title}\n"
+            "- Page Snapshot\n"
+            "```yaml\n" + "\n".join(lines) + "\n```\n"
+        )
+
+    def click(self, ref):
+        element = self.element(ref)
+        if element["role"] == "link":
+            self.load(urljoin(self.url, element["href"]))
+        elif element["role"] == "checkbox":
+            element["checked"] = not element["checked"]
+        elif element["role"] == "button" and element.get("adds"):
+            self.elements.append({"role": "button", "name": element["adds"]})
+        elif element["role"] == "button" and element.get("submit"):
+            fields = {e["field"]: e["value"] for e in self.elements if e.get("field")}
+            self.load(urljoin(self.url, self.form_action or "") + "?" + urlencode(fields))
+        elif element["role"] == "button":
+            # Buttons added by `data-bench-adds` remove themselves
+            self.elements.remove(element)
+
+
+browser = Browser()
+
+
+def act(action):
+    time.sleep(TOOL_LATENCY)
+    action()
+    return browser.snapshot()
+
+
+@server.tool()
+def browser_navigate(url: str) -> str:
+    """Navigate to a URL"""
+    return act(lambda: browser.load(url))
+
+
+@server.tool()
+def browser_snapshot() -> str:
+    """Capture accessibility snapshot of the current page"""
+    return act(lambda: None)
+
+
+@server.tool()
+def browser_click(element: str, ref: str) -> str:
+    """Perform click on a web page"""
+    return act(lambda: browser.click(ref))
+
+
+@server.tool()
+def browser_type(element: str, ref: str, text: str, submit: bool = False) -> str:
+    """Type text into editable element"""
+
+    def type_text():
+        browser.element(ref)["value"] = text
+
+    return act(type_text)
+
+
+@server.tool()
+def browser_navigate_back() -> str:
+    """Go back to the previous page"""
+    return act(lambda: None)
+
+
+@server.tool()
+def browser_take_screenshot() -> str:
+    """Take a screenshot of the current page"""
+    return "Screenshots are not available in the benchmark browser, use browser_snapshot"
+
+
+if __name__ == "__main__":
+    server.run()
@@ -0,0 +1,58 @@
+import asyncio
+
+from aiohttp import web
+
+from utils.crawler import Crawler
+
+
+async def crawl_site(start_path):
+    """Crawl a site served on localhost whose pages redirect between 127.0.0.1 and localhost."""
+    port = None
+
+    def page(body):
+        async def handler(request):
+            return web.Response(text=f"<html><body>{body}</body></html>", content_type="text/html")
+        return handler
+
+    async def to_localhost(request):
+        raise web.HTTPFound(f"http://localhost:{port}/")
+
+    async def off_site(request):
+        raise web.HTTPFound(f"http://127.0.0.1:{port}/about")
+
+    app = web.Application()
+    app.router.add_get("/", page('<a href="/about">About</a> <a href="/moved">Moved</a>'))
+    app.router.add_get("/about", page("About us"))
+    app.router.add_get("/moved", off_site)
+    app.router.add_get("/start", to_localhost)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    try:
+        crawler = Crawler(
+            f"http://127.0.0.1:{port}{start_path}",
+            respect_robots=False,
+            requests_per_second=0,
+        )
+        await crawler.crawl()
+        return crawler, port
+    finally:
+        await runner.cleanup()
+
+
+def test_crawl_follows_the_start_page_to_the_origin_it_redirects_to():
+    crawler, port = asyncio.run(crawl_site("/start"))
+
+    assert crawler.start_url == f"http://localhost:{port}/"
+    assert sorted(crawler.pages) == [f"http://localhost:{port}/", f"http://localhost:{port}/about"]
+
+
+def test_crawl_records_pages_redirecting_off_site():
+    crawler, port = asyncio.run(crawl_site("/start"))
+
+    assert crawler.errors == {
+        f"http://localhost:{port}/moved": f"Redirected off-site to http://127.0.0.1:{port}/about"
+    }
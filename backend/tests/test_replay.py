@@ -0,0 +1,54 @@
+import asyncio
+from types import SimpleNamespace
+
+from utils.replay import ScriptRecorder, replay_script
+
+# A page long enough that one missing line barely changes its similarity
+LAYOUT = [f'- link "Example {n}"' for n in range(40)]
+
+
+class FakePage:
+    """The Add/Remove Elements page, where clicking Add Element may be broken."""
+
+    def __init__(self, click_works=True):
+        self.click_works = click_works
+        self.elements = ['button "Add Element"', *LAYOUT]
+
+    def snapshot(self):
+        lines = [f"{line} [ref=e{n}]" for n, line in enumerate(self.elements, start=1)]
+        text = "- Page Snapshot\n```yaml\n" + "\n".join(lines) + "\n```\n"
+        return SimpleNamespace(content=[SimpleNamespace(text=text)], isError=False)
+
+    async def call_tool(self, name, arguments):
+        if name == "browser_click" and arguments["ref"] == "e1" and self.click_works:
+            self.elements.append('button "Delete"')
+        return self.snapshot()
+
+
+def record_passing_run():
+    page, recorder = FakePage(), ScriptRecorder()
+    for name, arguments in (
+        ("browser_navigate", {"url": "https://example.com/add_remove_elements/"}),
+        ("browser_click", {"element": "Add Element", "ref": "e1"}),
+    ):
+        recorder(name, arguments, asyncio.run(page.call_tool(name, arguments)), None, 0.1)
+    return recorder.script()
+
+
+def test_replay_passes_when_the_actions_change_the_page_as_recorded():
+    passed, report = asyncio.run(replay_script(FakePage().call_tool, record_passing_run()))
+    assert passed, report
+
+
+def test_replay_fails_when_an_action_no_longer_changes_the_page():
+    page = FakePage(click_works=False)
+    passed, report = asyncio.run(replay_script(page.call_tool, record_passing_run()))
+    assert not passed
+    assert 'button "Delete"' in report
+
+
+def test_scripts_recorded_without_their_changes_are_not_replayed():
+    script = record_passing_run()
+    del script["changes"]
+    passed, _ = asyncio.run(replay_script(FakePage().call_tool, script))
+    assert not passed
@@ -0,0 +1,44 @@
+from app import CRAWL_NUMBER_FIELDS, TEST_NUMBER_FIELDS, app, crawl_options, options_error
+
+
+def test_crawl_options_map_camel_case_keys_to_agent_options():
+    options = crawl_options(
+        {
+            "targetUrl": "https://example.com",
+            "mode": "vision",
+            "maxSteps": 5,
+            "maxSeconds": 30,
+            "maxTokens": 1000,
+            "replay": False,
+        }
+    )
+
+    assert options["agent_options"] == {
+        "mode": "vision",
+        "max_steps": 5,
+        "max_seconds": 30,
+        "max_tokens": 1000,
+    }
+
+
+def test_options_error_accepts_numbers_and_numeric_strings():
+    assert options_error({"maxPages": "10", "pageTimeout": 2.5}, CRAWL_NUMBER_FIELDS) is None
+
+
+def test_options_error_rejects_values_that_are_not_non_negative_numbers():
+    for value in ("ten", -1, True, [1], float("nan")):
+        assert options_error({"testTimeout": value}, TEST_NUMBER_FIELDS) == (
+            "Invalid 'testTimeout': expected a non-negative number"
+        )
+
+
+def test_invalid_options_are_a_bad_request():
+    client = app.test_client()
+
+    response = client.post(
+        "/crawl-and-get-tests",
+        json={"targetUrl": "https://example.com", "maxPages": "all"},
+    )
+
+    assert response.status_code == 400
+    assert response.json == {"error": "Invalid 'maxPages': expected a non-negative number"}
@@ -0,0 +1,90 @@
+import asyncio
+
+from flask import Flask
+
+from utils.events import EventBus
+from utils.streaming import StreamingRoutes
+
+
+def http_scope(path, method="GET"):
+    return {
+        "type": "http",
+        "http_version": "1.1",
+        "method": method,
+        "path": path,
+        "root_path": "",
+        "query_string": b"",
+        "headers": [],
+        "server": ("localhost", 3001),
+    }
+
+
+async def call(app, scope, disconnect_after=None):
+    """Send `scope` to `app`, disconnecting once `disconnect_after` body chunks came back."""
+    sent = []
+    disconnect = asyncio.Event()
+
+    async def receive():
+        if not sent:
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await disconnect.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+        chunks = [m for m in sent if m.get("body")]
+        if disconnect_after is not None and len(chunks) >= disconnect_after:
+            disconnect.set()
+
+    await asyncio.wait_for(app(scope, receive, send), timeout=5)
+    return sent
+
+
+def test_stream_stops_when_the_client_disconnects():
+    streaming = StreamingRoutes(Flask(__name__))
+    cleaned_up = []
+
+    @streaming.route("/events/<run_id>", methods=["GET"], mimetype="text/event-stream")
+    async def endless(request, run_id):
+        async def generate():
+            try:
+                while True:
+                    yield f"data: {run_id}\n\n"
+                    await asyncio.sleep(0.01)
+            finally:
+                cleaned_up.append(run_id)
+
+        return generate()
+
+    sent = asyncio.run(call(streaming, http_scope("/events/abc"), disconnect_after=2))
+
+    assert sent[0]["status"] == 200
+    assert cleaned_up == ["abc"]
+
+
+def test_other_requests_are_served_by_flask():
+    app = Flask(__name__)
+    app.get("/")(lambda: "Hello")
+    streaming = StreamingRoutes(app)
+
+    sent = asyncio.run(call(streaming, http_scope("/")))
+
+    assert sent[0]["status"] == 200
+    assert b"".join(m.get("body", b"") for m in sent[1:]) == b"Hello"
+
+
+def test_a_finished_run_id_can_be_reused():
+    async def reuse():
+        bus = EventBus()
+        bus.publish("run", "page.discovered", page_url="https://example.com/")
+        bus.finish("run")
+        bus.publish("run", "tool_step", tool="browser_navigate")
+        bus.start("run")
+        bus.publish("run", "page.discovered", page_url="https://example.com/about")
+        subscriber = bus.subscribe("run")
+        return await subscriber.get(timeout=1)
+
+    event = asyncio.run(reuse())
+
+    assert event["page_url"] == "https://example.com/about"
+    assert event["id"] == 2
@@ -1,9 +1,12 @@
 import asyncio
 import os, json
+import shlex
 from dotenv import load_dotenv, find_dotenv
-from langchain_openai import ChatOpenAI
 from mcp_use import MCPAgent, MCPClient
 from mcp_use.adapters.langchain_adapter import LangChainAdapter
+from .uagents.base_agent import PLAYWRIGHT_MCP_COMMAND
+from .uagents.budget import DEFAULT_MAX_STEPS
+from .llm_gateway import get_llm
 
 load_dotenv(find_dotenv())
 key = os.getenv("OPENAI_API_KEY")
@@ -26,13 +29,13 @@ async def run_agent():
     client = MCPClient.from_dict(config)
 
     # Create LLM
-    llm = ChatOpenAI(model="gpt-4o")
+    llm = get_llm("verdict")
 
     # Create agent with the client
     agent = MCPAgent(
         llm=llm,
         client=client,
-        max_steps=30,
+        max_steps=DEFAULT_MAX_STEPS,
         system_prompt=(
             "Return your result as a JSON of the following format:"
             # "{{success: bool, message: str, captured_network_requests: str}}"
@@ -50,13 +53,14 @@ async def run_agent():
 
 async def mcp_server_manager():
     adapter = LangChainAdapter()
+    command, *args = shlex.split(PLAYWRIGHT_MCP_COMMAND)
 
     # Create configuration dictionary
     config = {
         "mcpServers": {
             "playwright": {
-                "command": "npx",
-                "args": ["@playwright/mcp@latest", "--headless"],
+                "command": command,
+                "args": [*args, "--headless"],
                 "env": {"DISPLAY": ":1"},
             }
         }
@@ -66,10 +70,10 @@ async def mcp_server_manager():
     client = MCPClient.from_dict(config)
 
     agent = MCPAgent(
-        llm=ChatOpenAI(model="gpt-4o"),
+        llm=get_llm("verdict"),
         client=client,
         use_server_manager=True,  # Enable the Server Manager
-        max_steps=30,
+        max_steps=DEFAULT_MAX_STEPS,
     )
 
     result = await agent.run(
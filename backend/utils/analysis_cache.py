@@ -0,0 +1,135 @@
+import hashlib
+import json
+import os
+import re
+import time
+
+from .storage import SQLiteStore
+
+DEFAULT_CACHE_PATH = os.getenv("ANALYSIS_CACHE_PATH", "cache/analysis_cache.sqlite3")
+DEFAULT_TTL = float(os.getenv("ANALYSIS_CACHE_TTL", str(7 * 24 * 3600)))
+DEFAULT_MAX_ENTRIES = int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", "5000"))
+
+# Part of every key. Bump it when the analyses cached change shape (e.g. tests
+# gaining `dom_region`), so entries from before are missed and age out
+CACHE_VERSION = 2
+
+# Markup that changes on every request without the page itself changing
+VOLATILE_MARKUP = [
+    (re.compile(r'\snonce="[^"]*"', re.IGNORECASE), ""),
+    (
+        re.compile(
+            r'(<input[^>]*name="[^"]*(?:csrf|token)[^"]*"[^>]*value=")[^"]*"',
+            re.IGNORECASE,
+        ),
+        r'\1"',
+    ),
+    (re.compile(r"\s+"), " "),
+]
+
+
+def content_hash(content):
+    """Hash page content (HTML text or screenshot bytes) for use as a cache key."""
+    if isinstance(content, str):
+        for pattern, replacement in VOLATILE_MARKUP:
+            content = pattern.sub(replacement, content)
+        content = content.strip().encode("utf-8")
+    return hashlib.sha256(content).hexdigest()
+
+
+class AnalysisCache(SQLiteStore):
+    """
+    Persistent cache of interaction analyses, keyed on page URL plus content hash,
+    the execution mode the page was analyzed in and CACHE_VERSION.
+
+    Entries expire after `ttl` seconds, and once the cache holds more than
+    `max_entries` the least recently used entries are evicted.
+    """
+
+    SCHEMA = (
+        """
+        CREATE TABLE IF NOT EXISTS analyses (
+            url TEXT NOT NULL,
+            content_hash TEXT NOT NULL,
+            result TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            last_used_at REAL NOT NULL,
+            PRIMARY KEY (url, content_hash)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS analyses_last_used ON analyses (last_used_at)",
+    )
+
+    def __init__(
+        self, path=DEFAULT_CACHE_PATH, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        super().__init__(path)
+
+    def get(self, url, content_hash, mode):
+        """Return the cached result dict, or None on a miss."""
+        content_hash = self._key(content_hash, mode)
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT result, created_at FROM analyses WHERE url = ? AND content_hash = ?",
+                (url, content_hash),
+            ).fetchone()
+
+            if row is None or now - row[1] > self.ttl:
+                if row is not None:
+                    self._db.execute(
+                        "DELETE FROM analyses WHERE url = ? AND content_hash = ?",
+                        (url, content_hash),
+                    )
+                    self._db.commit()
+                self.misses += 1
+                return None
+
+            self._db.execute(
+                "UPDATE analyses SET last_used_at = ? WHERE url = ? AND content_hash = ?",
+                (now, url, content_hash),
+            )
+            self._db.commit()
+            self.hits += 1
+            return json.loads(row[0])
+
+    def put(self, url, content_hash, mode, result):
+        content_hash = self._key(content_hash, mode)
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO analyses VALUES (?, ?, ?, ?, ?)",
+                (url, content_hash, json.dumps(result), now, now),
+            )
+            # Evict expired entries, then the least recently used beyond the cap
+            self._db.execute(
+                "DELETE FROM analyses WHERE created_at < ?", (now - self.ttl,)
+            )
+            self._db.execute(
+                """
+                DELETE FROM analyses WHERE rowid IN (
+                    SELECT rowid FROM analyses ORDER BY last_used_at DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries,),
+            )
+            self._db.commit()
+
+    def _key(self, content_hash, mode):
+        return f"v{CACHE_VERSION}:{mode}:{content_hash}"
+
+    def stats(self):
+        with self._lock:
+            (entries,) = self._db.execute("SELECT COUNT(*) FROM analyses").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+        }
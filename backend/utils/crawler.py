@@ -0,0 +1,210 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from urllib.parse import urlsplit
+from urllib.robotparser import RobotFileParser
+import aiohttp
+
+from .link_extractor import canonicalize_url, extract_links, fetch_html, same_origin
+from .telemetry import Span
+
+USER_AGENT = os.getenv("CRAWLER_USER_AGENT", "IronhydeCrawler/1.0")
+
+
+class HostLimiter:
+    """Caps concurrent requests to one host and spaces them at least `delay` apart."""
+
+    def __init__(self, concurrency, delay):
+        self.semaphore = asyncio.Semaphore(max(1, concurrency))
+        self.delay = delay
+        self.lock = asyncio.Lock()
+        self.next_request_at = 0
+
+    @asynccontextmanager
+    async def slot(self):
+        async with self.semaphore:
+            async with self.lock:
+                loop = asyncio.get_running_loop()
+                wait = self.next_request_at - loop.time()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                self.next_request_at = loop.time() + self.delay
+            yield
+
+
+class Crawler:
+    """
+    Breadth-first, same-origin crawler.
+
+    URLs are canonicalized before they enter the frontier, so every page is fetched
+    at most once. The crawl stops at `max_depth` hops from the start page or after
+    `max_pages` pages, whichever comes first. Requests to each host are limited to
+    `per_host_concurrency` at a time and `requests_per_second`, and robots.txt is
+    honoured (including its Crawl-delay) unless `respect_robots` is False.
+
+    When the start page redirects, the crawl moves to the origin it lands on.
+    Other pages redirecting off that origin are recorded in `errors`.
+
+    `on_page(url, depth)` is called as each page is found. A crawl can be resumed
+    from a `state()` snapshot of an earlier, interrupted one by passing it as `state`.
+    """
+
+    def __init__(
+        self,
+        start_url,
+        max_depth=1,
+        max_pages=50,
+        concurrency=8,
+        per_host_concurrency=2,
+        requests_per_second=4.0,
+        respect_robots=True,
+        timeout=30,
+        on_page=None,
+        state=None,
+    ):
+        self.start_url = canonicalize_url(start_url)
+        self.max_depth = max_depth
+        self.max_pages = max_pages
+        self.concurrency = concurrency
+        self.per_host_concurrency = per_host_concurrency
+        self.requests_per_second = requests_per_second
+        self.respect_robots = respect_robots
+        self.timeout = timeout
+        self.on_page = on_page
+
+        self.visited = set()
+        self.pages = []
+        self.errors = {}
+
+        self._frontier = None
+        # URLs queued or being fetched, with their depth
+        self._pending = {}
+        self._resume_state = state
+        self._limiters = {}
+        self._robots = {}
+
+    def _enqueue(self, url, depth):
+        if url in self.visited or len(self.visited) >= self.max_pages:
+            return
+        self.visited.add(url)
+        self._pending[url] = depth
+        self._frontier.put_nowait((url, depth))
+
+    async def _get_robots(self, session, url):
+        parts = urlsplit(url)
+        origin = f"{parts.scheme}://{parts.netloc}"
+        if origin not in self._robots:
+            robots = RobotFileParser(f"{origin}/robots.txt")
+            try:
+                async with session.get(
+                    robots.url, timeout=aiohttp.ClientTimeout(total=self.timeout)
+                ) as response:
+                    if response.status < 400:
+                        robots.parse((await response.text()).splitlines())
+                    else:
+                        # No robots.txt means everything is allowed
+                        robots.parse([])
+            except Exception as e:
+                print(f"Could not fetch {robots.url}, assuming no restrictions: {e}")
+                robots.parse([])
+            self._robots[origin] = robots
+        return self._robots[origin]
+
+    async def _get_limiter(self, session, url):
+        host = urlsplit(url).netloc
+        if host not in self._limiters:
+            delay = 1 / self.requests_per_second if self.requests_per_second else 0
+            if self.respect_robots:
+                robots = await self._get_robots(session, url)
+                delay = max(delay, robots.crawl_delay(USER_AGENT) or 0)
+            self._limiters[host] = HostLimiter(self.per_host_concurrency, delay)
+        return self._limiters[host]
+
+    async def _visit(self, session, url, depth):
+        if self.respect_robots:
+            robots = await self._get_robots(session, url)
+            if not robots.can_fetch(USER_AGENT, url):
+                self.errors[url] = "Disallowed by robots.txt"
+                return
+
+        limiter = await self._get_limiter(session, url)
+        async with limiter.slot():
+            final_url, html = await fetch_html(session, url, timeout=self.timeout)
+
+        # Redirects can land on a page we already know under another name
+        final_url = canonicalize_url(final_url)
+        if final_url != url:
+            if url == self.start_url:
+                # The site lives where its start page redirects to (http -> https,
+                # apex -> www...), so crawl that origin instead
+                self.start_url = final_url
+            elif not same_origin(final_url, self.start_url):
+                self.errors[url] = f"Redirected off-site to {final_url}"
+                return
+            if final_url in self.visited:
+                return
+            self.visited.add(final_url)
+
+        if html is None:
+            return
+
+        self.pages.append(final_url)
+        if self.on_page:
+            self.on_page(final_url, depth)
+
+        if depth < self.max_depth:
+            for link in extract_links(html, final_url):
+                self._enqueue(link, depth + 1)
+
+    async def _worker(self, session):
+        while True:
+            url, depth = await self._frontier.get()
+            try:
+                await self._visit(session, url, depth)
+            except Exception as e:
+                self.errors[url] = str(e)
+            finally:
+                self._pending.pop(url, None)
+                self._frontier.task_done()
+
+    def state(self):
+        """JSON-serializable snapshot of the crawl, including the unvisited frontier."""
+        return {
+            "start_url": self.start_url,
+            "visited": sorted(self.visited),
+            "pages": list(self.pages),
+            "errors": dict(self.errors),
+            "pending": [[url, depth] for url, depth in self._pending.items()],
+        }
+
+    async def crawl(self):
+        """Crawl from the start page and return the pages found, shallowest first."""
+        self._frontier = asyncio.Queue()
+
+        if self._resume_state:
+            self.start_url = self._resume_state.get("start_url", self.start_url)
+            self.visited = set(self._resume_state["visited"])
+            self.pages = list(self._resume_state["pages"])
+            self.errors = dict(self._resume_state["errors"])
+            for url, depth in self._resume_state["pending"]:
+                self._pending[url] = depth
+                self._frontier.put_nowait((url, depth))
+        else:
+            self._enqueue(self.start_url, 0)
+
+        async with aiohttp.ClientSession(
+            headers={"User-Agent": USER_AGENT}
+        ) as session, Span("crawl", start_url=self.start_url) as span:
+            workers = [
+                asyncio.create_task(self._worker(session))
+                for _ in range(max(1, self.concurrency))
+            ]
+            try:
+                await self._frontier.join()
+            finally:
+                for worker in workers:
+                    worker.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+            span.set(pages=len(self.pages), errors=len(self.errors))
+
+        return self.pages
@@ -0,0 +1,94 @@
+import os
+import re
+from difflib import SequenceMatcher
+
+from .telemetry import Span
+
+# How alike two tests of the same shared region must read to be merged
+DEDUP_MIN_SIMILARITY = float(os.getenv("DEDUP_MIN_SIMILARITY", "0.85"))
+# Tests the analyzer didn't place in a region are only merged when near identical
+DEDUP_UNTAGGED_MIN_SIMILARITY = float(os.getenv("DEDUP_UNTAGGED_MIN_SIMILARITY", "0.95"))
+
+# Page regions every page of a site usually shares. Tests of the main content are
+# specific to their page and never merged with other pages' tests
+SHARED_REGIONS = {"header", "nav", "footer", "aside"}
+
+URL_PATTERN = re.compile(r"https?://\S+")
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+FILLER_WORDS = {"a", "an", "the", "this", "that", "on", "of", "to", "and", "is", "be", "should"}
+
+
+def normalize_text(text):
+    """Lowercased words of a test's text without URLs and filler words."""
+    text = URL_PATTERN.sub(" url ", (text or "").lower())
+    return [word for word in WORD_PATTERN.findall(text) if word not in FILLER_WORDS]
+
+
+def similarity(a, b):
+    """How alike two tests read, from 0 to 1, judged on both their action and outcome."""
+    return min(
+        SequenceMatcher(None, a["action"], b["action"]).ratio(),
+        SequenceMatcher(None, a["outcome"], b["outcome"]).ratio(),
+    )
+
+
+def mergeable(a, b):
+    """Whether two tests exercise the same shared component."""
+    if a["region"] != b["region"]:
+        return False
+    if a["region"] in SHARED_REGIONS:
+        return similarity(a, b) >= DEDUP_MIN_SIMILARITY
+    if a["region"] is None:
+        return similarity(a, b) >= DEDUP_UNTAGGED_MIN_SIMILARITY
+    return False
+
+
+def dedupe_analyses(page_analyses):
+    """
+    Drop tests of shared components (header, nav, footer...) repeated across pages.
+
+    Tests are clustered across the crawl by their normalized text and the page
+    region they target. Each cluster keeps its first test, whose `covered_pages`
+    lists every page the component was seen on. The others are removed from their
+    pages, so each shared component is tested once. Returns new page analyses in
+    the same order. Failed pages are passed through unchanged.
+    """
+    with Span("test_dedup", pages=len(page_analyses)) as span:
+        clusters = []
+        deduped = []
+        before = after = 0
+
+        for analysis in page_analyses:
+            if not analysis or not analysis.get("interactions"):
+                deduped.append(analysis)
+                continue
+
+            kept = []
+            for interaction in analysis["interactions"]:
+                before += 1
+                candidate = {
+                    "action": normalize_text(interaction.get("interaction_description")),
+                    "outcome": normalize_text(interaction.get("expected_result")),
+                    "region": interaction.get("dom_region"),
+                }
+
+                cluster = next(
+                    (cluster for cluster in clusters if mergeable(cluster, candidate)),
+                    None,
+                )
+                page_url = analysis.get("page_url")
+                if cluster is not None:
+                    if page_url not in cluster["test"]["covered_pages"]:
+                        cluster["test"]["covered_pages"].append(page_url)
+                    continue
+
+                test = {**interaction, "covered_pages": [page_url]}
+                clusters.append({**candidate, "test": test})
+                kept.append(test)
+                after += 1
+
+            deduped.append({**analysis, "interactions": kept})
+
+        span.set(tests_before=before, tests_after=after)
+        print(f"Deduplicated {before} tests across {len(page_analyses)} pages to {after}")
+        return deduped
@@ -0,0 +1,221 @@
+import asyncio
+import importlib
+import os
+import time
+from urllib.parse import urlsplit
+import aiohttp
+
+from .main_loop import run_on_main_loop
+from .telemetry import Span
+
+# Environment variable holding each agent's REST endpoint URL
+AGENT_URL_VARS = {
+    "link_grabber": "LINK_GRABBER",
+    "interaction_analyzer": "INTERACTION_ANALYZER",
+    "site_tester": "SITE_TESTER",
+}
+
+# "auto" calls agents hosted in this process directly and others over HTTP,
+# "http" always goes over HTTP (e.g. to compare the two)
+AGENT_TRANSPORT = os.getenv("AGENT_TRANSPORT", "auto")
+
+# Hosted agents started in the background once the server is up. The others
+# start on their first call. /ready waits for these to be warm
+AGENT_PREWARM = [
+    name.strip()
+    for name in os.getenv("AGENT_PREWARM", ",".join(AGENT_URL_VARS)).split(",")
+    if name.strip()
+]
+
+LOCAL_HOSTS = {"127.0.0.1", "localhost", "0.0.0.0", "::1"}
+
+_local_agents = {}
+
+
+class LocalAgent:
+    """
+    An agent hosted in this process, built and started on first use.
+
+    The agent modules pull in langchain and mcp_use, so the module is imported on
+    a worker thread. The agent itself is built and run on the main loop.
+    """
+
+    def __init__(self, name, port_number, module, class_name):
+        self.name = name
+        self.port_number = port_number
+        self.module = module
+        self.class_name = class_name
+        self.agent = None
+        # cold -> starting -> warm, or failed
+        self.status = "cold"
+        self.error = None
+        self.startup_seconds = None
+        self._starting = None
+        self._task = None
+
+    async def start(self):
+        """Start the agent unless it already is, and wait until it is warm. Main loop only."""
+        if self._starting is None:
+            self._starting = asyncio.ensure_future(self._start())
+        # A caller timing out must not cancel the startup others are waiting on
+        await asyncio.shield(self._starting)
+        return self.agent
+
+    async def _start(self):
+        self.status = "starting"
+        started = time.monotonic()
+        try:
+            module = await asyncio.to_thread(importlib.import_module, self.module)
+            self.agent = getattr(module, self.class_name)()
+            self._task = asyncio.create_task(self.agent.run_async())
+
+            warm = asyncio.ensure_future(self.agent.warm.wait())
+            await asyncio.wait({warm, self._task}, return_when=asyncio.FIRST_COMPLETED)
+            if not self.agent.warm.is_set():
+                warm.cancel()
+                raise RuntimeError(f"{self.name} stopped while starting up")
+        except Exception as e:
+            self.status, self.error = "failed", str(e)
+            raise
+
+        self.status = "warm"
+        self.startup_seconds = round(time.monotonic() - started, 3)
+
+    async def handle(self, payload):
+        await self.start()
+        return await self.agent.handle(payload)
+
+    async def stop(self):
+        if self._starting is not None and not self._starting.done():
+            self._starting.cancel()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def state(self):
+        return {
+            "status": self.status,
+            "startup_seconds": self.startup_seconds,
+            "error": self.error,
+        }
+
+
+def register_local_agent(name, port_number, module, class_name):
+    """
+    Host the agent `name` in this process, as `module.class_name` listening on `port_number`.
+
+    Nothing is imported or built until the agent is first called or prewarmed.
+    """
+    _local_agents[name] = LocalAgent(name, port_number, module, class_name)
+
+
+async def prewarm_local_agents(names=None):
+    """Start the hosted agents in `names` (default AGENT_PREWARM) concurrently."""
+    agents = [
+        _local_agents[name]
+        for name in (AGENT_PREWARM if names is None else names)
+        if name in _local_agents
+    ]
+    results = await asyncio.gather(
+        *(agent.start() for agent in agents), return_exceptions=True
+    )
+    for agent, result in zip(agents, results):
+        if isinstance(result, Exception):
+            print(f"Agent {agent.name} failed to start: {result}")
+
+
+async def stop_local_agents():
+    for agent in _local_agents.values():
+        await agent.stop()
+
+
+def readiness():
+    """
+    Whether every prewarmed agent is warm, with the state of each hosted agent.
+
+    Agents left to start on first use don't hold readiness up.
+    """
+    states = {name: agent.state() for name, agent in _local_agents.items()}
+    ready = all(
+        states[name]["status"] == "warm" for name in AGENT_PREWARM if name in states
+    )
+    return ready, states
+
+
+def agent_url(name):
+    return os.getenv(AGENT_URL_VARS[name])
+
+
+def local_agent(name):
+    """
+    Return the agent `name` if it is hosted in this process, or None.
+
+    An agent only counts as local when its configured URL (if any) points at the
+    port it listens on here, so a URL naming another host is always honoured.
+    """
+    agent = _local_agents.get(name)
+    if agent is None:
+        return None
+
+    url = agent_url(name)
+    if url:
+        parts = urlsplit(url)
+        if parts.hostname not in LOCAL_HOSTS or parts.port != agent.port_number:
+            return None
+
+    return agent
+
+
+async def call_agent(name, payload, timeout, session=None):
+    """
+    Send `payload` to the agent `name` and return its response as a dict.
+
+    Agents hosted in this process are started if need be, then called directly on
+    the main loop, where their browser sessions live. Others get a REST request at
+    their configured URL, through `session` if given. Raises asyncio.TimeoutError
+    after `timeout` seconds.
+    """
+    agent = local_agent(name)
+    direct = agent is not None and AGENT_TRANSPORT != "http"
+    url = agent_url(name)
+
+    with Span(
+        "agent.request",
+        agent=name,
+        url=url,
+        transport="local" if direct else "http",
+        run_id=payload.get("run_id"),
+        test_id=payload.get("test_id"),
+        page_url=payload.get("page_url") or payload.get("target_page"),
+    ) as span:
+        payload = {**payload, "traceparent": span.traceparent}
+
+        if direct:
+            return await asyncio.wait_for(
+                run_on_main_loop(agent.handle(payload)), timeout
+            )
+
+        if agent is not None:
+            # A hosted agent only listens for HTTP once it has been started
+            await asyncio.wait_for(run_on_main_loop(agent.start()), timeout)
+
+        if not url:
+            raise RuntimeError(
+                f"{AGENT_URL_VARS[name]} is not set and {name} isn't running here"
+            )
+
+        owned = session is None
+        session = session or aiohttp.ClientSession()
+        try:
+            async with session.post(
+                url, json=payload, timeout=aiohttp.ClientTimeout(total=timeout)
+            ) as response:
+                span.set(status=response.status)
+                response.raise_for_status()
+                return await response.json()
+        finally:
+            if owned:
+                await session.close()
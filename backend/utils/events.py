@@ -0,0 +1,150 @@
+import asyncio
+import json
+import os
+import threading
+import time
+
+# How long the events of a finished run stay around for late subscribers
+RUN_RETENTION_SECONDS = float(os.getenv("EVENT_RETENTION_SECONDS", "300"))
+# Cap on the events kept per run, so a runaway agent can't grow memory forever
+MAX_EVENTS_PER_RUN = int(os.getenv("MAX_EVENTS_PER_RUN", "5000"))
+
+RUN_FINISHED = "run.finished"
+
+
+class Run:
+    def __init__(self, next_id=0):
+        self.events = []
+        self.next_id = next_id
+        self.subscribers = []
+        self.finished_at = None
+
+
+class Subscriber:
+    """A queue of events read on the event loop that subscribed, fed from any thread."""
+
+    def __init__(self):
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue()
+
+    def put(self, event):
+        try:
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, event)
+        except RuntimeError:
+            # The subscriber's loop is closed, nobody is reading anymore
+            pass
+
+    async def get(self, timeout=None):
+        """Wait for the next event. Raises asyncio.TimeoutError after `timeout` seconds."""
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+
+class EventBus:
+    """
+    Progress events for long-running requests, grouped by run ID.
+
+    Publishers (the Flask views and the agents) run on different loops and threads,
+    and events are handed to each subscriber on its own loop. Every run keeps its
+    event history, so a client that subscribes late, or reconnects, still sees
+    everything from the start (or from the last event ID it saw). Events published
+    after a run finished (e.g. by work cancelled with it) are dropped until the run
+    ID is reused with `start`.
+    """
+
+    def __init__(self, retention=RUN_RETENTION_SECONDS, max_events=MAX_EVENTS_PER_RUN):
+        self.retention = retention
+        self.max_events = max_events
+        self._runs = {}
+        self._lock = threading.Lock()
+
+    def _run(self, run_id):
+        if run_id not in self._runs:
+            self._runs[run_id] = Run()
+        return self._runs[run_id]
+
+    def _expire(self):
+        now = time.time()
+        for run_id in [
+            run_id
+            for run_id, run in self._runs.items()
+            if run.finished_at and now - run.finished_at > self.retention
+        ]:
+            del self._runs[run_id]
+
+    def publish(self, run_id, event_type, **data):
+        """Record an event for `run_id` and hand it to every subscriber. No-op without a run ID."""
+        if not run_id:
+            return
+
+        with self._lock:
+            run = self._run(run_id)
+            if run.finished_at:
+                return
+
+            event = {**data, "id": run.next_id, "type": event_type, "time": time.time()}
+            run.next_id += 1
+            run.events.append(event)
+            if len(run.events) > self.max_events:
+                del run.events[: -self.max_events]
+
+            if event_type == RUN_FINISHED:
+                run.finished_at = event["time"]
+
+            for subscriber in run.subscribers:
+                subscriber.put(event)
+
+    def start(self, run_id):
+        """Begin a run. A run ID that already finished starts over. No-op without a run ID."""
+        if not run_id:
+            return
+
+        with self._lock:
+            run = self._runs.get(run_id)
+            if run is not None and run.finished_at:
+                # Event IDs carry on, so reconnecting clients don't skip any
+                self._runs[run_id] = Run(next_id=run.next_id)
+
+    def finish(self, run_id, **data):
+        """Mark the run as done. Subscribers get a final `run.finished` event."""
+        self.publish(run_id, RUN_FINISHED, **data)
+        with self._lock:
+            self._expire()
+
+    def subscribe(self, run_id, after=None):
+        """
+        Return a `Subscriber` receiving the run's events, starting after event ID `after`.
+
+        Must be called on the event loop that reads it. Past events are queued
+        first, so nothing published before subscribing is lost.
+        """
+        subscriber = Subscriber()
+        with self._lock:
+            run = self._run(run_id)
+            for event in run.events:
+                if after is None or event["id"] > after:
+                    subscriber.put(event)
+            run.subscribers.append(subscriber)
+        return subscriber
+
+    def unsubscribe(self, run_id, subscriber):
+        with self._lock:
+            run = self._runs.get(run_id)
+            if run and subscriber in run.subscribers:
+                run.subscribers.remove(subscriber)
+                # Nobody ever published to this run, don't keep it around
+                if not run.events and not run.subscribers:
+                    del self._runs[run_id]
+            self._expire()
+
+
+def format_sse(event):
+    """Encode an event in the text/event-stream wire format."""
+    return (
+        f"id: {event['id']}\n"
+        f"event: {event['type']}\n"
+        f"data: {json.dumps(event)}\n\n"
+    )
+
+
+# Shared by the app and the agents, which run in the same process
+events = EventBus()
@@ -0,0 +1,101 @@
+import asyncio
+import os
+import aiohttp
+
+from .dispatch import call_agent
+from .events import events
+
+DEFAULT_CONCURRENCY = int(os.getenv("ANALYSIS_CONCURRENCY", "8"))
+DEFAULT_PAGE_TIMEOUT = float(os.getenv("ANALYSIS_PAGE_TIMEOUT", "600"))
+
+
+async def iter_fan_out(
+    agent,
+    payloads,
+    concurrency=DEFAULT_CONCURRENCY,
+    timeout=DEFAULT_PAGE_TIMEOUT,
+    on_start=None,
+):
+    """
+    Send every payload to `agent` concurrently, at most `concurrency` at a time.
+
+    Yields (index, status, value) as each call finishes, where `index` is the
+    payload's position and the result is either ("ok", response_json) or
+    ("error", message). Each call gets its own `timeout` (seconds), and a failing or
+    timed out call does not cancel the others. `on_start(index)` is called as each
+    call gets a concurrency slot.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async with aiohttp.ClientSession() as session:
+
+        async def run_one(index, payload):
+            async with semaphore:
+                if on_start:
+                    on_start(index)
+                try:
+                    return index, "ok", await call_agent(agent, payload, timeout, session)
+                except asyncio.TimeoutError:
+                    return index, "error", f"Timed out after {timeout}s"
+                except Exception as e:
+                    return index, "error", str(e)
+
+        tasks = [
+            asyncio.create_task(run_one(index, payload))
+            for index, payload in enumerate(payloads)
+        ]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                yield await finished
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+async def analyze_pages(
+    page_urls,
+    concurrency=DEFAULT_CONCURRENCY,
+    timeout=DEFAULT_PAGE_TIMEOUT,
+    run_id=None,
+    on_result=None,
+    agent_options=None,
+):
+    """
+    Run the interaction analyzer on every page concurrently.
+
+    Pages that fail or time out are still returned, with no interactions and an
+    `error` field, so one slow page never costs the rest of the crawl. With a
+    `run_id`, each page's analysis start and finish are published as events, and
+    `on_result(page_url, analysis)` is called as each page finishes. `agent_options`
+    holds the analyzer's execution mode and limits for each page.
+    """
+    page_analyses = [None] * len(page_urls)
+
+    async for index, status, value in iter_fan_out(
+        "interaction_analyzer",
+        [
+            {"target_page": page_url, "run_id": run_id, **(agent_options or {})}
+            for page_url in page_urls
+        ],
+        concurrency=concurrency,
+        timeout=timeout,
+        on_start=lambda index: events.publish(
+            run_id, "analysis.started", page_url=page_urls[index]
+        ),
+    ):
+        page_url = page_urls[index]
+        if status == "ok":
+            page_analyses[index] = value
+        else:
+            print(f"Interaction analysis failed for {page_url}: {value}")
+            page_analyses[index] = {
+                "page_url": page_url,
+                "interactions": [],
+                "error": value,
+            }
+
+        events.publish(run_id, "analysis.finished", analysis=page_analyses[index])
+        if on_result:
+            on_result(page_url, page_analyses[index])
+
+    return page_analyses
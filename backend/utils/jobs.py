@@ -0,0 +1,339 @@
+import asyncio
+import json
+import os
+import sqlite3
+import time
+import uuid
+from contextlib import asynccontextmanager
+
+from .events import events
+from .storage import SQLiteStore
+from .telemetry import Span
+
+DEFAULT_JOBS_PATH = os.getenv("JOBS_DB_PATH", "cache/jobs.sqlite3")
+DEFAULT_JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# Jobs interrupted by a crash this many times are given up on
+MAX_JOB_ATTEMPTS = int(os.getenv("MAX_JOB_ATTEMPTS", "3"))
+# How often a running job's checkpoint is written while it makes progress
+CHECKPOINT_INTERVAL = float(os.getenv("JOB_CHECKPOINT_INTERVAL", "2"))
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+JSON_COLUMNS = ("payload", "result", "checkpoint", "progress")
+
+
+class JobStore(SQLiteStore):
+    """
+    Persistent job records in SQLite.
+
+    A job's payload, checkpoint and result are stored as JSON, so a job that was
+    running when the process died can be picked up again where it left off.
+    """
+
+    SCHEMA = (
+        """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL,
+            result TEXT,
+            error TEXT,
+            checkpoint TEXT,
+            progress TEXT,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            created_at REAL NOT NULL,
+            started_at REAL,
+            finished_at REAL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)",
+    )
+    row_factory = sqlite3.Row
+
+    def __init__(self, path=DEFAULT_JOBS_PATH):
+        super().__init__(path)
+
+    def _to_dict(self, row):
+        job = dict(row)
+        for column in JSON_COLUMNS:
+            if job[column] is not None:
+                job[column] = json.loads(job[column])
+        return job
+
+    def add(self, kind, payload):
+        job_id = str(uuid.uuid4())
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO jobs (id, kind, payload, status, created_at) VALUES (?, ?, ?, ?, ?)",
+                (job_id, kind, json.dumps(payload), QUEUED, time.time()),
+            )
+            self._db.commit()
+        return job_id
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def list(self, status=None, limit=50):
+        query = "SELECT * FROM jobs"
+        params = []
+        if status:
+            query += " WHERE status = ?"
+            params.append(status)
+        query += " ORDER BY created_at DESC LIMIT ?"
+        params.append(limit)
+
+        with self._lock:
+            rows = self._db.execute(query, params).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def claim_next(self):
+        """Mark the oldest queued job as running and return it, or None."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1",
+                (QUEUED,),
+            ).fetchone()
+            if row is None:
+                return None
+
+            self._db.execute(
+                """
+                UPDATE jobs SET status = ?, attempts = attempts + 1, started_at = ?
+                WHERE id = ?
+                """,
+                (RUNNING, time.time(), row["id"]),
+            )
+            self._db.commit()
+            row = self._db.execute(
+                "SELECT * FROM jobs WHERE id = ?", (row["id"],)
+            ).fetchone()
+        return self._to_dict(row)
+
+    def save_checkpoint(self, job_id, checkpoint, progress=None):
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET checkpoint = ?, progress = COALESCE(?, progress) WHERE id = ?",
+                (
+                    json.dumps(checkpoint),
+                    json.dumps(progress) if progress is not None else None,
+                    job_id,
+                ),
+            )
+            self._db.commit()
+
+    def finish(self, job_id, status, result=None, error=None):
+        """Record a running job's outcome. Jobs cancelled in the meantime stay cancelled."""
+        with self._lock:
+            self._db.execute(
+                """
+                UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?
+                WHERE id = ? AND status = ?
+                """,
+                (status, json.dumps(result), error, time.time(), job_id, RUNNING),
+            )
+            self._db.commit()
+
+    def cancel(self, job_id):
+        """Cancel a queued or running job. Returns its status afterwards, or None."""
+        with self._lock:
+            self._db.execute(
+                """
+                UPDATE jobs SET status = ?, finished_at = ?
+                WHERE id = ? AND status IN (?, ?)
+                """,
+                (CANCELLED, time.time(), job_id, QUEUED, RUNNING),
+            )
+            self._db.commit()
+            row = self._db.execute(
+                "SELECT status FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return row["status"] if row else None
+
+    def requeue(self, job_id, count_attempt=True):
+        """Put a running job back in the queue, keeping its checkpoint."""
+        with self._lock:
+            self._db.execute(
+                """
+                UPDATE jobs SET status = ?, attempts = attempts - ?
+                WHERE id = ? AND status = ?
+                """,
+                (QUEUED, 0 if count_attempt else 1, job_id, RUNNING),
+            )
+            self._db.commit()
+
+    def recover(self, max_attempts=MAX_JOB_ATTEMPTS):
+        """
+        Requeue jobs left running by a process that died.
+
+        Returns the number requeued. Jobs that have already been interrupted
+        `max_attempts` times are marked failed instead.
+        """
+        with self._lock:
+            self._db.execute(
+                """
+                UPDATE jobs SET status = ?, error = ?, finished_at = ?
+                WHERE status = ? AND attempts >= ?
+                """,
+                (
+                    FAILED,
+                    f"Interrupted {max_attempts} times",
+                    time.time(),
+                    RUNNING,
+                    max_attempts,
+                ),
+            )
+            requeued = self._db.execute(
+                "UPDATE jobs SET status = ? WHERE status = ?", (QUEUED, RUNNING)
+            ).rowcount
+            self._db.commit()
+        return requeued
+
+
+class Job:
+    """The view of a job its handler gets: payload, last checkpoint and a way to save one."""
+
+    def __init__(self, store, record):
+        self.store = store
+        self.id = record["id"]
+        self.kind = record["kind"]
+        self.payload = record["payload"]
+        self.checkpoint = record["checkpoint"]
+        self.attempts = record["attempts"]
+
+    def save_checkpoint(self, checkpoint, progress=None):
+        self.checkpoint = checkpoint
+        self.store.save_checkpoint(self.id, checkpoint, progress)
+
+    @asynccontextmanager
+    async def checkpointing(self, snapshot, interval=CHECKPOINT_INTERVAL):
+        """Save `snapshot()` as the checkpoint every `interval` seconds, and once at the end."""
+
+        async def save_periodically():
+            while True:
+                await asyncio.sleep(interval)
+                self.save_checkpoint(*snapshot())
+
+        saver = asyncio.create_task(save_periodically())
+        try:
+            yield
+        finally:
+            saver.cancel()
+            self.save_checkpoint(*snapshot())
+
+
+class JobQueue:
+    """
+    Runs persisted jobs on a fixed pool of workers on the main event loop.
+
+    Handlers are coroutines registered per job kind that take a `Job` and return a
+    JSON-serializable result. Submitting only writes the job to the store, so heavy
+    load queues up instead of timing out, and jobs still queued or running when the
+    process stops are picked up again on the next start. Progress is published as
+    events under the job ID.
+    """
+
+    def __init__(self, store=None, workers=DEFAULT_JOB_WORKERS):
+        self.store = store or JobStore()
+        self.workers = workers
+        self.handlers = {}
+
+        self._loop = None
+        self._wakeup = None
+        self._worker_tasks = []
+        self._running = {}
+        self._stopping = False
+
+    def register(self, kind, handler):
+        self.handlers[kind] = handler
+
+    def _wake(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def submit(self, kind, payload):
+        """Queue a job and return its ID. Safe to call from any thread."""
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind '{kind}'")
+        job_id = self.store.add(kind, payload)
+        events.publish(job_id, "job.queued", kind=kind)
+        self._wake()
+        return job_id
+
+    def cancel(self, job_id):
+        """Cancel a job, interrupting it if it is running. Returns its new status."""
+        status = self.store.cancel(job_id)
+        task = self._running.get(job_id)
+        if status == CANCELLED and task is not None:
+            self._loop.call_soon_threadsafe(task.cancel)
+        return status
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+
+        requeued = self.store.recover()
+        if requeued:
+            print(f"Resuming {requeued} interrupted job(s)")
+
+        self._worker_tasks = [
+            asyncio.create_task(self._worker()) for _ in range(max(1, self.workers))
+        ]
+
+    async def stop(self):
+        """Stop the workers. Jobs they were running are requeued for the next start."""
+        self._stopping = True
+        for worker in self._worker_tasks:
+            worker.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+
+    async def _worker(self):
+        while True:
+            record = self.store.claim_next()
+            if record is None:
+                self._wakeup.clear()
+                try:
+                    # Also poll now and then in case a wakeup was missed
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=5)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self._run(Job(self.store, record))
+
+    async def _run(self, job):
+        handler = self.handlers.get(job.kind)
+        if handler is None:
+            self.store.finish(job.id, FAILED, error=f"Unknown job kind '{job.kind}'")
+            return
+
+        with Span("job", run_id=job.id, kind=job.kind, attempt=job.attempts):
+            events.publish(job.id, "job.started", kind=job.kind, attempt=job.attempts)
+            task = asyncio.create_task(handler(job))
+            self._running[job.id] = task
+
+            try:
+                result = await task
+            except asyncio.CancelledError:
+                if self._stopping:
+                    # Shutting down: leave the job for the next start to resume
+                    self.store.requeue(job.id, count_attempt=False)
+                    raise
+                events.finish(job.id, status=CANCELLED)
+            except Exception as e:
+                print(f"Job {job.id} ({job.kind}) failed: {e}")
+                self.store.finish(job.id, FAILED, error=str(e))
+                events.finish(job.id, status=FAILED, error=str(e))
+            else:
+                self.store.finish(job.id, SUCCEEDED, result=result)
+                events.finish(job.id, status=SUCCEEDED)
+            finally:
+                self._running.pop(job.id, None)
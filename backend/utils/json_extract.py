@@ -0,0 +1,63 @@
+import json
+import re
+
+FENCED_BLOCK = re.compile(r"```[a-zA-Z]*\s*(.*?)```", re.DOTALL)
+
+_decoder = json.JSONDecoder()
+
+
+def json_values(text, opener="{"):
+    """
+    Yield (start, value) for every top-level JSON object (or array) in `text`.
+
+    Each opening bracket is tried as the start of a JSON value, and a value that
+    decodes is skipped over as a whole. Brackets inside strings, escaped quotes and
+    stray brackets in the surrounding prose are all handled by the JSON decoder.
+    """
+    index = text.find(opener)
+    while index != -1:
+        try:
+            value, end = _decoder.raw_decode(text, index)
+        except json.JSONDecodeError:
+            index = text.find(opener, index + 1)
+            continue
+        yield index, value
+        index = text.find(opener, end)
+
+
+def json_candidates(text, opener="{"):
+    """
+    Every JSON object (or array) in `text`, most likely answer first.
+
+    Values in fenced code blocks come first, as that's where models are asked to
+    put their answer, then the rest, latest first.
+    """
+    fenced = [match.span(1) for match in FENCED_BLOCK.finditer(text)]
+
+    def in_fence(start):
+        return any(begin <= start < end for begin, end in fenced)
+
+    values = list(json_values(text, opener))
+    return [value for start, value in values if in_fence(start)] + [
+        value for start, value in reversed(values) if not in_fence(start)
+    ]
+
+
+def parse_model(text, model):
+    """Return the first JSON object in `text` that validates as `model`, or None."""
+    for candidate in json_candidates(text):
+        if not isinstance(candidate, dict):
+            continue
+        try:
+            return model.parse_obj(candidate)
+        except Exception:
+            continue
+    return None
+
+
+def string_array(text):
+    """Return the first JSON array of strings in `text`, or []."""
+    for candidate in json_candidates(text, opener="["):
+        if isinstance(candidate, list) and all(isinstance(item, str) for item in candidate):
+            return candidate
+    return []
@@ -0,0 +1,113 @@
+from html.parser import HTMLParser
+from urllib.parse import urljoin, urlsplit, urlunsplit, parse_qsl, urlencode
+import aiohttp
+
+# Schemes that never point at another page of the site
+IGNORED_SCHEMES = ("javascript:", "mailto:", "tel:", "data:", "blob:")
+
+# Query parameters that only track where a click came from
+TRACKING_PARAMS = ("utm_", "gclid", "fbclid", "mc_cid", "mc_eid")
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+class AnchorParser(HTMLParser):
+    """Collects the href of every <a>/<area> tag, and the document's <base href>."""
+
+    def __init__(self):
+        super().__init__()
+        self.base_href = None
+        self.hrefs = []
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == "base" and self.base_href is None and attrs.get("href"):
+            self.base_href = attrs["href"]
+        elif tag in ("a", "area") and attrs.get("href"):
+            self.hrefs.append(attrs["href"])
+
+
+def canonicalize_url(url):
+    """
+    Normalize a URL so that equivalent spellings compare equal.
+
+    Lower-cases the scheme and host, drops default ports, fragments and tracking
+    parameters, sorts the query string and gives empty paths a "/".
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+
+    netloc = host
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        netloc = f"{host}:{parts.port}"
+
+    query = urlencode(
+        sorted(
+            (key, value)
+            for key, value in parse_qsl(parts.query, keep_blank_values=True)
+            if not key.lower().startswith(TRACKING_PARAMS)
+        )
+    )
+
+    return urlunsplit((scheme, netloc, parts.path or "/", query, ""))
+
+
+def origin_of(url):
+    parts = urlsplit(canonicalize_url(url))
+    return parts.scheme, parts.netloc
+
+
+def same_origin(url, other):
+    return origin_of(url) == origin_of(other)
+
+
+def extract_links(html, page_url):
+    """Return the canonical, de-duplicated same-origin links found in `html`."""
+    parser = AnchorParser()
+    parser.feed(html)
+    parser.close()
+
+    base_url = urljoin(page_url, parser.base_href) if parser.base_href else page_url
+
+    links = []
+    seen = set()
+    for href in parser.hrefs:
+        href = href.strip()
+        if not href or href.startswith("#") or href.lower().startswith(IGNORED_SCHEMES):
+            continue
+
+        link = canonicalize_url(urljoin(base_url, href))
+        if link in seen or not same_origin(link, page_url):
+            continue
+
+        seen.add(link)
+        links.append(link)
+
+    return links
+
+
+async def fetch_html(session, url, timeout=30):
+    """
+    Fetch a page and return (final_url, html).
+
+    `html` is None when the response is not an HTML document.
+    """
+    async with session.get(
+        url, timeout=aiohttp.ClientTimeout(total=timeout), allow_redirects=True
+    ) as response:
+        response.raise_for_status()
+        if "html" not in response.headers.get("Content-Type", ""):
+            return str(response.url), None
+        return str(response.url), await response.text(errors="replace")
+
+
+async def fetch_links(url, timeout=30):
+    """Fetch `url` and return the same-origin links on it, without a browser."""
+    async with aiohttp.ClientSession() as session:
+        final_url, html = await fetch_html(session, url, timeout=timeout)
+
+    if html is None:
+        return []
+
+    return extract_links(html, final_url)
@@ -0,0 +1,344 @@
+import asyncio
+import collections
+import os
+import random
+import threading
+import weakref
+import httpx
+from langchain_core.callbacks import BaseCallbackHandler
+from .telemetry import Span, llm_tokens, metrics
+
+# Model for each kind of LLM work, as "provider:model". Cheap, fast models do the
+# mechanical tasks, the strongest one judges pages and test runs
+TASK_MODELS = {
+    "verdict": os.getenv("LLM_VERDICT_MODEL", "openai:gpt-4o"),
+    "link_extraction": os.getenv("LLM_LINK_EXTRACTION_MODEL", "openai:gpt-4o-mini"),
+    "json_repair": os.getenv("LLM_JSON_REPAIR_MODEL", "openai:gpt-4o-mini"),
+    # Must take images
+    "screenshot_description": os.getenv("LLM_SCREENSHOT_MODEL", "openai:gpt-4o-mini"),
+}
+DEFAULT_MODEL = os.getenv("LLM_DEFAULT_MODEL", "openai:gpt-4o")
+
+# Most LLM requests in flight at once, across every agent in the process
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "1"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "30"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "120"))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class ConcurrencyLimit:
+    """
+    An async semaphore shared by every event loop in the process.
+
+    The app runs agents and request handlers on several loops, which an
+    `asyncio.Semaphore` can't be shared between.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self._lock = threading.Lock()
+        self._available = limit
+        self._waiters = collections.deque()
+        self.waiting = 0
+
+    @property
+    def in_use(self):
+        return self.limit - self._available
+
+    async def acquire(self):
+        with self._lock:
+            if self._available > 0 and not self._waiters:
+                self._available -= 1
+                return
+            future = asyncio.get_running_loop().create_future()
+            self._waiters.append(future)
+            self.waiting += 1
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            # The slot was handed over just before the cancellation
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+        finally:
+            with self._lock:
+                self.waiting -= 1
+
+    def release(self):
+        with self._lock:
+            if not self._waiters:
+                self._available += 1
+                return
+            future = self._waiters.popleft()
+
+        # Hand the slot straight to the next waiter, on its own loop
+        future.get_loop().call_soon_threadsafe(self._hand_over, future)
+
+    def _hand_over(self, future):
+        if future.cancelled():
+            self.release()
+        else:
+            future.set_result(None)
+
+
+class ReleasingStream(httpx.AsyncByteStream):
+    """A response body that gives its concurrency slot back once it is closed."""
+
+    def __init__(self, stream, release):
+        self._stream = stream
+        self._release = release
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            if self._release:
+                self._release()
+                self._release = None
+
+
+def retry_after(response):
+    """Seconds the provider asked us to wait before retrying, or None."""
+    headers = response.headers
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "retry-after" in headers:
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+    return None
+
+
+def backoff_delay(attempt, response=None):
+    """Exponential backoff with full jitter, never shorter than the provider's Retry-After."""
+    delay = random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2**attempt))
+    requested = retry_after(response) if response is not None else None
+    if requested is not None:
+        delay = max(delay, min(requested, LLM_BACKOFF_MAX))
+    return delay
+
+
+class GatewayTransport(httpx.AsyncBaseTransport):
+    """
+    Transport for every LLM request the process makes.
+
+    Requests wait for a slot under the global concurrency limit, and responses
+    keep it until their body is read, so streamed completions count too. Rate
+    limited (429) and transient server errors are retried with backoff.
+    Connections are pooled per event loop, as they can't move between loops.
+    """
+
+    def __init__(self, limit=LLM_MAX_CONCURRENCY, max_retries=LLM_MAX_RETRIES):
+        self.limit = ConcurrencyLimit(limit)
+        self.max_retries = max_retries
+        self._transports = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self.stats = collections.Counter()
+
+    def _transport(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if loop not in self._transports:
+                self._transports[loop] = httpx.AsyncHTTPTransport(
+                    limits=httpx.Limits(
+                        max_connections=LLM_MAX_CONNECTIONS,
+                        max_keepalive_connections=LLM_MAX_CONNECTIONS,
+                    )
+                )
+            return self._transports[loop]
+
+    async def handle_async_request(self, request):
+        await self.limit.acquire()
+        try:
+            response = await self._send(request)
+        except BaseException:
+            self.limit.release()
+            raise
+
+        response.stream = ReleasingStream(response.stream, self.limit.release)
+        return response
+
+    async def _send(self, request):
+        transport = self._transport()
+        attempt = 0
+        while True:
+            self.stats["requests"] += 1
+            try:
+                response = await transport.handle_async_request(request)
+            except httpx.TransportError:
+                if attempt >= self.max_retries:
+                    raise
+                self.stats["retries"] += 1
+                await asyncio.sleep(backoff_delay(attempt))
+                attempt += 1
+                continue
+
+            if response.status_code not in RETRY_STATUSES or attempt >= self.max_retries:
+                return response
+
+            if response.status_code == 429:
+                self.stats["rate_limited"] += 1
+            self.stats["retries"] += 1
+            delay = backoff_delay(attempt, response)
+            await response.aclose()
+            print(
+                f"LLM request got {response.status_code}, retrying in {delay:.1f}s "
+                f"(attempt {attempt + 1}/{self.max_retries})"
+            )
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def aclose(self):
+        for transport in list(self._transports.values()):
+            await transport.aclose()
+
+
+def token_usage(response):
+    """Return (prompt_tokens, completion_tokens) reported in an LLMResult."""
+    generation = response.generations[0][0] if response.generations else None
+    usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+
+    if usage:
+        return usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+    if response.llm_output and response.llm_output.get("token_usage"):
+        token_usage = response.llm_output["token_usage"]
+        return token_usage.get("prompt_tokens", 0), token_usage.get("completion_tokens", 0)
+    return 0, 0
+
+
+class LLMCallTracer(BaseCallbackHandler):
+    """Traces each LLM round trip as a span, with the model and tokens used."""
+
+    # Inline, so the span's parent is the stage that made the call
+    run_inline = True
+
+    def __init__(self):
+        self._spans = {}
+
+    def _start(self, run_id, kwargs):
+        params = kwargs.get("invocation_params") or {}
+        model = params.get("model") or params.get("model_name")
+        self._spans[run_id] = Span("llm.call", model=model).start()
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._start(run_id, kwargs)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._start(run_id, kwargs)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        span = self._spans.pop(run_id, None)
+        if span is None:
+            return
+        prompt_tokens, completion_tokens = token_usage(response)
+        model = span.attributes.get("model", "")
+        llm_tokens.inc(prompt_tokens, model=model, type="prompt")
+        llm_tokens.inc(completion_tokens, model=model, type="completion")
+        span.set(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+        span.end()
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        span = self._spans.pop(run_id, None)
+        if span is not None:
+            span.end(error)
+
+
+llm_tracer = LLMCallTracer()
+
+transport = GatewayTransport()
+# Shared by every chat model, the SDKs' own retries are off so only the
+# transport retries, and it does so under the global limit
+http_client = httpx.AsyncClient(transport=transport, timeout=LLM_TIMEOUT)
+
+
+def model_for(task):
+    """Return (provider, model) for `task`, see `TASK_MODELS`."""
+    spec = TASK_MODELS.get(task, DEFAULT_MODEL)
+    provider, _, model = spec.partition(":")
+    if not model:
+        provider, model = "openai", spec
+    return provider, model
+
+
+def get_llm(task=None, **kwargs):
+    """
+    A new chat model for `task`, talking through the shared HTTP client.
+
+    Each caller gets its own instance, so callbacks set on one (e.g. a run budget)
+    don't leak into others, while connections and the concurrency limit are shared.
+    """
+    provider, model = model_for(task)
+
+    if provider == "openai":
+        from langchain_openai import ChatOpenAI
+
+        # Streamed responses only report token usage when asked to
+        kwargs.setdefault("stream_usage", True)
+        return ChatOpenAI(
+            model=model,
+            http_async_client=http_client,
+            max_retries=0,
+            callbacks=[llm_tracer],
+            **kwargs,
+        )
+
+    if provider == "groq":
+        try:
+            from langchain_groq import ChatGroq
+        except ImportError:
+            raise ImportError(
+                f"{task} is routed to Groq ({model}), install langchain-groq to use it"
+            )
+
+        return ChatGroq(
+            model=model,
+            http_async_client=http_client,
+            max_retries=0,
+            callbacks=[llm_tracer],
+            **kwargs,
+        )
+
+    raise ValueError(f"Unknown LLM provider '{provider}' for task {task}")
+
+
+def gateway_stats():
+    """Counters of the shared client, for monitoring."""
+    return {
+        "in_flight": transport.limit.in_use,
+        "waiting": transport.limit.waiting,
+        **transport.stats,
+    }
+
+
+metrics.callback(
+    "llm_requests_in_flight",
+    "LLM requests holding a slot under the concurrency limit",
+    lambda: transport.limit.in_use,
+)
+metrics.callback(
+    "llm_requests_waiting",
+    "LLM requests waiting for a slot under the concurrency limit",
+    lambda: transport.limit.waiting,
+)
+metrics.callback(
+    "llm_retries_total",
+    "LLM requests retried after a rate limit or transient error",
+    lambda: transport.stats["retries"],
+    kind="counter",
+)
+metrics.callback(
+    "llm_rate_limited_total",
+    "LLM responses that were rate limited (429)",
+    lambda: transport.stats["rate_limited"],
+    kind="counter",
+)
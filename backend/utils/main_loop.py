@@ -0,0 +1,42 @@
+import asyncio
+import functools
+
+_main_loop = None
+
+
+def set_main_loop(loop):
+    """Remember the server's event loop (the one hypercorn and the agents run on)."""
+    global _main_loop
+    _main_loop = loop
+
+
+def get_main_loop():
+    return _main_loop
+
+
+async def run_on_main_loop(coro):
+    """
+    Await `coro` on the main event loop, from whichever loop or thread we're on.
+
+    Flask runs each async view on a short-lived loop of its own, but subprocesses,
+    MCP sessions and other long-lived resources belong to the main loop and must
+    only be touched from it.
+    """
+    if (
+        _main_loop is None
+        or not _main_loop.is_running()
+        or asyncio.get_running_loop() is _main_loop
+    ):
+        return await coro
+
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, _main_loop))
+
+
+def on_main_loop(func):
+    """Decorator for coroutine functions that must always run on the main loop."""
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run_on_main_loop(func(*args, **kwargs))
+
+    return wrapper
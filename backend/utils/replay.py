@@ -0,0 +1,265 @@
+import hashlib
+import json
+import os
+import re
+import time
+from collections import Counter
+from difflib import SequenceMatcher
+
+from .storage import SQLiteStore
+
+DEFAULT_REPLAY_PATH = os.getenv("REPLAY_SCRIPTS_PATH", "cache/replay_scripts.sqlite3")
+# How close the page must end up to the recorded run's final page for a replay to pass
+REPLAY_MIN_SIMILARITY = float(os.getenv("REPLAY_MIN_SIMILARITY", "0.9"))
+
+REF_PATTERN = re.compile(r"\s*\[ref=([^\]]+)\]")
+# Tool arguments that hold element refs from the page snapshot
+REF_ARGUMENTS = ("ref", "startRef", "endRef")
+# Tools that only look at the page or browser, so replaying them is pointless
+OBSERVATION_TOOLS = {
+    "browser_snapshot",
+    "browser_take_screenshot",
+    "browser_screen_capture",
+    "browser_console_messages",
+    "browser_network_requests",
+    "browser_tab_list",
+    "browser_close",
+}
+
+
+def test_key(page_url, interaction_description, expected_result):
+    """Key of a test case in the script store."""
+    return hashlib.sha256(
+        json.dumps([page_url, interaction_description, expected_result]).encode("utf-8")
+    ).hexdigest()
+
+
+def result_text(result):
+    """Text content of an MCP tool result."""
+    return "\n".join(
+        getattr(content, "text", "") for content in getattr(result, "content", None) or []
+    )
+
+
+def snapshot_lines(text):
+    """Lines of the accessibility snapshot in a tool result, or [] if it holds none."""
+    match = re.search(r"```yaml\n(.*?)```", text, re.DOTALL)
+    if match:
+        return match.group(1).splitlines()
+    return [line for line in text.splitlines() if REF_PATTERN.search(line)]
+
+
+def element_signature(line):
+    """A snapshot line without its ref and indentation, e.g. 'button "Add Element"'."""
+    return REF_PATTERN.sub("", line).strip().lstrip("- ").rstrip(":")
+
+
+def locate_ref(lines, ref):
+    """Return (signature, occurrence) of the element with `ref`, or None."""
+    signatures = []
+    for line in lines:
+        signature = element_signature(line)
+        match = REF_PATTERN.search(line)
+        if match and match.group(1) == ref:
+            return signature, signatures.count(signature)
+        signatures.append(signature)
+    return None
+
+
+def find_ref(lines, signature, occurrence):
+    """Return the ref of the `occurrence`-th element matching `signature`, or None."""
+    seen = 0
+    for line in lines:
+        match = REF_PATTERN.search(line)
+        if element_signature(line) != signature:
+            continue
+        if seen == occurrence:
+            return match.group(1) if match else None
+        seen += 1
+    return None
+
+
+def normalize_snapshot(lines):
+    """Snapshot lines with refs removed, for comparing page states across runs."""
+    return [REF_PATTERN.sub("", line).rstrip() for line in lines]
+
+
+def snapshot_changes(before, after):
+    """
+    The lines (refs and indentation removed) added to and removed from a page.
+
+    Returns {"added": [...], "removed": [...]}, repeated lines counted as often as
+    they were added or removed.
+    """
+    before = Counter(element_signature(line) for line in before)
+    after = Counter(element_signature(line) for line in after)
+    return {
+        "added": sorted((after - before).elements()),
+        "removed": sorted((before - after).elements()),
+    }
+
+
+def missing_changes(expected, actual):
+    """Lines of `expected` changes that aren't among the `actual` ones, as a report."""
+    missing = []
+    for kind in ("added", "removed"):
+        for line in (Counter(expected[kind]) - Counter(actual[kind])).elements():
+            missing.append(f"{kind} '{line}'")
+    return missing
+
+
+class ScriptRecorder:
+    """
+    Tool listener that records a run's browser actions as a replayable script.
+
+    Element refs only mean something within one page load, so each ref an action
+    used is stored as the signature of its line in the latest snapshot, and is
+    looked up again in the live page on replay. The lines the run's actions added
+    to or removed from the page, between its first and last snapshot, are kept
+    as what a replay must reproduce.
+    """
+
+    def __init__(self):
+        self.steps = []
+        self.first_lines = None
+        self.lines = []
+        self.complete = True
+
+    def __call__(self, name, arguments, result, error, seconds):
+        # Failed calls changed nothing the rest of the run relies on
+        if error is not None or getattr(result, "isError", False):
+            return
+
+        if name not in OBSERVATION_TOOLS:
+            targets = {}
+            for key in REF_ARGUMENTS:
+                if key in arguments:
+                    target = locate_ref(self.lines, arguments[key])
+                    if target is None:
+                        self.complete = False
+                    targets[key] = target
+            self.steps.append({"tool": name, "arguments": arguments, "targets": targets})
+
+        lines = snapshot_lines(result_text(result))
+        if lines:
+            if self.first_lines is None:
+                self.first_lines = lines
+            self.lines = lines
+
+    def script(self):
+        """The recorded script, or None if the run can't be replayed."""
+        if not self.complete or not self.steps or self.first_lines is None:
+            return None
+        return {
+            "steps": self.steps,
+            "final_snapshot": normalize_snapshot(self.lines),
+            "changes": snapshot_changes(self.first_lines, self.lines),
+        }
+
+
+async def replay_script(call_tool, script, min_similarity=REPLAY_MIN_SIMILARITY):
+    """
+    Replay a recorded script with `call_tool(name, arguments)`, without an LLM.
+
+    Returns (passed, report). The replay fails as soon as an element can't be found
+    or a tool call errors. It passes only if the actions add and remove the same
+    lines of the page as in the recorded run, and the page ends up in (nearly)
+    the same state. Scripts recorded without their changes are never passed.
+    """
+    if "changes" not in script:
+        return False, "The script was recorded without the changes its actions made"
+
+    lines = None
+    first_lines = None
+
+    for step in script["steps"]:
+        arguments = dict(step["arguments"])
+        for key, (signature, occurrence) in step["targets"].items():
+            if lines is None:
+                lines = snapshot_lines(result_text(await call_tool("browser_snapshot", {})))
+                first_lines = first_lines or lines
+            ref = find_ref(lines, signature, occurrence)
+            if ref is None:
+                return False, f"Element '{signature}' is no longer on the page"
+            arguments[key] = ref
+
+        result = await call_tool(step["tool"], arguments)
+        if getattr(result, "isError", False):
+            return False, f"{step['tool']} failed: {result_text(result)[:200]}"
+
+        # Refs from before an action may be stale, take a new snapshot if needed
+        lines = snapshot_lines(result_text(result)) or None
+        first_lines = first_lines or lines
+
+    if lines is None:
+        lines = snapshot_lines(result_text(await call_tool("browser_snapshot", {})))
+
+    missing = missing_changes(script["changes"], snapshot_changes(first_lines or [], lines))
+    if missing:
+        return (
+            False,
+            "The actions didn't change the page as in the recorded passing run: "
+            f"not {', '.join(missing[:5])}",
+        )
+
+    similarity = SequenceMatcher(
+        None, script["final_snapshot"], normalize_snapshot(lines)
+    ).ratio()
+    if similarity < min_similarity:
+        return (
+            False,
+            f"The page ended up {similarity:.0%} similar to the recorded passing run",
+        )
+
+    return (
+        True,
+        f"Replayed {len(script['steps'])} recorded step(s) of an earlier passing run; "
+        f"the final page matched it ({similarity:.0%} similar)",
+    )
+
+
+class ReplayStore(SQLiteStore):
+    """Recorded scripts of passing test runs, keyed by `test_key`."""
+
+    SCHEMA = (
+        """
+        CREATE TABLE IF NOT EXISTS scripts (
+            key TEXT PRIMARY KEY,
+            script TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            replays INTEGER NOT NULL DEFAULT 0,
+            last_replayed_at REAL
+        )
+        """,
+    )
+
+    def __init__(self, path=DEFAULT_REPLAY_PATH):
+        super().__init__(path)
+
+    def get(self, key):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT script FROM scripts WHERE key = ?", (key,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, key, script):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO scripts (key, script, created_at) VALUES (?, ?, ?)",
+                (key, json.dumps(script), time.time()),
+            )
+            self._db.commit()
+
+    def mark_replayed(self, key):
+        with self._lock:
+            self._db.execute(
+                "UPDATE scripts SET replays = replays + 1, last_replayed_at = ? WHERE key = ?",
+                (time.time(), key),
+            )
+            self._db.commit()
+
+    def delete(self, key):
+        with self._lock:
+            self._db.execute("DELETE FROM scripts WHERE key = ?", (key,))
+            self._db.commit()
@@ -0,0 +1,43 @@
+import sqlite3
+import threading
+from pathlib import Path
+
+# The backend directory. Relative paths in the configuration are resolved against
+# it, not against whatever directory the app was started from
+APP_ROOT = Path(__file__).resolve().parent.parent
+
+
+def app_path(path):
+    """`path` resolved against APP_ROOT, unless it is absolute."""
+    return APP_ROOT / path
+
+
+class SQLiteStore:
+    """
+    A SQLite database opened on first use, so building its owner touches no files.
+
+    Subclasses list the statements creating their tables in `SCHEMA`, and reach
+    the connection as `self._db` while holding `self._lock`.
+    """
+
+    SCHEMA = ()
+    row_factory = None
+
+    def __init__(self, path):
+        self.path = app_path(path)
+        self._lock = threading.Lock()
+        self._open_lock = threading.Lock()
+        self._connection = None
+
+    @property
+    def _db(self):
+        with self._open_lock:
+            if self._connection is None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                connection = sqlite3.connect(self.path, check_same_thread=False)
+                connection.row_factory = self.row_factory
+                for statement in self.SCHEMA:
+                    connection.execute(statement)
+                connection.commit()
+                self._connection = connection
+        return self._connection
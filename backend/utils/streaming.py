@@ -0,0 +1,183 @@
+import asyncio
+import json
+from functools import partial
+from hypercorn.app_wrappers import WSGIWrapper
+from werkzeug.exceptions import MethodNotAllowed, NotFound
+from werkzeug.routing import Map, Rule
+from werkzeug.test import EnvironBuilder
+
+from .telemetry import Span, http_request_seconds
+
+async def wait_for_disconnect(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+class StreamingRoutes:
+    """
+    ASGI app serving streamed responses on the event loop, and everything else with Flask.
+
+    Hypercorn runs a WSGI app's views on a handful of executor threads, and a
+    streamed response holds its thread until the stream ends, whether or not the
+    client is still there. Views registered with `route` are async instead. They
+    take a werkzeug request plus the URL's variables, and return either a
+    (json, status) error or an async iterator of the response's text chunks,
+    which is closed as soon as the client disconnects.
+    """
+
+    def __init__(self, wsgi_app, allow_headers=(), max_body_size=16 * 1024 * 1024):
+        self.wsgi = WSGIWrapper(wsgi_app, max_body_size)
+        self.allow_headers = ", ".join(allow_headers)
+        self.url_map = Map()
+        self.views = {}
+
+    def route(self, rule, methods, mimetype, headers=None):
+        def decorator(view):
+            self.url_map.add(Rule(rule, endpoint=view.__name__, methods=methods))
+            self.views[view.__name__] = (view, rule, mimetype, headers or {})
+            return view
+
+        return decorator
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self.lifespan(receive, send)
+
+        if scope["type"] == "http":
+            try:
+                endpoint, values = self.url_map.bind("").match(
+                    scope["path"], method=scope["method"]
+                )
+            except MethodNotAllowed as e:
+                if scope["method"] == "OPTIONS":
+                    return await self.preflight(send, e.valid_methods)
+            except NotFound:
+                pass
+            else:
+                return await self.serve(endpoint, values, scope, receive, send)
+
+        loop = asyncio.get_running_loop()
+
+        def call_soon(func, *args):
+            return asyncio.run_coroutine_threadsafe(func(*args), loop).result()
+
+        await self.wsgi(
+            scope, receive, send, partial(loop.run_in_executor, None), call_soon
+        )
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    def cors_headers(self, headers=None):
+        headers = {"Access-Control-Allow-Origin": "*", **(headers or {})}
+        return [
+            (name.lower().encode("latin-1"), value.encode("latin-1"))
+            for name, value in headers.items()
+        ]
+
+    async def preflight(self, send, methods):
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 204,
+                "headers": self.cors_headers(
+                    {
+                        "Access-Control-Allow-Methods": ", ".join([*methods, "OPTIONS"]),
+                        "Access-Control-Allow-Headers": self.allow_headers,
+                    }
+                ),
+            }
+        )
+        await send({"type": "http.response.body", "body": b""})
+
+    async def serve(self, endpoint, values, scope, receive, send):
+        view, rule, mimetype, headers = self.views[endpoint]
+
+        body = bytearray()
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            body.extend(message.get("body", b""))
+            if not message.get("more_body"):
+                break
+
+        request = EnvironBuilder(
+            path=scope["path"],
+            method=scope["method"],
+            query_string=scope["query_string"].decode("latin-1"),
+            headers=[
+                (name.decode("latin-1"), value.decode("latin-1"))
+                for name, value in scope["headers"]
+            ],
+            data=bytes(body),
+        ).get_request()
+
+        span = Span("http.request", method=scope["method"], route=rule)
+        status = 500
+        try:
+            with span:
+                try:
+                    response = await view(request, **values)
+                    if isinstance(response, tuple):
+                        status = response[1]
+                        await self.send_json(send, *response)
+                    else:
+                        status = 200
+                        await self.stream(send, receive, response, mimetype, headers)
+                finally:
+                    span.set(status=status)
+        finally:
+            http_request_seconds.observe(
+                span.duration, method=scope["method"], route=rule, status=status
+            )
+
+    async def send_json(self, send, data, status):
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status,
+                "headers": self.cors_headers({"Content-Type": "application/json"}),
+            }
+        )
+        await send({"type": "http.response.body", "body": json.dumps(data).encode()})
+
+    async def stream(self, send, receive, chunks, mimetype, headers):
+        """Send `chunks` as they come, until they run out or the client disconnects."""
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": self.cors_headers({"Content-Type": mimetype, **headers}),
+            }
+        )
+
+        disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+        try:
+            while True:
+                next_chunk = asyncio.ensure_future(anext(chunks))
+                await asyncio.wait(
+                    {next_chunk, disconnected}, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not next_chunk.done():
+                    # Stop the view where it is waiting, so its cleanup runs now
+                    next_chunk.cancel()
+                    await asyncio.wait({next_chunk})
+                    return
+                try:
+                    chunk = next_chunk.result()
+                except StopAsyncIteration:
+                    break
+                await send(
+                    {"type": "http.response.body", "body": chunk.encode(), "more_body": True}
+                )
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            disconnected.cancel()
+            await chunks.aclose()
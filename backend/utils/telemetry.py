@@ -0,0 +1,308 @@
+import collections
+import contextvars
+import os
+import secrets
+import threading
+import time
+
+# How many finished spans are kept for /traces
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "5000"))
+
+# Agent runs take minutes, so the buckets reach well past the usual web latencies
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600,
+)
+
+METRIC_PREFIX = "ironhyde_"
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(
+        f'{name}="{escape_label(value)}"' for name, value in zip(names, values)
+    ) + "}"
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = METRIC_PREFIX + name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        return tuple(labels.get(name, "") for name in self.labels)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        with self._lock:
+            values = dict(self._values)
+        return self.header() + [
+            f"{self.name}{format_labels(self.labels, key)} {value}"
+            for key, value in values.items()
+        ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class CallbackGauge(Metric):
+    """A gauge (or counter) whose value is read from `read()` at scrape time."""
+
+    def __init__(self, name, help, read, kind="gauge"):
+        super().__init__(name, help)
+        self.read = read
+        self.kind = kind
+
+    def render(self):
+        try:
+            value = self.read()
+        except Exception as e:
+            print(f"Error reading metric {self.name}: {e}")
+            return []
+        return self.header() + [f"{self.name} {value}"]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            if key not in self._values:
+                # Per bucket counts, sum and count of the observations
+                self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            entry = self._values[key]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self):
+        with self._lock:
+            values = {
+                key: (list(counts), total, count)
+                for key, (counts, total, count) in self._values.items()
+            }
+
+        lines = self.header()
+        for key, (counts, total, count) in values.items():
+            for bound, bucket_count in zip(self.buckets + ("+Inf",), counts + [count]):
+                labels = format_labels(self.labels + ("le",), key + (bound,))
+                lines.append(f"{self.name}_bucket{labels} {bucket_count}")
+            labels = format_labels(self.labels, key)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self.register(Counter(name, help, labels))
+
+    def gauge(self, name, help, labels=()):
+        return self.register(Gauge(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def callback(self, name, help, read, kind="gauge"):
+        return self.register(CallbackGauge(name, help, read, kind))
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+span_seconds = metrics.histogram(
+    "span_duration_seconds", "Duration of each traced stage", labels=("span", "status")
+)
+spans_in_flight = metrics.gauge(
+    "spans_in_flight", "Traced stages currently running", labels=("span",)
+)
+http_request_seconds = metrics.histogram(
+    "http_request_duration_seconds",
+    "Duration of HTTP requests to the app",
+    labels=("method", "route", "status"),
+)
+llm_tokens = metrics.counter(
+    "llm_tokens_total", "LLM tokens used", labels=("model", "type")
+)
+
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+def parse_traceparent(traceparent):
+    """Return (trace_id, parent_span_id) from a W3C traceparent, or (None, None)."""
+    parts = (traceparent or "").split("-")
+    if len(parts) == 4 and len(parts[1]) == 32 and len(parts[2]) == 16:
+        return parts[1], parts[2]
+    return None, None
+
+
+class SpanRecorder:
+    """The most recent finished spans, for looking up where a run spent its time."""
+
+    def __init__(self, size=TRACE_BUFFER_SIZE):
+        self._lock = threading.Lock()
+        self._spans = collections.deque(maxlen=size)
+
+    def add(self, span):
+        with self._lock:
+            self._spans.append(span.to_dict())
+
+    def find(self, trace_id=None, run_id=None, limit=None):
+        """Finished spans of a trace or run, oldest first."""
+        with self._lock:
+            spans = list(self._spans)
+
+        if trace_id:
+            spans = [s for s in spans if s["trace_id"] == trace_id]
+        if run_id:
+            # Spans of a run are spread over traces (one per HTTP call), so the
+            # run's traces are collected from the spans that carry its ID
+            traces = {s["trace_id"] for s in spans if s["attributes"].get("run_id") == run_id}
+            spans = [s for s in spans if s["trace_id"] in traces]
+
+        spans.sort(key=lambda s: s["start"])
+        return spans[-limit:] if limit else spans
+
+
+recorder = SpanRecorder()
+
+
+class Span:
+    """
+    A timed stage of a request, e.g. an agent run or one MCP tool call.
+
+    Use it as a (sync or async) context manager to make it the parent of the
+    spans started inside it, or call `start()` and `end()` when it doesn't
+    nest, e.g. from callbacks. `parent` is a traceparent from another process;
+    by default the current span is the parent. Finished spans feed the latency
+    histograms and the trace buffer.
+    """
+
+    def __init__(self, name, parent=None, **attributes):
+        self.name = name
+        self.attributes = {k: v for k, v in attributes.items() if v is not None}
+        self.span_id = secrets.token_hex(8)
+
+        trace_id, parent_id = parse_traceparent(parent)
+        if trace_id is None:
+            current = _current_span.get()
+            if current is not None:
+                trace_id, parent_id = current.trace_id, current.span_id
+        self.trace_id = trace_id or secrets.token_hex(16)
+        self.parent_id = parent_id
+
+        self.start_time = None
+        self.duration = None
+        self.error = None
+        self._previous = None
+
+    @property
+    def traceparent(self):
+        """This span as a W3C traceparent, to continue the trace in another process."""
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def set(self, **attributes):
+        self.attributes.update({k: v for k, v in attributes.items() if v is not None})
+
+    def start(self):
+        self.start_time = time.time()
+        self._started = time.monotonic()
+        spans_in_flight.inc(span=self.name)
+        return self
+
+    def end(self, error=None):
+        if self.duration is not None:
+            return
+        self.duration = time.monotonic() - self._started
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+        status = "error" if self.error else "ok"
+
+        spans_in_flight.dec(span=self.name)
+        span_seconds.observe(self.duration, span=self.name, status=status)
+        recorder.add(self)
+
+    def __enter__(self):
+        self.start()
+        self._previous = _current_span.get()
+        _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Restored by value: the span may end in a copy of the context it began in
+        _current_span.set(self._previous)
+        self.end(exc)
+        return False
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return self.__exit__(exc_type, exc, tb)
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": self.start_time,
+            "seconds": round(self.duration, 4) if self.duration is not None else None,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+def current_traceparent():
+    """The current span as a traceparent, or None outside any span."""
+    current = _current_span.get()
+    return current.traceparent if current else None
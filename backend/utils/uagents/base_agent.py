@@ -1,14 +1,122 @@
 from uagents import Agent, Context
 import time
-import os, json, re
-from langchain_openai import ChatOpenAI
-from langchain_groq import ChatGroq
+import asyncio
+import os, json
+import functools
+import shlex
+import shutil
+import tempfile
+from contextlib import asynccontextmanager
+from langchain_core.messages import HumanMessage
+from langchain_core.tools import StructuredTool, ToolException
+from mcp.types import TextContent
 from mcp_use import MCPAgent, MCPClient
+from pydantic.v1 import ValidationError, create_model
+from ..events import events
+from ..json_extract import json_candidates, parse_model, string_array
+from ..llm_gateway import get_llm, token_usage
+from ..telemetry import Span
+from .budget import DEFAULT_MAX_STEPS
+
+# Playwright MCP release the agents are built against
+PLAYWRIGHT_MCP_VERSION = os.getenv("PLAYWRIGHT_MCP_VERSION", "0.0.26")
+
+# The server installed next to the backend (see the Dockerfile), so startup
+# neither waits on nor needs the npm registry
+PLAYWRIGHT_MCP_BIN = os.getenv(
+    "PLAYWRIGHT_MCP_BIN",
+    os.path.join(
+        os.path.dirname(__file__), "..", "..", "node_modules", ".bin", "mcp-server-playwright"
+    ),
+)
+
+# Command that starts the Playwright MCP server, browser flags are appended to it.
+# Without a local install, npx fetches the pinned release once and reuses it.
+# Benchmarks point it at a stand-in server, see bench/stub_mcp.py
+PLAYWRIGHT_MCP_COMMAND = os.getenv("PLAYWRIGHT_MCP_COMMAND") or (
+    shlex.quote(os.path.normpath(PLAYWRIGHT_MCP_BIN))
+    if os.path.exists(PLAYWRIGHT_MCP_BIN)
+    else f"npx -y @playwright/mcp@{PLAYWRIGHT_MCP_VERSION}"
+)
+
+# Playwright MCP flag for each execution mode. Snapshot mode works from the
+# accessibility tree, vision mode from screenshots of every step
+EXECUTION_MODES = {"snapshot": None, "vision": "--vision"}
+DEFAULT_EXECUTION_MODE = os.getenv("AGENT_EXECUTION_MODE", "snapshot")
+
+# How much of a final message without valid JSON is sent to be repaired
+JSON_REPAIR_MAX_CHARS = int(os.getenv("JSON_REPAIR_MAX_CHARS", "8000"))
+
+# Tool the agent calls with its final answer, see `PooledMCPSession.add_verdict_tool`
+VERDICT_TOOL = "submit_result"
+
+# Request fields copied onto an agent request's span
+TRACE_FIELDS = ("run_id", "test_id", "page_url", "target_page", "start_page", "mode")
+
+SNAPSHOT_MODE_INSTRUCTIONS = (
+    "Read the page with browser_snapshot and interact with elements through the refs it returns. "
+    "Only call browser_take_screenshot when a check depends on how the page looks "
+    "(layout, colours, images or other visual state) and cannot be decided from the snapshot. "
+    "You get a description of the screenshot back. "
+)
+
+# mcp_use would pass screenshots to the agent's LLM as base64 text it can't read,
+# so a vision model describes them instead, see `PooledMCPSession.describe_images`
+SCREENSHOT_PROMPT = (
+    "This is a screenshot of a web page, for a QA tester who cannot see it. "
+    "Describe the page's layout, colours, images and visible text, and anything that "
+    "looks broken, overlapping or out of place. "
+    "Give the approximate x, y pixel coordinates of its buttons, links and inputs."
+)
+
+
+def with_profile_dir(config, profile_dir):
+    """
+    `config` with each MCP server's browser using its own profile in `profile_dir`.
+
+    Playwright MCP otherwise shares one persistent profile between every browser
+    it starts, and concurrent browsers on one profile collide.
+    """
+    return {
+        **config,
+        "mcpServers": {
+            name: {**server, "args": [*server.get("args", []), "--user-data-dir", profile_dir]}
+            for name, server in config["mcpServers"].items()
+        },
+    }
+
+
+def verdict_schema(response_model):
+    """
+    A model of the fields the agent itself must fill in for `response_model`.
+
+    Optional fields such as usage are filled in by the server, so only the
+    required ones are asked of the LLM.
+    """
+    return create_model(
+        f"{response_model.__name__}Verdict",
+        **{
+            name: (field.outer_type_, ...)
+            for name, field in response_model.__fields__.items()
+            if field.required
+        },
+    )
 
 
 class BaseAgent:
+    # Kind of work the agent's browsing LLM does, see `llm_gateway.TASK_MODELS`
+    llm_task = "verdict"
+    # Response model the agent submits its final answer as, with a description of
+    # what to put in it. Agents without one answer in free text
+    verdict_model = None
+    verdict_description = ""
+
     def __init__(self, name: str, seed: str, port_number: int, readme_path: str):
         self.name = name
+        self.port_number = port_number
+        # Path of the agent's REST endpoint, see `rest_endpoint`
+        self.endpoint = f"/agent/{name}"
+        self.request_model = None
 
         # 1. Create the agent instance
         self.agent = Agent(
@@ -19,7 +127,8 @@ class BaseAgent:
             readme_path=readme_path,
         )
 
-        print(self.agent._readme)
+        # Set once the startup handlers, e.g. browser pool warm-up, have finished
+        self.warm = asyncio.Event()
 
         # Register the default startup handler
         @self.agent.on_event("startup")
@@ -42,30 +151,118 @@ class BaseAgent:
 
     async def run_async(self):
         """Run the agent"""
+
+        # Registered last, so it runs after every other startup handler
+        @self.agent.on_event("startup")
+        async def mark_warm(ctx: Context):
+            self.warm.set()
+
         await self.agent.run_async()
 
+    def rest_endpoint(self, request_model, response_model):
+        """
+        Decorator registering a handler as the agent's traced REST endpoint.
+
+        The same handler serves in-process calls through `handle`.
+        """
+
+        def register(handler):
+            self.request_model = request_model
+            return self.agent.on_rest_post(self.endpoint, request_model, response_model)(
+                self.traced(handler)
+            )
+
+        return register
+
+    async def handle(self, payload):
+        """
+        Run the REST endpoint's handler on a JSON payload, without going over HTTP.
+
+        The payload is validated like a REST request, and the response is returned
+        as a dict, as the REST endpoint would have encoded it.
+        """
+        request = self.request_model.parse_obj(payload)
+        response = await self.agent.handle_rest("POST", self.endpoint, request)
+        return response.dict() if hasattr(response, "dict") else response
+
+    def traced(self, handler):
+        """
+        Wrap a REST handler to trace each request as a span.
+
+        The span continues the caller's trace from the request's `traceparent`
+        and carries its page and test IDs, and the token usage of the response.
+        """
+
+        @functools.wraps(handler)
+        async def run(ctx, request):
+            with Span(
+                f"agent.{self.name}",
+                parent=getattr(request, "traceparent", None),
+                agent=self.name,
+                **{field: getattr(request, field, None) for field in TRACE_FIELDS},
+            ) as span:
+                response = await handler(ctx, request)
+                usage = getattr(response, "usage", None)
+                if usage is not None:
+                    span.set(**usage.dict())
+                return response
+
+        return run
+
     def get_array_from_md(self, input):
-        pattern = r'\[\s*"[^"]*"(?:\s*,\s*"[^"]*")*\s*\]'
-        match = re.search(pattern, input)
-        if match:
-            array_str = match.group(0)
-            return json.loads(array_str)
-        return []
+        """Return the first JSON array of strings in the text, or []."""
+        return string_array(input)
 
     def extract_json_from_response(self, response):
-        """Extract any valid JSON object from a text response containing markdown and other content."""
-        pattern = r"(?<=```json\s).*?(?=\s*```)"
-        match = re.search(pattern, response, re.DOTALL)
-        if match:
-            json_str = match.group(0)
-            # Validate that it's proper JSON
-            try:
-                parsed_json = json.loads(json_str)
-                return parsed_json
-            except json.JSONDecodeError:
-                return "Invalid JSON found"
-        else:
-            return {}
+        """Extract the most likely JSON object from a text response containing markdown and other content."""
+        for candidate in json_candidates(response):
+            if isinstance(candidate, dict):
+                return candidate
+        return {}
+
+    async def parse_agent_output(self, text, response_model, repair=True):
+        """
+        Return the agent's answer as a `response_model` instance, or None.
+
+        Every JSON object in the text is tried against the model. If none fits and
+        `repair` is set, a small model is asked to restate the final message as
+        JSON, which is far cheaper than rerunning the agent.
+        """
+        parsed = parse_model(text, response_model)
+        # mcp_use reports failed runs as text, there is no verdict to recover there
+        if parsed is None and repair and text and not text.startswith("Agent stopped"):
+            parsed = await self.repair_json(text, response_model)
+        return parsed
+
+    async def repair_json(self, text, response_model):
+        """Have a small model rewrite `text` as JSON for `response_model`. Only that text is sent."""
+        schema = verdict_schema(response_model).schema()
+
+        try:
+            reply = await get_llm("json_repair", temperature=0).ainvoke(
+                [
+                    (
+                        "system",
+                        "Rewrite the user's message as a single JSON object matching this JSON schema. "
+                        "Use only information from the message. Respond with the JSON only.\n"
+                        f"{json.dumps(schema)}",
+                    ),
+                    ("user", text[-JSON_REPAIR_MAX_CHARS:]),
+                ]
+            )
+        except Exception as e:
+            print(f"JSON repair failed: {e}")
+            return None
+
+        return parse_model(reply.content, response_model)
+
+    def has_verdict(self, response_model):
+        """Return a check for whether text holds JSON that validates as `response_model`."""
+
+        def check(text):
+            return parse_model(text, response_model) is not None
+
+        return check
 
     def initialize_llm(self):
         key = os.getenv("OPENAI_API_KEY")
@@ -73,37 +270,415 @@ class BaseAgent:
             print("❌ OPENAI_API_KEY not found in environment.")
             raise ValueError
 
-        self.llm = ChatOpenAI(model="gpt-4o", openai_api_key=key)
+        self.llm = get_llm(self.llm_task, openai_api_key=key)
+
+    def tool_step_publisher(self, run_id, **context):
+        """Return a pool tool listener that publishes each MCP step to `run_id`."""
+        if not run_id:
+            return None
+
+        def publish(name, arguments, result, error, seconds):
+            events.publish(
+                run_id,
+                "tool_step",
+                agent=self.name,
+                tool=name,
+                arguments=arguments,
+                seconds=round(seconds, 3),
+                error=str(error) if error else None,
+                is_error=error is not None or bool(getattr(result, "isError", False)),
+                **context,
+            )
+
+        return publish
+
+    def mcp_config(self, additional_arg=None, display=":1", headless=True):
+        command, *args = shlex.split(PLAYWRIGHT_MCP_COMMAND)
 
-    def init_mcp(self, additional_arg=None):
-        args = [
-            "@playwright/mcp@latest",
-            "--headless",
-        ]
+        if headless:
+            args.append("--headless")
 
         if additional_arg:
             args.append(additional_arg)
 
         # Create configuration dictionary
-        config = {
+        return {
             "mcpServers": {
                 "playwright": {
-                    "command": "npx",
+                    "command": command,
                     "args": args,
-                    "env": {"DISPLAY": ":1"},
+                    "env": {"DISPLAY": display},
                 }
             }
         }
 
-        # Create MCPClient from configuration dictionary
-        client = MCPClient.from_dict(config)
+    def create_mcp_pool(
+        self, additional_arg=None, display=":1", headless=True, min_size=None
+    ):
+        return MCPSessionPool(
+            self.mcp_config(additional_arg, display, headless),
+            min_size=(
+                int(os.getenv("MCP_POOL_MIN_SIZE", "1")) if min_size is None else min_size
+            ),
+            max_size=int(os.getenv("MCP_POOL_MAX_SIZE", "3")),
+            llm_task=self.llm_task,
+            verdict_model=self.verdict_model,
+            verdict_description=self.verdict_description,
+        )
+
+    def init_mcp(
+        self, additional_arg=None, display=":1", headless=True, min_size=None
+    ):
+        self.mcp_pool = self.create_mcp_pool(additional_arg, display, headless, min_size)
+        self.register_mcp_pools([self.mcp_pool])
+
+    def init_mcp_modes(self, display=":1", headless=True):
+        """
+        Create a session pool per execution mode, see `EXECUTION_MODES`.
+
+        Only the default mode's pool is warmed up at startup, the others start
+        browsers on first use.
+        """
+        self.mcp_pools = {
+            mode: self.create_mcp_pool(
+                additional_arg,
+                display,
+                headless,
+                min_size=None if mode == DEFAULT_EXECUTION_MODE else 0,
+            )
+            for mode, additional_arg in EXECUTION_MODES.items()
+        }
+        self.mcp_pool = self.mcp_pools[DEFAULT_EXECUTION_MODE]
+        self.register_mcp_pools(list(self.mcp_pools.values()))
+
+    def register_mcp_pools(self, pools):
+        """Warm the pools up when the agent starts and close them when it stops."""
+
+        @self.agent.on_event("startup")
+        async def warm_mcp_pools(ctx: Context):
+            for pool in pools:
+                await pool.warm_up()
+            ctx.logger.info(
+                f"{self.name} has {sum(pool.idle_count for pool in pools)} warm browser session(s)"
+            )
+
+        @self.agent.on_event("shutdown")
+        async def close_mcp_pools(ctx: Context):
+            for pool in pools:
+                await pool.close()
+
+    def mode_instructions(self, mode):
+        """Prompt text telling the agent how to look at the page in `mode`."""
+        return SNAPSHOT_MODE_INSTRUCTIONS if mode == "snapshot" else ""
+
+    def verdict_instructions(self):
+        """Prompt text telling the agent how to hand in its final answer."""
+        return (
+            f"When you are done, call the {VERDICT_TOOL} tool exactly once with your final answer. "
+            "Do not write the answer as a message. "
+        )
+
+
+class PooledMCPSession:
+    """An MCPAgent together with the MCPClient (and browser) it owns."""
+
+    def __init__(self, client, mcp_agent, profile_dir=None):
+        self.client = client
+        self.mcp_agent = mcp_agent
+        # The browser profile of this session only, removed when it is discarded
+        self.profile_dir = profile_dir
+        self.last_checked = time.monotonic()
+        self.tool_listeners = []
+        self.budget = None
+
+        # Route the agent's tool calls through us so listeners see every step
+        connector = self.client.get_session("playwright").connector
+        self._call_tool = connector.call_tool
+        connector.call_tool = self.step
+
+    async def call_tool(self, name, arguments):
+        """Call a tool on the underlying Playwright MCP server, bypassing the LLM."""
+        return await self._call_tool(name, arguments)
+
+    async def add_verdict_tool(self, response_model, description):
+        """
+        Give the agent a tool to submit its final answer as `response_model`.
+
+        The tool's arguments are the model's JSON schema, so the LLM fills them in
+        through native function calling. Invalid arguments go back to the LLM as
+        an error to correct. A valid answer is recorded as the run budget's
+        verdict and returned directly, which ends the run then and there.
+        """
+        schema = verdict_schema(response_model)
+
+        async def submit(**fields):
+            try:
+                verdict = schema.parse_obj(fields)
+            except ValidationError as e:
+                # Let the agent carry on and call the tool again
+                tool.return_direct = False
+                raise ToolException(
+                    f"Invalid {VERDICT_TOOL} arguments, fix them and call it again: {e}"
+                )
+            tool.return_direct = True
+            if self.budget:
+                self.budget.record_verdict(json.dumps(verdict.dict()))
+            return "Result submitted."
+
+        tool = StructuredTool.from_function(
+            coroutine=submit,
+            name=VERDICT_TOOL,
+            description=description,
+            # Validated in `submit`, LangChain only hands pydantic v2
+            # validation errors back to the LLM
+            args_schema=schema.schema(),
+            handle_tool_error=True,
+            return_direct=True,
+        )
+        mcp_agent = self.mcp_agent
+        mcp_agent._tools.append(tool)
+        await mcp_agent._create_system_message_from_tools(mcp_agent._tools)
+        mcp_agent._agent_executor = mcp_agent._create_agent()
+
+    async def describe_images(self, result):
+        """`result` of a tool call with each image replaced by a vision model's description."""
+        if not any(item.type == "image" for item in result.content or []):
+            return result
 
-        self.mcp_agent = MCPAgent(
-            llm=ChatOpenAI(model="gpt-4o"),
+        content = []
+        for item in result.content:
+            if item.type == "image":
+                item = TextContent(
+                    type="text", text=f"Screenshot: {await self.describe_image(item)}"
+                )
+            content.append(item)
+        return result.model_copy(update={"content": content})
+
+    async def describe_image(self, image):
+        message = HumanMessage(
+            content=[
+                {"type": "text", "text": SCREENSHOT_PROMPT},
+                {
+                    "type": "image_url",
+                    "image_url": {"url": f"data:{image.mimeType};base64,{image.data}"},
+                },
+            ]
+        )
+        try:
+            with Span("screenshot.describe"):
+                reply = await get_llm("screenshot_description").agenerate([[message]])
+        except Exception as e:
+            print(f"Describing a screenshot failed: {e}")
+            return f"the screenshot could not be described ({e})"
+
+        if self.budget:
+            self.budget.add_tokens(*token_usage(reply))
+        return reply.generations[0][0].text
+
+    async def step(self, name, arguments):
+        """Call a tool as a step of the current run, seen by its listeners and budget."""
+        started = time.monotonic()
+        result, error = None, None
+        try:
+            # Don't start more browser work once the run is out of budget
+            if self.budget:
+                self.budget.check()
+            with Span("mcp.tool", tool=name) as span:
+                result = await self.describe_images(await self._call_tool(name, arguments))
+                span.set(is_error=bool(getattr(result, "isError", False)))
+            return result
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            for listener in list(self.tool_listeners):
+                try:
+                    listener(name, arguments, result, error, time.monotonic() - started)
+                except Exception as e:
+                    print(f"Error in MCP tool listener: {e}")
+
+
+class MCPSessionPool:
+    """
+    A pool of pre-warmed Playwright MCP sessions.
+
+    Every session runs its own Playwright MCP server, so requests checked out from the
+    pool run in parallel and never share a browser. Sessions are reset to a blank page
+    when they are checked back in, and idle sessions are health checked before reuse.
+    """
+
+    def __init__(
+        self,
+        config,
+        min_size=1,
+        max_size=3,
+        max_steps=DEFAULT_MAX_STEPS,
+        health_check_interval=60,
+        llm_task=None,
+        verdict_model=None,
+        verdict_description="",
+    ):
+        self.config = config
+        self.min_size = min(min_size, max_size)
+        self.max_size = max_size
+        self.max_steps = max_steps
+        self.health_check_interval = health_check_interval
+        self.llm_task = llm_task
+        self.verdict_model = verdict_model
+        self.verdict_description = verdict_description
+
+        self._idle = []
+        # Every live session, idle or checked out, so `close` can reach them all
+        self._sessions = set()
+        self._size = 0
+        self._closed = False
+        self._slots = asyncio.Semaphore(max_size)
+        self._lock = asyncio.Lock()
+
+    @property
+    def idle_count(self):
+        return len(self._idle)
+
+    async def _create(self):
+        profile_dir = tempfile.mkdtemp(prefix="playwright-mcp-profile-")
+        client = MCPClient.from_dict(with_profile_dir(self.config, profile_dir))
+        mcp_agent = MCPAgent(
+            llm=get_llm(self.llm_task),
             client=client,
-            use_server_manager=True,  # Enable the Server Manager
-            max_steps=30,
+            max_steps=self.max_steps,
+            memory_enabled=False,
         )
+        # Connect to the server and launch the browser ahead of the first request
+        try:
+            await mcp_agent.initialize()
+        except Exception:
+            shutil.rmtree(profile_dir, ignore_errors=True)
+            raise
+        pooled = PooledMCPSession(client, mcp_agent, profile_dir)
+        try:
+            if self.verdict_model:
+                await pooled.add_verdict_tool(self.verdict_model, self.verdict_description)
+            await self._reset(pooled)
+            if self._closed:
+                # The pool was closed while the browser was starting
+                raise RuntimeError("MCP session pool is closed")
+        except Exception:
+            await self._close_session(pooled)
+            raise
+        self._sessions.add(pooled)
+        return pooled
+
+    async def _reset(self, pooled):
+        """Return the browser to a blank page. Doubles as the health check."""
+        await pooled.call_tool("browser_navigate", {"url": "about:blank"})
+        pooled.last_checked = time.monotonic()
+
+    async def _discard(self, pooled):
+        if pooled not in self._sessions:
+            return
+        self._sessions.remove(pooled)
+        self._size -= 1
+        await self._close_session(pooled)
+
+    async def _close_session(self, pooled):
+        try:
+            await pooled.client.close_all_sessions()
+        except Exception as e:
+            print(f"Error closing MCP session: {e}")
+        if pooled.profile_dir:
+            shutil.rmtree(pooled.profile_dir, ignore_errors=True)
+
+    async def warm_up(self):
+        """Start sessions until at least `min_size` of them are idle."""
+        async with self._lock:
+            while self._size < self.min_size and not self._closed:
+                self._size += 1
+                try:
+                    self._idle.append(await self._create())
+                except Exception as e:
+                    self._size -= 1
+                    print(f"Failed to warm up MCP session: {e}")
+                    break
+
+    async def acquire(self):
+        await self._slots.acquire()
+        try:
+            if self._closed:
+                raise RuntimeError("MCP session pool is closed")
+            while self._idle:
+                pooled = self._idle.pop()
+                if time.monotonic() - pooled.last_checked < self.health_check_interval:
+                    return pooled
+                try:
+                    await self._reset(pooled)
+                    return pooled
+                except Exception as e:
+                    print(f"Discarding unhealthy MCP session: {e}")
+                    await self._discard(pooled)
+
+            self._size += 1
+            try:
+                return await self._create()
+            except Exception:
+                self._size -= 1
+                raise
+        except Exception:
+            self._slots.release()
+            raise
+
+    async def release(self, pooled):
+        try:
+            if pooled not in self._sessions:
+                # Closed along with the pool while it was checked out
+                return
+            await self._reset(pooled)
+            self._idle.append(pooled)
+        except Exception as e:
+            print(f"Discarding unhealthy MCP session: {e}")
+            await self._discard(pooled)
+        finally:
+            self._slots.release()
+
+    @asynccontextmanager
+    async def checkout(self, tool_listener=None, budget=None):
+        """
+        Check out a pooled session for the duration of a request.
+
+        `tool_listener(name, arguments, result, error, seconds)` is called after every
+        MCP tool call made while it is checked out. A `RunBudget` is attached to the
+        agent's LLM and tool calls so it can end the run early.
+        """
+        # Time spent waiting for a free browser, or starting one
+        with Span("mcp.checkout", idle=self.idle_count):
+            pooled = await self.acquire()
+
+        llm = pooled.mcp_agent.llm
+        callbacks = llm.callbacks
+        if tool_listener:
+            pooled.tool_listeners.append(tool_listener)
+        if budget:
+            pooled.budget = budget
+            pooled.tool_listeners.append(budget.count_tool_call)
+            llm.callbacks = [budget, *(callbacks or [])]
+        try:
+            yield pooled
+        finally:
+            pooled.tool_listeners.clear()
+            pooled.budget = None
+            llm.callbacks = callbacks
+            await self.release(pooled)
+
+    @asynccontextmanager
+    async def session(self, tool_listener=None, budget=None):
+        """Check out an MCPAgent for the duration of a request, see `checkout`."""
+        async with self.checkout(tool_listener, budget) as pooled:
+            yield pooled.mcp_agent
+
+    async def close(self):
+        """Close every session the pool started, including those checked out."""
+        self._closed = True
+        self._idle.clear()
+        await asyncio.gather(*(self._discard(pooled) for pooled in list(self._sessions)))
 
 
 # Example usage:
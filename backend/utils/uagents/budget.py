@@ -0,0 +1,152 @@
+import asyncio
+import os
+import time
+from typing import Optional
+from langchain_core.callbacks import BaseCallbackHandler
+from uagents import Model
+from ..llm_gateway import token_usage
+from ..telemetry import Span
+
+DEFAULT_MAX_STEPS = int(os.getenv("AGENT_MAX_STEPS", "30"))
+DEFAULT_MAX_SECONDS = float(os.getenv("AGENT_MAX_SECONDS", "300"))
+DEFAULT_MAX_TOKENS = int(os.getenv("AGENT_MAX_TOKENS", "250000"))
+# How long a run may overrun its time budget (e.g. stuck in one tool call) before
+# it is cancelled outright
+HARD_TIMEOUT_GRACE = float(os.getenv("AGENT_HARD_TIMEOUT_GRACE", "30"))
+
+
+class AgentUsage(Model):
+    steps: int = 0
+    tool_calls: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    total_tokens: int = 0
+    seconds: float = 0.0
+    # Why the run was cut short: "verdict", "max_steps", "max_seconds" or "max_tokens"
+    stopped_by: Optional[str] = None
+
+
+class BudgetExceeded(Exception):
+    pass
+
+
+class RunBudget(BaseCallbackHandler):
+    """
+    Step, time and token limits for one agent run, enforced between LLM calls.
+
+    Attached to the agent's LLM as a callback, it counts steps and tokens and
+    raises `BudgetExceeded` before a call that would go over budget, which ends
+    the MCPAgent's step loop. A verdict submitted through the verdict tool ends
+    the run on its own. One recorded any other way, e.g. found in an LLM message
+    by `is_verdict(text)`, still ends the run before it takes another step.
+    """
+
+    raise_error = True
+    # Inline, and ahead of other handlers, so nothing else starts an LLM call it stops
+    run_inline = True
+
+    def __init__(
+        self, max_steps=None, max_seconds=None, max_tokens=None, is_verdict=None
+    ):
+        self.max_steps = max_steps or DEFAULT_MAX_STEPS
+        self.max_seconds = max_seconds or DEFAULT_MAX_SECONDS
+        self.max_tokens = max_tokens or DEFAULT_MAX_TOKENS
+        self.is_verdict = is_verdict
+
+        self.started = time.monotonic()
+        self.steps = 0
+        self.tool_calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.stopped_by = None
+        # Text holding the first verdict
+        self.verdict = None
+
+    @property
+    def total_tokens(self):
+        return self.prompt_tokens + self.completion_tokens
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def check(self):
+        """Raise `BudgetExceeded` if the run must not take another step."""
+        if self.verdict is not None:
+            reason = "verdict"
+        elif self.steps >= self.max_steps:
+            reason = "max_steps"
+        elif self.elapsed >= self.max_seconds:
+            reason = "max_seconds"
+        elif self.total_tokens >= self.max_tokens:
+            reason = "max_tokens"
+        else:
+            return
+
+        self.stopped_by = reason
+        raise BudgetExceeded(reason)
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        self.check()
+        self.steps += 1
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        self.check()
+        self.steps += 1
+
+    def on_llm_end(self, response, **kwargs):
+        prompt_tokens, completion_tokens = token_usage(response)
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+
+        generation = response.generations[0][0] if response.generations else None
+        text = generation.text if generation else ""
+        if self.is_verdict and self.verdict is None and text and self.is_verdict(text):
+            self.record_verdict(text)
+
+    def add_tokens(self, prompt_tokens, completion_tokens):
+        """Count tokens of an LLM call made for the run outside the agent, e.g. by a tool."""
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+
+    def record_verdict(self, text):
+        """Record the run's verdict, e.g. from a structured output tool, ending the run."""
+        if self.verdict is None:
+            self.verdict = text
+
+    def count_tool_call(self, name, arguments, result, error, seconds):
+        """Tool listener for `MCPSessionPool.session`."""
+        self.tool_calls += 1
+
+    def usage(self):
+        return AgentUsage(
+            steps=self.steps,
+            tool_calls=self.tool_calls,
+            prompt_tokens=self.prompt_tokens,
+            completion_tokens=self.completion_tokens,
+            total_tokens=self.total_tokens,
+            seconds=round(self.elapsed, 3),
+            stopped_by=self.stopped_by,
+        )
+
+    async def run(self, mcp_agent, query):
+        """
+        Run `query` on `mcp_agent` within the budget.
+
+        Returns the message holding the verdict if there was one, else the agent's
+        final output.
+        """
+        with Span("mcp_agent.run") as span:
+            try:
+                result = await asyncio.wait_for(
+                    # The budget, not the agent, decides when steps run out
+                    mcp_agent.run(query, max_steps=self.max_steps + 1),
+                    timeout=self.max_seconds + HARD_TIMEOUT_GRACE,
+                )
+            except asyncio.TimeoutError:
+                self.stopped_by = "max_seconds"
+                result = ""
+
+            span.set(**self.usage().dict())
+
+        return self.verdict if self.verdict is not None else result
@@ -1,26 +1,61 @@
-from .base_agent import BaseAgent
+from .base_agent import BaseAgent, DEFAULT_EXECUTION_MODE
+from .budget import AgentUsage, RunBudget
+from ..analysis_cache import AnalysisCache, content_hash
+from ..link_extractor import fetch_html
 from uagents import Model, Context
-from typing import Optional
-from langchain_openai import ChatOpenAI
+import aiohttp
+from typing import Literal, Optional
 from mcp_use import MCPAgent, MCPClient
 from pathlib import Path
 
 
 class ActionAnalyzerRequest(Model):
     target_page: str
+    # Run a fresh analysis even if the page is unchanged since the cached one
+    bypass_cache: bool = False
+    # Progress events for this analysis are published under this run ID
+    run_id: Optional[str] = None
+    # Trace context of the caller, so the analysis's spans join its trace
+    traceparent: Optional[str] = None
+    # Limits for this run, the server defaults apply when unset
+    max_steps: Optional[int] = None
+    max_seconds: Optional[float] = None
+    max_tokens: Optional[int] = None
+    # Look at the page through accessibility snapshots or screenshots
+    mode: Optional[Literal["snapshot", "vision"]] = None
 
 
 class InteractionToTest(Model):
     interaction_description: str
     expected_result: str
+    # Part of the page the tested element sits in, tests of the shared layout
+    # (header, nav, footer, aside) are deduplicated across pages
+    dom_region: Optional[Literal["header", "nav", "main", "aside", "footer"]] = None
 
 
 class ActionAnalyzerResponse(Model):
     page_url: str
     interactions: list[InteractionToTest]
+    cache_hit: bool = False
+    usage: Optional[AgentUsage] = None
+
+
+class AnalysisCacheStats(Model):
+    hits: int
+    misses: int
+    hit_rate: float
+    entries: int
 
 
 class ActionAnalyzer(BaseAgent):
+    verdict_model = ActionAnalyzerResponse
+    verdict_description = (
+        "Submit the test cases for the page. For each one, interaction_description says "
+        "what to do on the page, step by step, expected_result what should happen, and "
+        "dom_region which part of the page (header, nav, main, aside or footer) holds "
+        "the element it tests."
+    )
+
     def __init__(
         self,
         name: str = "interaction_analyzer",
@@ -36,55 +71,82 @@ class ActionAnalyzer(BaseAgent):
             readme_path=readme_path,
         )
 
-        self.init_mcp("--vision")
+        self.init_mcp_modes()
+        self.cache = AnalysisCache()
 
-        @self.agent.on_rest_post(
-            f"/agent/{name}", ActionAnalyzerRequest, ActionAnalyzerResponse
-        )
+        @self.agent.on_rest_get(f"/agent/{name}/cache", AnalysisCacheStats)
+        async def cache_stats(ctx: Context) -> AnalysisCacheStats:
+            return AnalysisCacheStats(**self.cache.stats())
+
+        @self.rest_endpoint(ActionAnalyzerRequest, ActionAnalyzerResponse)
         async def analyze_html(
             ctx: Context, request: ActionAnalyzerRequest
         ) -> ActionAnalyzerResponse:
-
-            result = await self.mcp_agent.run(
-                f"using the playwright mcp server available to you, visit {request.target_page}"
-                f"You are an expert QA tester who meticulously writes test cases for potential bugs on websites"
-                "Based on all the elements available on the screen, write the description of all the test cases that you can think of"
-                "Do not change the URL of the page, and do not navigate away from the current page you are on"
-                """
-                Adhere strictly to the ActionAnalyzerResponse pydantic model for your response, which **MUST** be in JSON:
-
-                class ActionAnalyzerResponse(Model):
-                    page_url: str
-                    interactions: list[InteractionToTest]
-
-                here is the supplementary pydantic model:
-                class InteractionToTest(Model):
-                    interaction_to_test: str
-                    instructions_for_test: str
-                    expected_result: str
-                """
-                "After you are done with your task, make sure to free the browser resource using the browser_close tool"
+            page_hash = await self.fetch_content_hash(ctx, request.target_page)
+            mode = request.mode or DEFAULT_EXECUTION_MODE
+
+            if page_hash and not request.bypass_cache:
+                cached = self.cache.get(request.target_page, page_hash, mode)
+                if cached:
+                    ctx.logger.info(f"Analysis cache hit for {request.target_page}")
+                    return ActionAnalyzerResponse(
+                        **cached, cache_hit=True, usage=AgentUsage()
+                    )
+
+            budget = RunBudget(
+                max_steps=request.max_steps,
+                max_seconds=request.max_seconds,
+                max_tokens=request.max_tokens,
+                is_verdict=self.has_verdict(ActionAnalyzerResponse),
             )
 
-            print(result)
-
-            json_data = self.extract_json_from_response(result)
-
-            if not json_data:
-                return ActionAnalyzerResponse(page_url="", interactions=[])
+            async with self.mcp_pools[mode].session(
+                self.tool_step_publisher(request.run_id, page_url=request.target_page),
+                budget,
+            ) as mcp_agent:
+                result = await budget.run(
+                    mcp_agent,
+                    f"using the playwright mcp server available to you, visit {request.target_page}\n"
+                    f"You are an expert QA tester who meticulously writes test cases for potential bugs on websites. "
+                    "Based on all the elements available on the screen, write the description of all the test cases that you can think of.\n"
+                    f"{self.mode_instructions(mode)}"
+                    "Do not change the URL of the page, and do not navigate away from the current page you are on.\n"
+                    f"{self.verdict_instructions()}"
+                )
 
-            formatted_response = {}
-            formatted_response["page_url"] = json_data["page_url"]
-            formatted_response["interactions"] = []
+            print(result)
 
-            for interaction in json_data["interactions"]:
-                formatted_interaction = {
-                    "interaction_description": f"""{interaction["interaction_to_test"]}: {interaction["instructions_for_test"]}""",
-                    "expected_result": interaction["expected_result"],
-                }
-                formatted_response["interactions"].append(formatted_interaction)
+            response = await self.parse_agent_output(
+                result, ActionAnalyzerResponse, repair=budget.stopped_by is None
+            )
 
-            return ActionAnalyzerResponse(**formatted_response)
+            if response is None:
+                return ActionAnalyzerResponse(
+                    page_url="", interactions=[], usage=budget.usage()
+                )
+
+            response.usage = budget.usage()
+
+            if page_hash and response.interactions:
+                self.cache.put(
+                    request.target_page,
+                    page_hash,
+                    mode,
+                    response.dict(exclude={"cache_hit", "usage"}),
+                )
+
+            return response
+
+    async def fetch_content_hash(self, ctx, page_url):
+        """Hash the page's HTML so unchanged pages can be served from the cache."""
+        try:
+            async with aiohttp.ClientSession() as session:
+                _, html = await fetch_html(session, page_url)
+        except Exception as e:
+            ctx.logger.warning(f"Could not fetch {page_url} for the analysis cache: {e}")
+            return None
+
+        return content_hash(html) if html is not None else None
 
     # def init_mcp(self, additional_arg=None):
     #     args = [
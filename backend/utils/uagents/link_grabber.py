@@ -1,10 +1,18 @@
 from .base_agent import BaseAgent
+from ..link_extractor import fetch_links, canonicalize_url, same_origin
 from uagents import Model, Context
 from pathlib import Path
+from typing import Optional
 
 
 class LinkGrabRequest(Model):
     start_page: str
+    # Skip DOM extraction and let the LLM browse the page
+    use_llm: bool = False
+    # Ask the LLM when DOM extraction finds nothing (e.g. client-rendered pages)
+    llm_fallback: bool = True
+    # Trace context of the caller, so the grab's spans join its trace
+    traceparent: Optional[str] = None
 
 
 class LinkGrabResponse(Model):
@@ -12,6 +20,9 @@ class LinkGrabResponse(Model):
 
 
 class LinkGrabber(BaseAgent):
+    # Listing links needs no judgement, a cheap fast model does
+    llm_task = "link_extraction"
+
     def __init__(
         self,
         name: str = "link_grabber",
@@ -27,25 +38,48 @@ class LinkGrabber(BaseAgent):
             readme_path=readme_path,
         )
 
-        self.init_mcp()
+        # The browser is only a fallback here, so don't keep one warm
+        self.init_mcp(min_size=0)
 
-        @self.agent.on_rest_post(f"/agent/{name}", LinkGrabRequest, LinkGrabResponse)
+        @self.rest_endpoint(LinkGrabRequest, LinkGrabResponse)
         async def analyze_html(
             ctx: Context, request: LinkGrabRequest
         ) -> LinkGrabResponse:
             target_site = request.start_page
 
-            result = await self.mcp_agent.run(
-                f"visit {target_site}"
-                f"Find me all the pages within the same domain that {target_site} will link me to"
-                "Your response should strictly be a list of the full urls that can be parsed as a JSON"
-                "Only respond in markdown"
-                "After you are done with your task, make sure to free the browser resource using the browser_close tool"
+            linked_pages = []
+            if not request.use_llm:
+                try:
+                    linked_pages = await fetch_links(target_site)
+                except Exception as e:
+                    ctx.logger.warning(
+                        f"DOM link extraction failed for {target_site}: {e}"
+                    )
+
+            if request.use_llm or (not linked_pages and request.llm_fallback):
+                linked_pages = await self.grab_links_with_llm(target_site)
+
+            return LinkGrabResponse(linked_pages=linked_pages)
+
+    async def grab_links_with_llm(self, target_site):
+        """Have the browsing agent list the links, for pages rendered client-side."""
+        async with self.mcp_pool.session() as mcp_agent:
+            result = await mcp_agent.run(
+                f"visit {target_site}\n"
+                f"Find me all the pages within the same domain that {target_site} will link me to.\n"
+                "Your response should strictly be a list of the full urls that can be parsed as a JSON.\n"
+                "Only respond in markdown.\n"
             )
 
-            print(result)
+        print(result)
+
+        linked_pages = []
+        for url in self.get_array_from_md(result):
+            url = canonicalize_url(url)
+            if same_origin(url, target_site) and url not in linked_pages:
+                linked_pages.append(url)
 
-            return LinkGrabResponse(linked_pages=self.get_array_from_md(result))
+        return linked_pages
 
 
 if __name__ == "__main__":
@@ -1,24 +1,59 @@
-from .base_agent import BaseAgent
+from .base_agent import (
+    BaseAgent,
+    DEFAULT_EXECUTION_MODE,
+    EXECUTION_MODES,
+)
+from .budget import AgentUsage, RunBudget
+from ..video_streaming import display_in_use
+from ..replay import ReplayStore, ScriptRecorder, replay_script, test_key
 from uagents import Model, Context
-from typing import Optional
-from langchain_openai import ChatOpenAI
-from langchain_groq import ChatGroq
+from typing import Literal, Optional
 from mcp_use import MCPAgent, MCPClient
 from pathlib import Path
+import asyncio
+import os
+
+# Display the tester uses when a request isn't tied to a recording session
+DEFAULT_DISPLAY = os.getenv("SITE_TESTER_DISPLAY", ":99")
 
 
 class SiteTesterRequest(Model):
     page_url: str
     interaction_description: str
     expected_result: str
+    # X display of the recording session to run on, e.g. ":100"
+    display: Optional[str] = None
+    # Progress events for this test are published under this run ID
+    run_id: Optional[str] = None
+    # Client-side ID of the test within its run
+    test_id: Optional[str] = None
+    # Trace context of the caller, so the test's spans join its trace
+    traceparent: Optional[str] = None
+    # Limits for this run, the server defaults apply when unset
+    max_steps: Optional[int] = None
+    max_seconds: Optional[float] = None
+    max_tokens: Optional[int] = None
+    # Look at the page through accessibility snapshots or screenshots
+    mode: Optional[Literal["snapshot", "vision"]] = None
+    # Replay the recorded script of an earlier passing run instead of the agent
+    replay: bool = True
 
 
 class SiteTesterResponse(Model):
     test_passed: bool
     test_report: str
+    usage: Optional[AgentUsage] = None
+    # The verdict came from replaying a recorded script, not from the agent
+    replayed: bool = False
 
 
 class SiteTester(BaseAgent):
+    verdict_model = SiteTesterResponse
+    verdict_description = (
+        "Submit the test verdict: whether the page behaved as expected, "
+        "and a report of what you did and saw for the end users."
+    )
+
     def __init__(
         self,
         name: str = "site_tester",
@@ -35,57 +70,127 @@ class SiteTester(BaseAgent):
             readme_path=readme_path,
         )
 
-        self.init_mcp("--vision")
+        self.init_mcp()
+        self.replay_store = ReplayStore()
 
-        @self.agent.on_rest_post(
-            f"/agent/{name}", SiteTesterRequest, SiteTesterResponse
-        )
+        @self.rest_endpoint(SiteTesterRequest, SiteTesterResponse)
         async def test_site_based_on_instruction(
             ctx: Context, request: SiteTesterRequest
         ) -> SiteTesterResponse:
 
-            result = await self.mcp_agent.run(
-                "You are an Automated QA testing Agent, and your task is to execute test instructions perfectly"
-                "and generate a good report for the end users"
-                f"visit {request.page_url}"
-                f"interaction with page: {request.interaction_description}"
-                f"here is what you should expect: {request.expected_result}"
-                """
-                Respond with a JSON that adheres to the following pydantic model:
-                class SiteTesterResponse(Model):
-                    test_passed: bool
-                    test_report: str
-                """
-                "After you are done with your task, make sure to free the browser resource using the browser_close tool"
+            budget = RunBudget(
+                max_steps=request.max_steps,
+                max_seconds=request.max_seconds,
+                max_tokens=request.max_tokens,
+                is_verdict=self.has_verdict(SiteTesterResponse),
             )
 
-            json_data = self.extract_json_from_response(result)
+            mode = request.mode or DEFAULT_EXECUTION_MODE
+            key = test_key(
+                request.page_url,
+                request.interaction_description,
+                request.expected_result,
+            )
+            # Scripts refer to elements by their snapshot lines, so only snapshot
+            # runs can be recorded and replayed
+            script = (
+                self.replay_store.get(key)
+                if request.replay and mode == "snapshot"
+                else None
+            )
+            recorder = ScriptRecorder() if mode == "snapshot" else None
+
+            pool = await self.pool_for(request.display, mode)
+            async with pool.checkout(
+                self.tool_step_publisher(request.run_id, page_url=request.page_url),
+                budget,
+            ) as pooled:
+                if script:
+                    passed, report = await replay_script(pooled.step, script)
+                    if passed:
+                        self.replay_store.mark_replayed(key)
+                        return SiteTesterResponse(
+                            test_passed=True,
+                            test_report=report,
+                            usage=budget.usage(),
+                            replayed=True,
+                        )
+
+                    # The page changed since the script was recorded
+                    ctx.logger.info(f"Replay failed, running the agent: {report}")
+                    self.replay_store.delete(key)
+                    await pooled.call_tool("browser_navigate", {"url": "about:blank"})
+
+                if recorder:
+                    pooled.tool_listeners.append(recorder)
+
+                result = await budget.run(
+                    pooled.mcp_agent,
+                    "You are an Automated QA testing Agent, and your task is to execute test instructions perfectly "
+                    "and generate a good report for the end users.\n"
+                    f"visit {request.page_url}\n"
+                    f"interaction with page: {request.interaction_description}\n"
+                    f"here is what you should expect: {request.expected_result}\n"
+                    f"{self.mode_instructions(mode)}"
+                    f"{self.verdict_instructions()}"
+                )
+
+            # Runs cut short by the budget have no verdict worth repairing
+            response = await self.parse_agent_output(
+                result, SiteTesterResponse, repair=budget.stopped_by is None
+            )
 
-            return json_data
+            if response is None:
+                return SiteTesterResponse(
+                    test_passed=False,
+                    test_report=f"The test run ended without a verdict ({budget.stopped_by or 'no valid JSON in the final message'})",
+                    usage=budget.usage(),
+                )
 
-    def init_mcp(self, additional_arg=None):
-        args = ["@playwright/mcp@latest", "--vision"]
+            response.usage = budget.usage()
 
-        config = {
-            "mcpServers": {
-                "playwright": {
-                    "command": "npx",
-                    "args": args,
-                    "env": {"DISPLAY": ":99"},
-                }
-            }
-        }
+            if response.test_passed and recorder and recorder.script():
+                self.replay_store.put(key, recorder.script())
 
-        # Create MCPClient from configuration dictionary
-        client = MCPClient.from_dict(config)
+            return response
 
-        self.mcp_agent = MCPAgent(
-            llm=ChatOpenAI(model="gpt-4o"),
-            client=client,
-            use_server_manager=True,  # Enable the Server Manager
-            max_steps=30,
-        )
+    def init_mcp(self):
+        # The tester runs headed on the recording display so its runs are captured
+        self.init_mcp_modes(display=DEFAULT_DISPLAY, headless=False)
+        self.display_pools = {
+            (DEFAULT_DISPLAY, mode): pool for mode, pool in self.mcp_pools.items()
+        }
+
+        @self.agent.on_event("shutdown")
+        async def close_display_pools(ctx: Context):
+            # Pools for recording displays are created on demand, after startup
+            await asyncio.gather(*(pool.close() for pool in self.display_pools.values()))
+
+    async def pool_for(self, display, mode=DEFAULT_EXECUTION_MODE):
+        """
+        Return the session pool whose browsers render on `display` in `mode`.
+
+        Each recording session has its own display, so browsers are pooled per
+        display and execution mode. Pools of displays that have since been torn
+        down are closed.
+        """
+        display = display or DEFAULT_DISPLAY
+
+        stale = [
+            self.display_pools.pop(key)
+            for key in list(self.display_pools)
+            if key[0] not in (display, DEFAULT_DISPLAY)
+            and not display_in_use(key[0].lstrip(":"))
+        ]
+        # Their browsers are gone once this returns, so none outlive the agent
+        await asyncio.gather(*(pool.close() for pool in stale))
+
+        if (display, mode) not in self.display_pools:
+            self.display_pools[(display, mode)] = self.create_mcp_pool(
+                EXECUTION_MODES[mode], display=display, headless=False, min_size=0
+            )
 
+        return self.display_pools[(display, mode)]
 
 if __name__ == "__main__":
     site_tester = SiteTester()
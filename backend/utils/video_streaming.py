@@ -1,260 +1,659 @@
-import subprocess
+import asyncio
 import os
-import signal
+import threading
 import time
 import shutil  # For removing stream directory
+from collections import deque
 
-# --- Global State ---
-xvfb_process = None
-ffmpeg_process = None
-display_num = 99  # Must match Xvfb and FFmpeg :display
+from .main_loop import on_main_loop
+
+DEFAULT_DISPLAY_BASE = int(os.getenv("RECORDING_DISPLAY_BASE", "99"))
+DEFAULT_MAX_SESSIONS = int(os.getenv("MAX_RECORDING_SESSIONS", "16"))
+# Sessions clients forgot to stop are stopped once they're this old, or have
+# run no test for this long (seconds)
+RECORDING_MAX_SECONDS = float(os.getenv("RECORDING_MAX_SECONDS", "7200"))
+RECORDING_IDLE_SECONDS = float(os.getenv("RECORDING_IDLE_SECONDS", "1800"))
+RECORDING_REAP_INTERVAL = float(os.getenv("RECORDING_REAP_INTERVAL", "30"))
+# Sessions whose archive grows past this are stopped
+ARCHIVE_MAX_BYTES = int(os.getenv("ARCHIVE_MAX_BYTES", str(2 * 1024**3)))
 default_stream_dir = "./hls_stream_py"
 
+# How long to wait for Xvfb's socket / ffmpeg's first playlist before giving up
+XVFB_READY_TIMEOUT = 10
+FFMPEG_READY_TIMEOUT = 15
+READINESS_POLL_INTERVAL = 0.05
 
-def start_xvfb(width=1920, height=1080, depth=24):
-    """Starts the Xvfb process if not already running."""
-    global xvfb_process
-    if xvfb_process and xvfb_process.poll() is None:
-        print(
-            f"Xvfb already running with PID {xvfb_process.pid} on display :{display_num}"
-        )
-        # Ensure DISPLAY is set if we think it's running
-        os.environ["DISPLAY"] = f":{display_num}"
-        return True, f"Xvfb already running (PID: {xvfb_process.pid})"
-
-    display = f":{display_num}"
-    screen = f"{width}x{height}x{depth}"
-    xvfb_cmd = [
-        "Xvfb",
-        display,
-        "-screen",
-        "0",
-        screen,
-        "-ac",
-        "-noreset",
-        "-nolisten",
-        "tcp",
-    ]
-
-    try:
-        print(f"Starting Xvfb on display {display} with screen {screen}...")
-        xvfb_process = subprocess.Popen(
-            xvfb_cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+# Encoder settings per use case. The display is always captured at full size and
+# scaled to width x height; fps also sets the x11grab capture rate.
+CAPTURE_PROFILES = {
+    # What every recording used before profiles existed
+    "default": {
+        "width": 1920,
+        "height": 1080,
+        "fps": 25,
+        "preset": "ultrafast",
+        "crf": 23,
+        "gop": 50,
+        "threads": 0,
+    },
+    # Smallest CPU footprint, for packing many recordings onto one node
+    "low_cpu": {
+        "width": 1280,
+        "height": 720,
+        "fps": 10,
+        "preset": "ultrafast",
+        "crf": 28,
+        "gop": 20,
+        "threads": 1,
+    },
+    # A keyframe every 5 frames so any moment can be seeked to exactly
+    "debug": {
+        "width": 1920,
+        "height": 1080,
+        "fps": 25,
+        "preset": "ultrafast",
+        "crf": 20,
+        "gop": 5,
+        "threads": 2,
+    },
+    # Spend more CPU per frame for much smaller files
+    "archive": {
+        "width": 1920,
+        "height": 1080,
+        "fps": 15,
+        "preset": "medium",
+        "crf": 30,
+        "gop": 150,
+        "threads": 2,
+    },
+}
+DEFAULT_CAPTURE_PROFILE = os.getenv("CAPTURE_PROFILE", "default")
+
+# "standard": 2s MPEG-TS segments. "low": sub-second fMP4 segments, each starting
+# on a keyframe, for watching a test live with ~1-2s of delay. 0.6s rather than
+# 0.5s because ffmpeg rounds EXT-X-TARGETDURATION to the nearest second, and a
+# target duration of 0 breaks player reload timing.
+LATENCY_MODES = ("standard", "low")
+LOW_LATENCY_SEGMENT_SECONDS = 0.6
+LOW_LATENCY_LIST_SIZE = 6
+
+# Fragment at every keyframe so the archive is usable up to the last fragment
+ARCHIVE_MOVFLAGS = "+frag_keyframe+empty_moov+default_base_moof"
+
+
+def display_in_use(display_num):
+    """True if an X server (ours or anyone else's) already owns the display."""
+    return os.path.exists(f"/tmp/.X{display_num}-lock") or os.path.exists(
+        f"/tmp/.X11-unix/X{display_num}"
+    )
+
+
+class RecordingSession:
+    """
+    One Xvfb display and the ffmpeg process recording it.
+
+    ffmpeg always writes a rolling live HLS stream to `stream_dir`; with an
+    `archive_path` it also keeps a complete MP4 of the session.
+    """
+
+    def __init__(
+        self,
+        session_id,
+        display_num,
+        stream_dir=default_stream_dir,
+        profile=DEFAULT_CAPTURE_PROFILE,
+        latency_mode="standard",
+        archive_path=None,
+        width=1920,
+        height=1080,
+        depth=24,
+    ):
+        if latency_mode not in LATENCY_MODES:
+            raise ValueError(
+                f"Unknown latency mode '{latency_mode}', expected one of {list(LATENCY_MODES)}"
+            )
+        if profile not in CAPTURE_PROFILES:
+            raise ValueError(
+                f"Unknown capture profile '{profile}', expected one of {list(CAPTURE_PROFILES)}"
+            )
+
+        self.session_id = session_id
+        self.display_num = display_num
+        self.stream_dir = str(stream_dir)
+        self.profile = profile
+        self.latency_mode = latency_mode
+        self.archive_path = str(archive_path) if archive_path else None
+        self.width = width
+        self.height = height
+        self.depth = depth
+        self.xvfb_process = None
+        self.ffmpeg_process = None
+        self.ffmpeg_errors = deque(maxlen=20)
+        self.ffmpeg_started_at = None
+        self.final_encoder_cpu = None
+        self._stderr_task = None
+        self.start_time = None
+        # Last time a test ran on this session, see `RecordingManager.touch`
+        self.last_used = time.time()
+
+    @property
+    def display(self):
+        return f":{self.display_num}"
+
+    @property
+    def is_recording(self):
+        return (
+            self.ffmpeg_process is not None and self.ffmpeg_process.returncode is None
         )
-        time.sleep(2)  # Give Xvfb time to initialize
 
-        if xvfb_process.poll() is None:
-            os.environ["DISPLAY"] = display
+    @property
+    def x_socket(self):
+        return f"/tmp/.X11-unix/X{self.display_num}"
+
+    @property
+    def playlist_path(self):
+        return os.path.join(self.stream_dir, "stream.m3u8")
+
+    async def _wait_until(self, ready, process, timeout):
+        """
+        Poll `ready()` until it is true, the process exits or `timeout` passes.
+
+        Returns True only if the process is still running and ready.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while loop.time() < deadline:
+            if process.returncode is not None:
+                return False
+            if ready():
+                return True
+            await asyncio.sleep(READINESS_POLL_INTERVAL)
+        return process.returncode is None and ready()
+
+    async def _stop_process(self, process, name, timeout):
+        """SIGTERM the process, escalating to SIGKILL after `timeout` seconds."""
+        pid = process.pid
+        print(f"Stopping {name} (PID: {pid})...")
+        process.terminate()
+        try:
+            await asyncio.wait_for(process.wait(), timeout=timeout)
+            print(f"{name} (PID: {pid}) terminated gracefully.")
+        except asyncio.TimeoutError:
+            print(f"{name} (PID: {pid}) did not terminate gracefully, sending SIGKILL...")
+            process.kill()
+            await process.wait()
+            print(f"{name} (PID: {pid}) killed.")
+
+    def encoder_cpu(self):
+        """
+        CPU used by the ffmpeg process so far, read from /proc.
+
+        Returns None when ffmpeg isn't running or /proc isn't available.
+        """
+        if not self.is_recording or self.ffmpeg_started_at is None:
+            return None
+
+        try:
+            with open(f"/proc/{self.ffmpeg_process.pid}/stat") as stat:
+                # utime and stime are fields 14 and 15, counted after the "(comm)" field
+                fields = stat.read().rsplit(")", 1)[1].split()
+        except OSError:
+            return None
+
+        cpu_seconds = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+        elapsed = max(time.monotonic() - self.ffmpeg_started_at, 1e-6)
+        return {
+            "cpu_seconds": round(cpu_seconds, 2),
+            # Average share of one core since the encoder started
+            "cpu_percent": round(100 * cpu_seconds / elapsed, 1),
+        }
+
+    async def _drain_stderr(self):
+        """Keep ffmpeg's stderr pipe from filling up, remembering the last lines."""
+        async for line in self.ffmpeg_process.stderr:
+            self.ffmpeg_errors.append(line.decode(errors="ignore").rstrip())
+
+    async def start_xvfb(self):
+        """Starts the Xvfb process and waits for its X socket to appear."""
+        if self.xvfb_process and self.xvfb_process.returncode is None:
             print(
-                f"Xvfb started successfully with PID {xvfb_process.pid} on display {display}"
+                f"Xvfb already running with PID {self.xvfb_process.pid} on display {self.display}"
             )
-            return True, f"Xvfb started (PID: {xvfb_process.pid})"
-        else:
-            print(f"Xvfb failed to start. Exit code: {xvfb_process.returncode}")
-            xvfb_process = None
-            return False, "Xvfb failed to start"
-    except FileNotFoundError:
-        print("Error: Xvfb command not found. Make sure it's installed.")
-        xvfb_process = None
-        return False, "Xvfb command not found"
-    except Exception as e:
-        print(f"An error occurred while starting Xvfb: {e}")
-        xvfb_process = None
-        return False, f"Error starting Xvfb: {e}"
-
-
-def stop_xvfb():
-    """Stops the Xvfb process if it's running."""
-    global xvfb_process
-    if xvfb_process and xvfb_process.poll() is None:
-        pid = xvfb_process.pid
-        print(f"Stopping Xvfb (PID: {pid})...")
+            return True, f"Xvfb already running (PID: {self.xvfb_process.pid})"
+
+        screen = f"{self.width}x{self.height}x{self.depth}"
+        xvfb_cmd = [
+            "Xvfb",
+            self.display,
+            "-screen",
+            "0",
+            screen,
+            "-ac",
+            "-noreset",
+            "-nolisten",
+            "tcp",
+        ]
+
         try:
-            xvfb_process.terminate()
-            try:
-                xvfb_process.wait(timeout=5)
-                print(f"Xvfb (PID: {pid}) terminated gracefully.")
-            except subprocess.TimeoutExpired:
+            print(f"Starting Xvfb on display {self.display} with screen {screen}...")
+            self.xvfb_process = await asyncio.create_subprocess_exec(
+                *xvfb_cmd,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.DEVNULL,
+            )
+
+            if await self._wait_until(
+                lambda: os.path.exists(self.x_socket),
+                self.xvfb_process,
+                XVFB_READY_TIMEOUT,
+            ):
                 print(
-                    f"Xvfb (PID: {pid}) did not terminate gracefully, sending SIGKILL..."
+                    f"Xvfb started successfully with PID {self.xvfb_process.pid} on display {self.display}"
                 )
-                xvfb_process.kill()
-                xvfb_process.wait()
-                print(f"Xvfb (PID: {pid}) killed.")
-
-            if os.environ.get("DISPLAY") == f":{display_num}":
-                del os.environ["DISPLAY"]
-                print(f"Unset DISPLAY environment variable (:{display_num})")
-
-            xvfb_process = None
-            return True, f"Xvfb stopped (PID: {pid})"
+                return True, f"Xvfb started (PID: {self.xvfb_process.pid})"
+            else:
+                if self.xvfb_process.returncode is None:
+                    await self._stop_process(self.xvfb_process, "Xvfb", 5)
+                print(
+                    f"Xvfb failed to start. Exit code: {self.xvfb_process.returncode}"
+                )
+                self.xvfb_process = None
+                return False, "Xvfb failed to start"
+        except FileNotFoundError:
+            print("Error: Xvfb command not found. Make sure it's installed.")
+            self.xvfb_process = None
+            return False, "Xvfb command not found"
         except Exception as e:
-            print(f"An error occurred while stopping Xvfb (PID: {pid}): {e}")
-            xvfb_process = None
-            return False, f"Error stopping Xvfb: {e}"
-    else:
-        print("Xvfb is not running or process object not found.")
-        if os.environ.get("DISPLAY") == f":{display_num}":
-            del os.environ["DISPLAY"]
-        xvfb_process = None
-        return True, "Xvfb was not running"
-
-
-# --- FFmpeg Recording Management ---
-def start_ffmpeg_recording(
-    stream_dir=default_stream_dir, width=1920, height=1080, framerate=25
-):
-    """Starts the FFmpeg recording process if not already running."""
-    global ffmpeg_process
-
-    # Prerequisite check: Xvfb must be running (check DISPLAY)
-    display = os.environ.get("DISPLAY")
-    if not display or display != f":{display_num}":
-        msg = f"Cannot start FFmpeg: Xvfb not running or DISPLAY (currently '{display}') is not set to ':{display_num}'."
-        print(msg)
-        return False, msg
-
-    if ffmpeg_process and ffmpeg_process.poll() is None:
-        print(f"FFmpeg already running with PID {ffmpeg_process.pid}")
-        return True, f"FFmpeg already running (PID: {ffmpeg_process.pid})"
-
-    # Ensure stream directory exists
-    try:
-        os.makedirs(stream_dir, exist_ok=True)
-        print(f"Ensured HLS stream directory exists: {stream_dir}")
-    except OSError as e:
-        msg = f"Failed to create stream directory {stream_dir}: {e}"
-        print(msg)
-        return False, msg
-
-    # Construct FFmpeg command (carefully split into a list)
-    ffmpeg_cmd = [
-        "ffmpeg",
-        "-f",
-        "x11grab",
-        "-video_size",
-        f"{width}x{height}",
-        "-framerate",
-        str(framerate),
-        "-i",
-        display,  # Use the DISPLAY variable from environment
-        "-c:v",
-        "libx264",
-        "-preset",
-        "ultrafast",
-        "-crf",
-        "23",
-        "-pix_fmt",
-        "yuv420p",
-        "-g",
-        "50",  # Keyframe interval
-        "-hls_time",
-        "2",  # Segment duration
-        "-hls_list_size",
-        "8",  # Max segments in playlist
-        "-hls_flags",
-        "delete_segments+append_list",
-        os.path.join(stream_dir, "stream.m3u8"),  # Output playlist
-    ]
-
-    try:
-        print(f"Starting FFmpeg recording to {stream_dir}...")
-        print(f"Command: {' '.join(ffmpeg_cmd)}")  # For debugging
-        # Start FFmpeg, redirect stdout/stderr
-        # Capture stderr to check for immediate errors
-        ffmpeg_process = subprocess.Popen(
-            ffmpeg_cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
-        )
-        time.sleep(2)  # Give FFmpeg time to start and potentially error out
+            print(f"An error occurred while starting Xvfb: {e}")
+            self.xvfb_process = None
+            return False, f"Error starting Xvfb: {e}"
 
-        if ffmpeg_process.poll() is None:
-            print(f"FFmpeg started successfully with PID {ffmpeg_process.pid}")
-            # Optional: Check stderr for warnings after startup?
-            # err = ffmpeg_process.stderr.read() # Non-blocking read might be better
-            return True, f"FFmpeg started (PID: {ffmpeg_process.pid})"
+    async def stop_xvfb(self):
+        """Stops the Xvfb process if it's running."""
+        if self.xvfb_process and self.xvfb_process.returncode is None:
+            pid = self.xvfb_process.pid
+            try:
+                await self._stop_process(self.xvfb_process, "Xvfb", 5)
+                self.xvfb_process = None
+                return True, f"Xvfb stopped (PID: {pid})"
+            except Exception as e:
+                print(f"An error occurred while stopping Xvfb (PID: {pid}): {e}")
+                self.xvfb_process = None
+                return False, f"Error stopping Xvfb: {e}"
         else:
-            # FFmpeg exited immediately, likely an error
-            error_output = ffmpeg_process.stderr.read().decode(errors="ignore")
-            msg = f"FFmpeg failed to start. Exit code: {ffmpeg_process.returncode}. Error: {error_output}"
+            print("Xvfb is not running or process object not found.")
+            self.xvfb_process = None
+            return True, "Xvfb was not running"
+
+    # --- FFmpeg Recording Management ---
+    @property
+    def low_latency(self):
+        return self.latency_mode == "low"
+
+    def _capture_args(self):
+        settings = CAPTURE_PROFILES[self.profile]
+        args = [
+            "-f",
+            "x11grab",
+            "-video_size",
+            f"{self.width}x{self.height}",
+            "-framerate",
+            str(settings["fps"]),
+            "-i",
+            self.display,
+        ]
+
+        if (settings["width"], settings["height"]) != (self.width, self.height):
+            args += [
+                "-vf",
+                f"scale={settings['width']}:{settings['height']}:flags=fast_bilinear",
+            ]
+
+        return args
+
+    def _encoder_args(self):
+        settings = CAPTURE_PROFILES[self.profile]
+        gop = settings["gop"]
+        args = [
+            "-c:v",
+            "libx264",
+            "-preset",
+            settings["preset"],
+            "-crf",
+            str(settings["crf"]),
+            "-threads",
+            str(settings["threads"]),  # 0 lets x264 pick
+            "-pix_fmt",
+            "yuv420p",
+        ]
+
+        if self.low_latency:
+            # Every segment must start on a keyframe, and x264 must not hold frames
+            # back for lookahead or B-frames
+            gop = max(1, round(settings["fps"] * LOW_LATENCY_SEGMENT_SECONDS))
+            args += [
+                "-tune",
+                "zerolatency",
+                "-sc_threshold",
+                "0",
+                "-keyint_min",
+                str(gop),
+            ]
+
+        return args + ["-g", str(gop)]  # Keyframe interval
+
+    def _hls_options(self):
+        if not self.low_latency:
+            return {
+                "hls_time": "2",  # Segment duration
+                "hls_list_size": "8",  # Max segments in playlist
+                "hls_flags": "delete_segments+append_list",
+            }
+
+        return {
+            "flush_packets": "1",
+            "hls_segment_type": "fmp4",
+            "hls_fmp4_init_filename": "init.mp4",
+            "hls_time": str(LOW_LATENCY_SEGMENT_SECONDS),
+            "hls_list_size": str(LOW_LATENCY_LIST_SIZE),
+            # temp_file: players never see a half-written segment
+            "hls_flags": "delete_segments+independent_segments+program_date_time+temp_file",
+        }
+
+    def _output_args(self):
+        """
+        Muxer arguments for the live HLS stream, plus the archive if there is one.
+
+        With an archive, the single encode is split by the tee muxer into the
+        rolling HLS playlist and a fragmented MP4 holding the whole session. The
+        fragmented MP4 stays playable even if ffmpeg dies before finalizing it.
+        """
+        if not self.archive_path:
+            args = []
+            for option, value in self._hls_options().items():
+                args += [f"-{option}", value]
+            return args + [self.playlist_path]  # Output playlist
+
+        hls = ":".join(f"{k}={v}" for k, v in self._hls_options().items())
+        # Losing the archive must never take the live stream down with it
+        archive = f"movflags={ARCHIVE_MOVFLAGS}:onfail=ignore"
+        return [
+            # The archive keeps everything, so ffmpeg itself never records for
+            # longer than a session may live, even if nothing stops the session
+            "-t",
+            str(RECORDING_MAX_SECONDS),
+            # MP4 needs the codec headers up front; the HLS muxer still repeats
+            # them in-band on every keyframe
+            "-flags",
+            "+global_header",
+            "-map",
+            "0:v",
+            "-f",
+            "tee",
+            f"[f=hls:{hls}]{self.playlist_path}|[f=mp4:{archive}]{self.archive_path}",
+        ]
+
+    async def start_ffmpeg_recording(self):
+        """Starts FFmpeg and waits for it to write the first HLS playlist."""
+        # Prerequisite check: this session's Xvfb must be running
+        if not self.xvfb_process or self.xvfb_process.returncode is not None:
+            msg = f"Cannot start FFmpeg: Xvfb is not running on {self.display}."
             print(msg)
-            ffmpeg_process = None
             return False, msg
-    except FileNotFoundError:
-        print("Error: ffmpeg command not found. Make sure it's installed and in PATH.")
-        ffmpeg_process = None
-        return False, "ffmpeg command not found"
-    except Exception as e:
-        print(f"An error occurred while starting FFmpeg: {e}")
-        ffmpeg_process = None
-        return False, f"Error starting FFmpeg: {e}"
-
-
-def stop_ffmpeg_recording(cleanup_dir=False, stream_dir=default_stream_dir):
-    """Stops the FFmpeg process if it's running."""
-    global ffmpeg_process
-    if ffmpeg_process and ffmpeg_process.poll() is None:
-        pid = ffmpeg_process.pid
-        print(f"Stopping FFmpeg (PID: {pid})...")
+
+        if self.is_recording:
+            print(f"FFmpeg already running with PID {self.ffmpeg_process.pid}")
+            return True, f"FFmpeg already running (PID: {self.ffmpeg_process.pid})"
+
+        # Ensure stream directory exists
         try:
-            # FFmpeg often responds well to SIGINT (Ctrl+C) for graceful shutdown
-            # or SIGTERM (terminate). Let's try terminate first.
-            ffmpeg_process.terminate()  # Sends SIGTERM
-            try:
-                ffmpeg_process.wait(timeout=10)  # Wait longer for FFmpeg finalization
-                print(f"FFmpeg (PID: {pid}) terminated gracefully.")
-            except subprocess.TimeoutExpired:
-                print(
-                    f"FFmpeg (PID: {pid}) did not terminate gracefully, sending SIGKILL..."
-                )
-                ffmpeg_process.kill()  # Sends SIGKILL
-                ffmpeg_process.wait()
-                print(f"FFmpeg (PID: {pid}) killed.")
-
-            # Optional: Clean up the stream directory
-            if cleanup_dir:
-                try:
-                    shutil.rmtree(stream_dir)
-                    print(f"Cleaned up stream directory: {stream_dir}")
-                except OSError as e:
-                    print(
-                        f"Warning: Failed to remove stream directory {stream_dir}: {e}"
-                    )
-
-            ffmpeg_process = None
-            return True, f"FFmpeg stopped (PID: {pid})"
+            os.makedirs(self.stream_dir, exist_ok=True)
+            print(f"Ensured HLS stream directory exists: {self.stream_dir}")
+        except OSError as e:
+            msg = f"Failed to create stream directory {self.stream_dir}: {e}"
+            print(msg)
+            return False, msg
+
+        # Construct FFmpeg command (carefully split into a list)
+        ffmpeg_cmd = [
+            "ffmpeg",
+            "-nostats",
+            "-loglevel",
+            "error",
+            *self._capture_args(),
+            *self._encoder_args(),
+            *self._output_args(),
+        ]
+
+        try:
+            print(f"Starting FFmpeg recording to {self.stream_dir}...")
+            print(f"Command: {' '.join(ffmpeg_cmd)}")  # For debugging
+            self.ffmpeg_process = await asyncio.create_subprocess_exec(
+                *ffmpeg_cmd,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.PIPE,
+            )
+            self.ffmpeg_started_at = time.monotonic()
+            self.ffmpeg_errors.clear()
+            self._stderr_task = asyncio.ensure_future(self._drain_stderr())
+
+            # The playlist is written once the first segment is complete
+            if await self._wait_until(
+                lambda: os.path.exists(self.playlist_path),
+                self.ffmpeg_process,
+                FFMPEG_READY_TIMEOUT,
+            ):
+                print(f"FFmpeg started successfully with PID {self.ffmpeg_process.pid}")
+                return True, f"FFmpeg started (PID: {self.ffmpeg_process.pid})"
+            else:
+                if self.ffmpeg_process.returncode is None:
+                    await self._stop_process(self.ffmpeg_process, "FFmpeg", 5)
+                await self._stderr_task
+                error_output = "\n".join(self.ffmpeg_errors)
+                msg = f"FFmpeg failed to start. Exit code: {self.ffmpeg_process.returncode}. Error: {error_output}"
+                print(msg)
+                self.ffmpeg_process = None
+                return False, msg
+        except FileNotFoundError:
+            print(
+                "Error: ffmpeg command not found. Make sure it's installed and in PATH."
+            )
+            self.ffmpeg_process = None
+            return False, "ffmpeg command not found"
         except Exception as e:
-            print(f"An error occurred while stopping FFmpeg (PID: {pid}): {e}")
-            ffmpeg_process = None
-            # Still attempt cleanup if requested
-            if cleanup_dir:
-                try:
-                    shutil.rmtree(stream_dir)
-                    print(f"Cleaned up stream directory after error: {stream_dir}")
-                except OSError as e:
-                    print(
-                        f"Warning: Failed to remove stream directory {stream_dir} after error: {e}"
-                    )
-            return False, f"Error stopping FFmpeg: {e}"
-    else:
-        print("FFmpeg is not running or process object not found.")
-        ffmpeg_process = None  # Ensure state is clean
-        # Optional cleanup even if process wasn't found?
-        if cleanup_dir:
+            print(f"An error occurred while starting FFmpeg: {e}")
+            self.ffmpeg_process = None
+            return False, f"Error starting FFmpeg: {e}"
+
+    async def stop_ffmpeg_recording(self, cleanup_dir=False):
+        """Stops the FFmpeg process if it's running."""
+        if self.is_recording:
+            pid = self.ffmpeg_process.pid
+            self.final_encoder_cpu = self.encoder_cpu()
             try:
-                if os.path.exists(stream_dir):
-                    shutil.rmtree(stream_dir)
-                    print(
-                        f"Cleaned up potentially orphaned stream directory: {stream_dir}"
-                    )
+                # SIGTERM lets FFmpeg finalize the playlist before exiting
+                await self._stop_process(self.ffmpeg_process, "FFmpeg", 10)
+                result = True, f"FFmpeg stopped (PID: {pid})"
+            except Exception as e:
+                print(f"An error occurred while stopping FFmpeg (PID: {pid}): {e}")
+                result = False, f"Error stopping FFmpeg: {e}"
+        else:
+            print("FFmpeg is not running or process object not found.")
+            result = True, "FFmpeg was not running"
+
+        self.ffmpeg_process = None
+
+        # Optional: Clean up the stream directory
+        if cleanup_dir and os.path.exists(self.stream_dir):
+            try:
+                shutil.rmtree(self.stream_dir)
+                print(f"Cleaned up stream directory: {self.stream_dir}")
             except OSError as e:
                 print(
-                    f"Warning: Failed to remove potentially orphaned stream directory {stream_dir}: {e}"
+                    f"Warning: Failed to remove stream directory {self.stream_dir}: {e}"
                 )
-        return True, "FFmpeg was not running"
 
+        return result
+
+    async def start(self):
+        """Start Xvfb and then ffmpeg. Returns (success, message)."""
+        ok, msg = await self.start_xvfb()
+        if not ok:
+            return ok, msg
+
+        ok, msg = await self.start_ffmpeg_recording()
+        if not ok:
+            await self.stop_xvfb()
+            return ok, msg
+
+        self.start_time = time.time()
+        return True, f"Recording display {self.display} to {self.stream_dir}"
+
+    async def stop(self, cleanup_dir=False):
+        """Stop ffmpeg first so it can finalize, then Xvfb."""
+        ffmpeg_ok, ffmpeg_msg = await self.stop_ffmpeg_recording(
+            cleanup_dir=cleanup_dir
+        )
+        xvfb_ok, xvfb_msg = await self.stop_xvfb()
+        return ffmpeg_ok and xvfb_ok, f"{ffmpeg_msg}; {xvfb_msg}"
 
-def clean_ffmpeg_stream():
+    def info(self):
+        return {
+            "session_id": self.session_id,
+            "display": self.display,
+            "is_recording": self.is_recording,
+            "profile": self.profile,
+            "latency_mode": self.latency_mode,
+            "encoder_cpu": self.encoder_cpu() or self.final_encoder_cpu,
+            "stream_dir": self.stream_dir,
+            "archive_path": self.archive_path,
+            "duration": time.time() - self.start_time if self.start_time else 0,
+        }
+
+
+class RecordingManager:
     """
-    Deletes the folder where the stream was stored
+    Registry of recording sessions, each on its own Xvfb display.
+
+    Display numbers are handed out from `display_base` upwards, skipping any display
+    an X server already holds, so concurrent test runs never record each other.
+    Sessions are started and stopped on the main event loop, which owns their
+    subprocesses, whichever request handler asks for it. Sessions older than
+    `max_age` or unused for `max_idle` seconds, or whose archive outgrew
+    ARCHIVE_MAX_BYTES, are stopped, see `stop_expired`.
     """
-    os.removedirs(default_stream_dir)
+
+    def __init__(
+        self,
+        display_base=DEFAULT_DISPLAY_BASE,
+        max_sessions=DEFAULT_MAX_SESSIONS,
+        max_age=RECORDING_MAX_SECONDS,
+        max_idle=RECORDING_IDLE_SECONDS,
+    ):
+        self.display_base = display_base
+        self.max_sessions = max_sessions
+        self.max_age = max_age
+        self.max_idle = max_idle
+        self.sessions = {}
+        self._lock = threading.Lock()
+
+    def _allocate_display(self):
+        taken = {session.display_num for session in self.sessions.values()}
+        for display_num in range(
+            self.display_base, self.display_base + self.max_sessions
+        ):
+            if display_num not in taken and not display_in_use(display_num):
+                return display_num
+        return None
+
+    @on_main_loop
+    async def start_session(self, session_id, stream_dir, **kwargs):
+        """
+        Allocate a display and start recording on it.
+
+        Returns (session, message); session is None if the recording could not start.
+        """
+        # Free the slots of sessions nobody stopped
+        await self.stop_expired()
+
+        with self._lock:
+            if len(self.sessions) >= self.max_sessions:
+                return None, f"All {self.max_sessions} recording slots are in use"
+
+            display_num = self._allocate_display()
+            if display_num is None:
+                return None, "No free X display available"
+
+            try:
+                session = RecordingSession(
+                    session_id, display_num, stream_dir, **kwargs
+                )
+            except ValueError as e:
+                return None, str(e)
+            # Reserve the display before releasing the lock
+            self.sessions[session_id] = session
+
+        ok, msg = await session.start()
+        if not ok:
+            with self._lock:
+                self.sessions.pop(session_id, None)
+            return None, msg
+
+        return session, msg
+
+    @on_main_loop
+    async def stop_session(self, session_id, cleanup_dir=False):
+        """Stop and unregister a session. Returns the stopped session, or None."""
+        with self._lock:
+            session = self.sessions.pop(session_id, None)
+
+        if session is not None:
+            await session.stop(cleanup_dir=cleanup_dir)
+
+        return session
+
+    def get(self, session_id):
+        return self.sessions.get(session_id)
+
+    def touch(self, session):
+        """Note that a test is running on `session`, so it isn't stopped as idle."""
+        session.last_used = time.time()
+
+    def expired(self, session, now=None):
+        """Why `session` should be stopped, or None if it may keep running."""
+        now = now or time.time()
+        if session.start_time and now - session.start_time > self.max_age:
+            return f"it has run for over {self.max_age:.0f}s"
+        if now - session.last_used > self.max_idle:
+            return f"it has been idle for over {self.max_idle:.0f}s"
+        if session.archive_path and os.path.exists(session.archive_path):
+            if os.path.getsize(session.archive_path) > ARCHIVE_MAX_BYTES:
+                return f"its archive is over {ARCHIVE_MAX_BYTES} bytes"
+        return None
+
+    @on_main_loop
+    async def stop_expired(self):
+        """Stop every session that has run too long or sat idle too long."""
+        now = time.time()
+        for session_id, session in list(self.sessions.items()):
+            reason = self.expired(session, now)
+            if reason is None:
+                continue
+            print(f"Stopping recording session {session_id}: {reason}")
+            try:
+                await self.stop_session(session_id)
+            except Exception as e:
+                print(f"Error stopping recording session {session_id}: {e}")
+
+    async def reap_expired(self, interval=RECORDING_REAP_INTERVAL):
+        """Stop expired sessions every `interval` seconds, until cancelled."""
+        while True:
+            await asyncio.sleep(interval)
+            await self.stop_expired()
+
+    async def stop_all(self):
+        for session_id in list(self.sessions):
+            try:
+                await self.stop_session(session_id)
+            except Exception as e:
+                print(f"Error stopping recording session {session_id}: {e}")
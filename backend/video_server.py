@@ -1,78 +1,140 @@
-"""
 #!/usr/bin/env python3
-import http.server
-import socketserver
 
-PORT = 8000 # Make sure this matches the port in your shell script and frontend HTML
+import asyncio
+import os
+import re
+from pathlib import Path
 
-class CORSRequestHandler(http.server.SimpleHTTPRequestHandler):
-    def end_headers(self):
-        self.send_header('Access-Control-Allow-Origin', '*') # Allows requests from any origin
-        self.send_header('Access-Control-Allow-Methods', 'GET') # Allows GET requests
-        self.send_header('Access-Control-Allow-Headers', 'X-Requested-With, Content-Type') # Allows specific headers
-        http.server.SimpleHTTPRequestHandler.end_headers(self)
+from aiohttp import web
 
-with socketserver.TCPServer(("", PORT), CORSRequestHandler) as httpd:
-    print(f"Serving HTTP with CORS on port {PORT}")
-    httpd.serve_forever()
-"""
+PORT = int(os.getenv("VIDEO_SERVER_PORT", "8008"))  # Must match the port in the frontend
+
+# Serve the recordings written by app.py (./videos relative to this file)
+WEB_ROOT = Path(os.path.dirname(os.path.abspath(__file__)))
+VIDEOS_DIR = WEB_ROOT / "videos"
+
+CONTENT_TYPES = {
+    ".m3u8": "application/vnd.apple.mpegurl",
+    ".ts": "video/mp2t",
+    ".m4s": "video/iso.segment",
+    ".mp4": "video/mp4",
+}
+
+# Playlists change every segment, segments never change once written
+PLAYLIST_CACHE_CONTROL = "no-cache"
+SEGMENT_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# The session archive keeps growing while it is being recorded
+ARCHIVE_CACHE_CONTROL = "no-cache"
+
+# How often a blocking playlist reload re-reads the playlist
+PLAYLIST_POLL_INTERVAL = 0.05
+
+CORS_HEADERS = {
+    "Access-Control-Allow-Origin": "*",  # Allows requests from any origin
+    "Access-Control-Allow-Methods": "GET, HEAD, OPTIONS",
+    "Access-Control-Allow-Headers": "X-Requested-With, Content-Type, Range",
+    "Access-Control-Expose-Headers": "Content-Length, Content-Range, Accept-Ranges",
+}
+
+
+def cache_control_for(path):
+    if path.suffix == ".m3u8":
+        return PLAYLIST_CACHE_CONTROL
+    if path.suffix in (".ts", ".m4s") or path.name == "init.mp4":
+        return SEGMENT_CACHE_CONTROL
+    return ARCHIVE_CACHE_CONTROL
+
+
+def resolve_video_path(relative_path):
+    """Map a request path onto a file under VIDEOS_DIR, refusing anything outside it."""
+    path = (VIDEOS_DIR / relative_path).resolve()
+    if VIDEOS_DIR.resolve() not in path.parents or not path.is_file():
+        raise web.HTTPNotFound()
+    return path
+
+
+def last_media_sequence(playlist):
+    """Media sequence number of the last segment in an HLS playlist, or None."""
+    match = re.search(r"#EXT-X-MEDIA-SEQUENCE:(\d+)", playlist)
+    segments = len(re.findall(r"^#EXTINF:", playlist, re.MULTILINE))
+    if not segments:
+        return None
+    return (int(match.group(1)) if match else 0) + segments - 1
+
+
+def target_duration(playlist):
+    match = re.search(r"#EXT-X-TARGETDURATION:(\d+)", playlist)
+    return max(int(match.group(1)), 1) if match else 2
+
+
+async def wait_for_segment(path, msn):
+    """
+    Blocking playlist reload: wait until the playlist lists segment `msn`.
+
+    Gives up after three target durations, as the HLS spec recommends.
+    """
+    playlist = path.read_text()
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + 3 * target_duration(playlist)
+
+    while True:
+        last = last_media_sequence(playlist)
+        if last is not None and last >= msn:
+            return True
+        if loop.time() >= deadline or "#EXT-X-ENDLIST" in playlist:
+            return False
+        await asyncio.sleep(PLAYLIST_POLL_INTERVAL)
+        playlist = path.read_text()
+
+
+async def serve_video(request):
+    path = resolve_video_path(request.match_info["path"])
+    headers = {"Cache-Control": cache_control_for(path)}
+
+    msn = request.query.get("_HLS_msn")
+    if path.suffix == ".m3u8" and msn is not None:
+        if not msn.isdigit():
+            raise web.HTTPBadRequest(text="_HLS_msn must be a non-negative integer")
+        if not await wait_for_segment(path, int(msn)):
+            raise web.HTTPServiceUnavailable(headers=headers)
+
+    # FileResponse uses sendfile and handles Range / conditional requests
+    response = web.FileResponse(path, headers=headers)
+    response.content_type = CONTENT_TYPES.get(path.suffix, "application/octet-stream")
+    return response
+
+
+async def test_endpoint(request):
+    return web.Response(
+        text="CORS-enabled server is running and the /test endpoint is working!\n"
+    )
+
+
+async def preflight(request):
+    return web.Response()
+
+
+@web.middleware
+async def cors_middleware(request, handler):
+    try:
+        response = await handler(request)
+    except web.HTTPException as e:
+        e.headers.update(CORS_HEADERS)
+        raise
+    response.headers.update(CORS_HEADERS)
+    return response
+
+
+def create_app():
+    app = web.Application(middlewares=[cors_middleware])
+    app.router.add_get("/test", test_endpoint)
+    app.router.add_get("/test/", test_endpoint)
+    app.router.add_get("/videos/{path:.+}", serve_video)
+    app.router.add_route("OPTIONS", "/{path:.*}", preflight)
+    return app
 
-#!/usr/bin/env python3
 
-import http.server
-import socketserver
-import os  # Import os for changing directory
-
-PORT = 8008  # Make sure this matches the port in your shell script and frontend HTML
-
-# Set the directory to serve files from (where hls_stream is located)
-# This makes sure the simple_server behavior serves from the correct place
-# You might need to adjust this path if your script runs from elsewhere
-WEB_ROOT = os.path.dirname(
-    os.path.abspath(__file__)
-)  # Assumes script is in the web root
-
-
-class CORSRequestHandler(http.server.SimpleHTTPRequestHandler):
-    def end_headers(self):
-        # Add CORS headers to ALL responses
-        self.send_header(
-            "Access-Control-Allow-Origin", "*"
-        )  # Allows requests from any origin
-        self.send_header("Access-Control-Allow-Methods", "GET")  # Allows GET requests
-        self.send_header(
-            "Access-Control-Allow-Headers", "X-Requested-With, Content-Type"
-        )  # Allows specific headers
-        # Call the parent class's end_headers LAST
-        super().end_headers()
-
-    def do_GET(self):
-        # Handle the specific /test endpoint
-        if self.path == "/test" or self.path == "/test/":
-            self.send_response(200)  # OK status
-            self.send_header("Content-type", "text/plain")  # Plain text response
-            self.end_headers()  # Send headers (including CORS from end_headers)
-
-            # Write the response body
-            message = (
-                "CORS-enabled server is running and the /test endpoint is working!\n"
-            )
-            self.wfile.write(message.encode("utf-8"))
-            return  # Stop processing this request
-
-        # For any other path, fall back to the default file serving behavior
-        # This will serve files from the WEB_ROOT directory set below
-        super().do_GET()
-
-
-# Change the current directory to the web root so SimpleHTTPRequestHandler serves from there
-os.chdir(WEB_ROOT)
-
-# Set up the server
-# The "" address means bind to all available network interfaces (0.0.0.0 and ::)
-with socketserver.TCPServer(("", PORT), CORSRequestHandler) as httpd:
-    print(f"Serving HTTP with CORS from '{WEB_ROOT}' on port {PORT}")
-    # Correctly configure TCPServer to allow address reuse, preventing "Address already in use" errors
-    # This is often needed when restarting servers quickly
-    socketserver.TCPServer.allow_reuse_address = True
-    httpd.serve_forever()
+if __name__ == "__main__":
+    VIDEOS_DIR.mkdir(exist_ok=True)
+    print(f"Serving HTTP with CORS from '{VIDEOS_DIR}' on port {PORT}")
+    web.run_app(create_app(), port=PORT, reuse_address=True)
@@ -35,7 +35,15 @@ const VideoPlayer = ({ src }) => {
 
     if (videoRef.current) {
       if (Hls.isSupported()) {
-        hls = new Hls();
+        // Stay close to the live edge of the low-latency stream: sync one
+        // segment behind it and speed up slightly when playback falls behind
+        hls = new Hls({
+          lowLatencyMode: true,
+          liveSyncDurationCount: 1,
+          liveMaxLatencyDurationCount: 4,
+          maxLiveSyncPlaybackRate: 1.5,
+          backBufferLength: 30,
+        });
 
         // catch Hls.js errors
         hls.on(Hls.Events.ERROR, (_event, data) => {
@@ -350,6 +350,7 @@ export default function InterfacePage({
       },
       data: {
         command: "start",
+        latency_mode: "low",
       },
     };
 
@@ -357,45 +358,75 @@ export default function InterfacePage({
       // Send the request and wait for the response
       const response = await axios.request(config);
       console.log(response);
+      if (!response.data.success) {
+        // e.g. every recording slot is taken; don't run tests off the recording
+        throw new Error(response.data.message);
+      }
       return response.data; // Return the API response data
     } catch (error) {
       console.error("Error fetching test data:", error);
       throw error; // Propagate the error for further handling if needed
     }
   };
+
+  const stopFfmpeg = async (sessionId) => {
+    let config = {
+      method: "post",
+      maxBodyLength: Infinity,
+      url: "http://64.23.190.48:3001/test-interaction",
+      headers: {
+        "Content-Type": "application/json",
+      },
+      data: {
+        command: "stop",
+        session_id: sessionId,
+      },
+    };
+
+    try {
+      await axios.request(config);
+    } catch (error) {
+      // The server also stops sessions left running too long
+      console.error("Error stopping the recording:", error);
+    }
+  };
+
   async function triggerFullTest() {
     const processedInteractions = processInteractions(data);
     setRenaming(null);
     setResults({});
-    const res = await fetchFfmpeg();
-    const sessionId = res.session_id.slice(0, 8);
-    setVideo(
-      `http://64.23.190.48:8008/videos/session_${sessionId}/recording.mp4/stream.m3u8`
-    );
-    console.log(
-      `http://64.23.190.48:8008/videos/session_${sessionId}/recording.mp4/stream.m3u8`
-    );
-    for (const interaction of processedInteractions) {
-      setLoadingCurrNode(interaction.id);
-      await runInteraction(interaction);
+    try {
+      const res = await fetchFfmpeg();
+      setVideo(`http://64.23.190.48:8008/${res.stream_path}`);
+      console.log(`http://64.23.190.48:8008/${res.stream_path}`);
+      try {
+        for (const interaction of processedInteractions) {
+          setLoadingCurrNode(interaction.id);
+          await runInteraction({ ...interaction, session_id: res.session_id });
+        }
+      } finally {
+        await stopFfmpeg(res.session_id);
+      }
+    } finally {
+      setLoadingCurrNode(null);
     }
-
-    setLoadingCurrNode(null);
   }
 
   async function triggerTest(id) {
     setLoadingCurrNode(id);
     const interaction = processSingleInteraction(data, id);
-    const res = await fetchFfmpeg();
-    const sessionId = res.session_id.slice(0, 8);
-    setNestedVideo(
-      `http://64.23.190.48:8008/videos/session_${sessionId}/recording.mp4/stream.m3u8`
-    );
-    console.log(
-      `http://64.23.190.48:8008/videos/session_${sessionId}/recording.mp4/stream.m3u8`
-    );
-    await runInteraction(interaction);
-    setLoadingCurrNode(null);
+    try {
+      const res = await fetchFfmpeg();
+      setNestedVideo(`http://64.23.190.48:8008/${res.stream_path}`);
+      console.log(`http://64.23.190.48:8008/${res.stream_path}`);
+      try {
+        await runInteraction({ ...interaction, session_id: res.session_id });
+      } finally {
+        await stopFfmpeg(res.session_id);
+      }
+    } finally {
+      setLoadingCurrNode(null);
+    }
   }
 
   return (